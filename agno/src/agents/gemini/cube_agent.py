@@ -1,13 +1,49 @@
 # cube_agent.py
+from typing import Optional
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from agno.tools.mcp import MCPTools
 from textwrap import dedent
 from mcp.client.session import ClientSession
 
-async def create_cube_agent(session: ClientSession) -> Agent:
+
+METADATA_FROM_TOOL = dedent("""\
+    Retrieve Metadata:
+        Action: Call the describe_data tool.
+        Result: Gather metadata about available dimensions and measures.
+                This metadata will include information such as:
+                - Dimensions (e.g., country, city, categoryname, year)
+                - Measures (e.g., totalRevenue, netRevenue, profit, orderCount)
+        Purpose: Use the metadata to verify the available fields and to ensure that you use
+                the correct names in the data query.
+""")
+
+METADATA_FROM_CONTEXT = dedent("""\
+    Retrieve Metadata:
+        Action: Read the data description provided in the additional context below.
+        Result: It lists the available dimensions and measures, such as:
+                - Dimensions (e.g., country, city, categoryname, year)
+                - Measures (e.g., totalRevenue, netRevenue, profit, orderCount)
+        Purpose: Use the metadata to verify the available fields and to ensure that you use
+                the correct names in the data query. Only call the describe_data tool if a
+                field you need is missing from the provided description.
+""")
+
+
+async def create_mcp_tools(session: ClientSession) -> MCPTools:
+    """List the MCP server's tools once so they can be shared between agents."""
     mcp_tools = MCPTools(session=session)
     await mcp_tools.initialize()
+    return mcp_tools
+
+
+def build_cube_agent(mcp_tools: MCPTools, data_description: Optional[str] = None) -> Agent:
+    """Build the agent around already initialized MCP tools.
+
+    When `data_description` is given the agent is grounded with it up front
+    instead of calling describe_data before every query.
+    """
+    metadata_step = METADATA_FROM_CONTEXT if data_description else METADATA_FROM_TOOL
 
     return Agent(
         model=OpenAIChat(id="gpt-4o"),
@@ -26,20 +62,14 @@ async def create_cube_agent(session: ClientSession) -> Agent:
                 Action: On receiving a user query, first repeat the query to ensure accuracy.
                 Purpose: This confirms the user's request and provides a context for the upcoming steps.
 
-            Retrieve Metadata:
-                Action: Call the describe_data tool.
-                Result: Gather metadata about available dimensions and measures.
-                        This metadata will include information such as:
-                        - Dimensions (e.g., country, city, categoryname, year)
-                        - Measures (e.g., totalRevenue, netRevenue, profit, orderCount)
-                Purpose: Use the metadata to verify the available fields and to ensure that you use
-                        the correct names in the data query.
-
+            {metadata_step}
             Analyze Metadata and Determine Query Elements:
                 Action: Inspect the retrieved metadata carefully.
                 Guidelines:
                     - Identify the correct dimensions and measures related to the user query.
                     - Use the dimension and measure names exactly as listed in the metadata.
+                    - Before filtering on a value (e.g. a country or a product color), call the
+                      search_dimension_values tool to find the exact value the data contains.
                 Purpose: Construct an accurate and specific query to obtain the desired information.
 
             Construct and Execute Data Query:
@@ -58,7 +88,13 @@ async def create_cube_agent(session: ClientSession) -> Agent:
                 Metadata Analysis: Briefly describe how the metadata guided the selection of fields.
                 Data Insights: Summarize any notable results or trends evident from the data.
                 Purpose: Enhance comprehension by clarifying how the answer was derived.
-        """),
+        """).format(metadata_step=metadata_step),
+        additional_context=data_description,
         markdown=True,
         show_tool_calls=True,
     )
+
+
+async def create_cube_agent(session: ClientSession, data_description: Optional[str] = None) -> Agent:
+    mcp_tools = await create_mcp_tools(session)
+    return build_cube_agent(mcp_tools, data_description)
@@ -1,15 +1,13 @@
 # app/main.py
 import os
-import asyncio
 import logging
 import datetime
 import streamlit as st
 from dotenv import load_dotenv
 
-# Import your custom MCP streaming client and agent creator
-from mcp.client.sse import sse_client
-from mcp import ClientSession  
-from agents.gemini.cube_agent import create_cube_agent
+# Import the shared MCP session pool and agent builder
+from mcp_session_pool import MCPSessionPool
+from agents.gemini.cube_agent import build_cube_agent
 
 load_dotenv()
 
@@ -36,6 +34,19 @@ else:
 
 mcp_cube_server="http://mcp-server:9000/sse"
 
+
+@st.cache_resource
+def get_session_pool() -> MCPSessionPool:
+    """One MCP session pool per Streamlit server, shared by all reruns and users."""
+    return MCPSessionPool(
+        mcp_cube_server,
+        size=int(os.getenv("MCP_POOL_SIZE", "4")),
+        healthcheck_interval=float(os.getenv("MCP_HEALTHCHECK_INTERVAL", "30")),
+    )
+
+
+session_pool = get_session_pool()
+
 st.set_page_config(page_title="KPI Agent", page_icon="📊")
 st.title("📊 The Vero AI-Agent")
 
@@ -110,9 +121,19 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
-async def run_query(query: str, placeholder) -> str:
+async def answer_query(pooled, query: str):
+    """Stream the agent's answer using a pooled MCP session and cached metadata."""
+    data_description = await session_pool.metadata.get(pooled.session)
+    agent = build_cube_agent(pooled.tools, data_description)
+    # Call the agent's method with streaming enabled.
+    response_stream = await agent.arun(query, stream=True)
+    async for chunk in response_stream:
+        if chunk.content:
+            yield chunk.content
+
+def run_query(query: str, placeholder) -> str:
     """
-    Runs the asynchronous agent query and streams the response.
+    Runs the agent query on the shared session pool and streams the response.
     
     Args:
         query (str): The user's query.
@@ -122,20 +143,14 @@ async def run_query(query: str, placeholder) -> str:
         The full response string.
     """
     try:
-        async with sse_client(mcp_cube_server) as streams:
-            async with ClientSession(streams[0], streams[1]) as session:
-                await session.initialize()
-                agent = await create_cube_agent(session)
-                # Call the agent's method with streaming enabled.
-                response_stream = await agent.arun(query, stream=True)
-                full_response = ""
-                # Stream each incoming chunk and update the placeholder.
-                async for chunk in response_stream:
-                    full_response += chunk.content
-                    placeholder.markdown(full_response + "▌")
-                # Final update once streaming is complete.
-                placeholder.markdown(full_response)
-                return full_response
+        full_response = ""
+        # Stream each incoming chunk and update the placeholder.
+        for content in session_pool.stream(answer_query, query):
+            full_response += content
+            placeholder.markdown(full_response + "▌")
+        # Final update once streaming is complete.
+        placeholder.markdown(full_response)
+        return full_response
 
     except Exception as e:
         logger.error("❌ MCP connection failed.", exc_info=True)
@@ -154,7 +169,7 @@ if prompt:
     # Process the assistant's response.
     with st.chat_message("assistant"):
         assistant_placeholder = st.empty()
-        response = asyncio.run(run_query(prompt, assistant_placeholder))
+        response = run_query(prompt, assistant_placeholder)
         st.session_state.messages.append({"role": "assistant", "content": response})
     
     # Immediately archive the conversation after the first assistant response,
@@ -0,0 +1,220 @@
+# mcp_session_pool.py
+"""Long-lived MCP session pool shared across Streamlit reruns.
+
+Streamlit re-executes the script for every interaction, and `asyncio.run`
+creates a fresh event loop each time, so MCP sessions opened inside a rerun
+cannot outlive it. The pool owns a background event loop thread instead; SSE
+connections, initialized `ClientSession`s and their listed MCP tools live on
+that loop and are reused by every rerun and every user of the app.
+
+The semantic model description is cached by the pool as well and only
+re-read when the server reports a new model version.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from pydantic import AnyUrl
+
+from agents.gemini.cube_agent import create_mcp_tools
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION_URI = "context://model_version"
+DATA_DESCRIPTION_URI = "context://data_description"
+
+
+class PooledSession:
+    """One SSE connection with an initialized ClientSession and its MCP tools.
+
+    The connection is held open by a dedicated task because the SSE client's
+    task group must be entered and exited from the same task.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session: Optional[ClientSession] = None
+        self.tools = None
+        self.last_checked = 0.0
+        self._closed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self, timeout: float) -> None:
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._hold(ready))
+        await asyncio.wait_for(ready, timeout)
+        self.last_checked = time.monotonic()
+
+    async def _hold(self, ready: asyncio.Future) -> None:
+        try:
+            async with sse_client(self.url) as streams:
+                async with ClientSession(streams[0], streams[1]) as session:
+                    await session.initialize()
+                    self.tools = await create_mcp_tools(session)
+                    self.session = session
+                    ready.set_result(None)
+                    await self._closed.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning("MCP session to %s dropped: %s", self.url, e)
+        finally:
+            self.session = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and not self._task.done()
+
+    async def is_healthy(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    async def close(self) -> None:
+        self._closed.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, 5)
+            except Exception:
+                self._task.cancel()
+
+
+class ModelMetadataCache:
+    """Data description of the semantic model, keyed by the server's model version."""
+
+    def __init__(self):
+        self.version: Optional[str] = None
+        self.description: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, session: ClientSession) -> str:
+        version = await _read_text(session, MODEL_VERSION_URI)
+        async with self._lock:
+            if self.description is None or version != self.version:
+                logger.info("Fetching data description for model version %s", version)
+                self.description = await _read_text(session, DATA_DESCRIPTION_URI)
+                self.version = version
+            return self.description
+
+
+async def _read_text(session: ClientSession, uri: str) -> str:
+    result = await session.read_resource(AnyUrl(uri))
+    return result.contents[0].text
+
+
+class MCPSessionPool:
+    """A bounded pool of health-checked MCP sessions running on a background loop.
+
+    Args:
+        url: SSE endpoint of the MCP server.
+        size: Maximum number of concurrently open sessions.
+        healthcheck_interval: Idle seconds after which a session is pinged
+            before it is handed out again.
+        timeout: Seconds allowed for connecting and for health-check pings.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        size: int = 4,
+        healthcheck_interval: float = 30.0,
+        timeout: float = 10.0,
+    ):
+        self.url = url
+        self.size = size
+        self.healthcheck_interval = healthcheck_interval
+        self.timeout = timeout
+        self.metadata = ModelMetadataCache()
+        self._idle: deque = deque()
+        self._slots = asyncio.Semaphore(size)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="mcp-session-pool", daemon=True
+        )
+        self._thread.start()
+
+    async def _acquire(self) -> PooledSession:
+        while self._idle:
+            pooled = self._idle.pop()
+            stale = time.monotonic() - pooled.last_checked > self.healthcheck_interval
+            if not pooled.alive or (stale and not await pooled.is_healthy(self.timeout)):
+                logger.info("Discarding unhealthy MCP session")
+                await pooled.close()
+                continue
+            return pooled
+
+        pooled = PooledSession(self.url)
+        await pooled.connect(self.timeout)
+        logger.info("Opened new MCP session to %s", self.url)
+        return pooled
+
+    @asynccontextmanager
+    async def checkout(self) -> AsyncIterator[PooledSession]:
+        """Borrow a session; it is returned to the pool unless the caller failed."""
+        async with self._slots:
+            pooled = await self._acquire()
+            try:
+                yield pooled
+            except BaseException:
+                await pooled.close()
+                raise
+            else:
+                self._idle.append(pooled)
+
+    def stream(self, agen_fn: Callable, *args) -> Iterator:
+        """Run `agen_fn(pooled_session, *args)` on the pool loop and yield its items.
+
+        This is a plain generator, so it can be consumed from the Streamlit
+        script thread while the MCP traffic stays on the pool's event loop.
+        """
+        items: queue.Queue = queue.Queue()
+        done = object()
+
+        async def _produce():
+            try:
+                async with self.checkout() as pooled:
+                    async for item in agen_fn(pooled, *args):
+                        items.put(item)
+            except BaseException as e:
+                items.put(_Failure(e))
+            finally:
+                items.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(_produce(), self._loop)
+        try:
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            future.cancel()
+
+    def close(self) -> None:
+        async def _close_all():
+            while self._idle:
+                await self._idle.pop().close()
+
+        asyncio.run_coroutine_threadsafe(_close_all(), self._loop).result(self.timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
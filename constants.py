@@ -1,3 +1,122 @@
+import os
+
 PIPELINE_NAME = "contoso"
 DATASET_NAME = "contoso_data"
 DESTINATION = "duckdb"
+
+# Local directory for derived artifacts such as the compiled model metadata
+CACHE_DIR = os.getenv(
+    "VERO_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+# Seconds between checks for new pipeline loads in the servers (0 disables hot reload)
+RELOAD_INTERVAL = float(os.getenv("VERO_RELOAD_INTERVAL", "5"))
+
+# Load every pipeline run into a new DuckDB snapshot file that readers switch to
+# once it is complete, so servers keep answering queries during loads
+DUCKDB_SNAPSHOTS = os.getenv("VERO_DUCKDB_SNAPSHOTS", "true").lower() in ("1", "true", "yes")
+SNAPSHOT_DIR = os.getenv(
+    "VERO_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+)
+# Seconds a superseded snapshot is kept for queries that still run on it
+SNAPSHOT_RETENTION = float(os.getenv("VERO_SNAPSHOT_RETENTION", "3600"))
+
+# Storage the servers query: "duckdb", "parquet" for a Hive-partitioned lake
+# exported after each load that any number of reader processes can share, or
+# "postgres" for the PostgreSQL warehouse bulk-loaded after each load
+STORAGE_BACKEND = os.getenv("VERO_STORAGE_BACKEND", "duckdb").lower()
+LAKE_DIR = os.getenv(
+    "VERO_LAKE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lake")
+)
+# Partition key per lake table as (column, transform); transform is "year" or "month"
+LAKE_PARTITIONS = {
+    "fact_sales": ("order_date", "year"),
+    "orders": ("order_date", "year"),
+}
+
+# PostgreSQL warehouse (libpq connection string; the password may also come
+# from PGPASSWORD) and the number of tables copied into it in parallel
+POSTGRES_URL = os.getenv("VERO_POSTGRES_URL", "postgresql://user@localhost:5432/vero-demo-db")
+WAREHOUSE_LOAD_WORKERS = int(os.getenv("VERO_WAREHOUSE_LOAD_WORKERS") or 4)
+
+# Post-load layout optimization: sort order of the fact tables (for DuckDB zone
+# maps) and low-cardinality string columns stored as ENUM
+OPTIMIZE_LAYOUT = os.getenv("VERO_OPTIMIZE_LAYOUT", "true").lower() in ("1", "true", "yes")
+LAYOUT_SORT_KEYS = {
+    "fact_sales": ["order_date", "store_key"],
+    "orders": ["order_date", "store_key"],
+}
+LAYOUT_ENUM_COLUMNS = {
+    "fact_sales": ["currency_code"],
+    "orders": ["currency_code"],
+    "dim_customer": ["gender", "continent", "country", "country_full", "state"],
+    "dim_product": ["color", "brand", "manufacturer", "category_name", "sub_category_name"],
+    "dim_store": ["country_code", "country_name", "status"],
+}
+# Columns with more distinct values than this stay VARCHAR
+ENUM_MAX_CARDINALITY = 1024
+
+# Data-quality checks after each load (see quality.py). With fail-fast a failed
+# check stops the pipeline before the load is published to readers.
+QUALITY_FAIL_FAST = os.getenv("VERO_QUALITY_FAIL_FAST", "false").lower() in ("1", "true", "yes")
+# Columns with a larger share of NULLs are reported as warnings
+QUALITY_MAX_NULL_RATE = float(os.getenv("VERO_QUALITY_MAX_NULL_RATE") or 0.5)
+# Text columns whose values must all cast to the given DuckDB type
+QUALITY_TYPE_CHECKS = {
+    "fact_sales": {"order_date": "DATE", "delivery_date": "DATE"},
+    "orders": {"order_date": "DATE", "delivery_date": "DATE"},
+    "dim_date": {"date": "DATE"},
+    "currencyexchange": {"date": "DATE"},
+    "dim_customer": {"birthday": "DATE"},
+    "dim_store": {"open_date": "DATE", "close_date": "DATE"},
+}
+
+# Most frequent values kept per dimension in the dimension value index
+VALUE_INDEX_MAX_VALUES = 10000
+
+# Admission control for semantic queries, checked against estimates from the
+# column statistics gathered after each load (0 disables a budget).
+# Queries over the group or scan budget are rejected; results over the row
+# budget are limited to it.
+MAX_QUERY_GROUPS = int(os.getenv("VERO_MAX_QUERY_GROUPS") or 100000)
+MAX_SCAN_ROWS = int(os.getenv("VERO_MAX_SCAN_ROWS") or 100000000)
+MAX_RESULT_ROWS = int(os.getenv("VERO_MAX_RESULT_ROWS") or 10000)
+
+# Equality filters on dimension tables estimated to keep at most this share of
+# their table also restrict the fact tables' foreign keys to the matching keys
+# (see semantics/semi_join.py; 0 disables the reduction)
+SEMI_JOIN_MAX_SELECTIVITY = float(os.getenv("VERO_SEMI_JOIN_MAX_SELECTIVITY") or 0.01)
+
+# Compiled SQL plans kept per semantic model, keyed by query shape (0 disables)
+PLAN_CACHE_SIZE = int(os.getenv("VERO_PLAN_CACHE_SIZE") or 512)
+
+# Arrow size of the query results the KPI explorer keeps for paging and exports,
+# and size of the export files it offers as browser downloads, which Streamlit
+# holds in memory; larger exports are run as query jobs
+RESULT_CACHE_MB = int(os.getenv("VERO_RESULT_CACHE_MB") or 256)
+EXPORT_DOWNLOAD_MB = int(os.getenv("VERO_EXPORT_DOWNLOAD_MB") or 200)
+
+# Asynchronous query jobs (see semantics/jobs.py): worker threads per server,
+# jobs waiting in its queue, and seconds finished jobs and their Parquet
+# results are kept. Jobs have their own group, scan and result row budgets
+# (0 disables a budget).
+JOB_DIR = os.getenv("VERO_JOB_DIR", os.path.join(CACHE_DIR, "jobs"))
+JOB_WORKERS = int(os.getenv("VERO_JOB_WORKERS") or 2)
+JOB_QUEUE_SIZE = int(os.getenv("VERO_JOB_QUEUE_SIZE") or 100)
+JOB_RETENTION = float(os.getenv("VERO_JOB_RETENTION") or 24 * 3600)
+JOB_MAX_GROUPS = int(os.getenv("VERO_JOB_MAX_GROUPS") or 10000000)
+JOB_MAX_SCAN_ROWS = int(os.getenv("VERO_JOB_MAX_SCAN_ROWS") or 10000000000)
+JOB_MAX_RESULT_ROWS = int(os.getenv("VERO_JOB_MAX_RESULT_ROWS") or 10000000)
+
+# Workload log of the servers' most frequent query requests (entries kept, 0
+# disables it) and its replay on every new runtime before it takes traffic:
+# at most WARMUP_QUERIES requests within a wall-clock and a CPU time budget
+WORKLOAD_LOG_SIZE = int(os.getenv("VERO_WORKLOAD_LOG_SIZE") or 200)
+WARMUP_QUERIES = int(os.getenv("VERO_WARMUP_QUERIES") or 20)
+WARMUP_SECONDS = float(os.getenv("VERO_WARMUP_SECONDS") or 30)
+WARMUP_CPU_SECONDS = float(os.getenv("VERO_WARMUP_CPU_SECONDS") or 60)
+
+# Currencies the amount measures can be converted to. After each load every
+# fact_sales row gets the rate from its currency_code to each of them on its
+# order date, looked up as of that date in currencyexchange.
+REPORTING_CURRENCIES = ["USD", "EUR", "GBP", "CAD", "AUD"]
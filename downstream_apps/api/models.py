@@ -1,7 +1,7 @@
 """Pydantic models for the FastAPI semantic layer API."""
 
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Literal
 
 
 class FilterCondition(BaseModel):
@@ -10,6 +10,15 @@ class FilterCondition(BaseModel):
     value: str = Field(..., description="Value to compare against")
 
 
+class TopNPer(BaseModel):
+    n: int = Field(..., ge=1, description="Rows to keep per group")
+    dimensions: List[str] = Field(..., description="Dimensions forming the groups")
+    measure: str = Field(..., description="Measure to rank the rows of a group by")
+    direction: Literal["asc", "desc"] = Field(
+        "desc", description="desc keeps the highest values, asc the lowest"
+    )
+
+
 class QueryRequest(BaseModel):
     measures: List[str] = Field(default_factory=list, description="Measure names")
     dimensions: List[str] = Field(default_factory=list, description="Dimension names")
@@ -18,8 +27,61 @@ class QueryRequest(BaseModel):
     )
     limit: Optional[int] = Field(500, description="Max rows to return")
     offset: Optional[int] = Field(0, description="Rows to skip")
+    currency: Optional[str] = Field(
+        None, description="Convert amount measures to this currency, e.g. USD or EUR"
+    )
+    top_n_per: Optional[TopNPer] = Field(
+        None, description="Keep only the top n rows per group, e.g. top 3 brands per continent"
+    )
+
+
+class JobRequest(QueryRequest):
+    limit: Optional[int] = Field(
+        None, description="Max rows of the result; by default all rows"
+    )
+    priority: int = Field(
+        5, ge=0, le=9, description="Jobs with a lower priority run first"
+    )
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    priority: int
+    progress: Optional[float] = Field(
+        None, description="Percentage completed of a running job, if known"
+    )
+    row_count: Optional[int] = None
+    size_bytes: Optional[int] = Field(None, description="Size of the Parquet result")
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = Field(
+        None, description="When the job and its result are removed"
+    )
+    notice: Optional[str] = Field(None, description="Set when the result was limited")
+    error: Optional[str] = None
+
+
+class JobResultResponse(BaseModel):
+    data: Any
+    offset: int
+    row_count: int
+    total_rows: int
 
 
 class JsonDataResponse(BaseModel):
     data: Any
     row_count: int
+    notice: Optional[str] = Field(None, description="Set when the result was limited")
+
+
+class DimensionValue(BaseModel):
+    value: str
+    count: int = Field(..., description="Rows with this value in the dimension's table")
+
+
+class DimensionValuesResponse(BaseModel):
+    dimension: str
+    values: List[DimensionValue]
+    distinct: int = Field(..., description="Number of distinct values of the dimension")
@@ -7,24 +7,48 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
 from constants import PIPELINE_NAME
-from semantics.model import create_semantic_model
+from semantics.reload import ReloadingRuntime
+from semantics.admission import QueryRejectedError
+from semantics.jobs import JobManager, JobNotFoundError, JobQueueFullError, read_result_range
 from semantics.query_builder import (
     QueryRequest as SemanticQueryRequest,
     FilterCondition as SemanticFilterCondition,
-    build_semantic_query,
+    TopNPer as SemanticTopNPer,
+)
+from downstream_apps.api.models import (
+    QueryRequest,
+    JobRequest,
+    JobResponse,
+    JobResultResponse,
+    JsonDataResponse,
+    DimensionValuesResponse,
 )
-from downstream_apps.api.models import QueryRequest, JsonDataResponse
 
-from fastapi import FastAPI
-import dlt
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import FileResponse
 import uvicorn
 
 
-app = FastAPI(title="Vero Semantic Layer API", version="0.1.0")
+# Load the cached model metadata; the model itself is compiled lazily and
+# replaced in the background after new pipeline loads
+semantic_runtime = ReloadingRuntime(PIPELINE_NAME)
+
+# Long-running queries submitted as jobs, with Parquet results on local disk
+job_manager = JobManager(semantic_runtime)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile the model and open DuckDB in the background so the worker
+    # accepts traffic immediately
+    semantic_runtime.start()
+    yield
+    job_manager.stop()
+    semantic_runtime.stop()
+
 
-# Initialize semantic model on startup
-pipeline = dlt.attach(pipeline_name=PIPELINE_NAME)
-semantic_model = create_semantic_model(pipeline)
+app = FastAPI(title="Vero Semantic Layer API", version="0.1.0", lifespan=lifespan)
 
 
 @app.get("/dimensions")
@@ -33,26 +57,43 @@ def get_dimensions():
     return {
         "dimensions": [
             {"name": name, "title": name.replace("_", " ").title()}
-            for name in semantic_model.dimensions
+            for name in semantic_runtime.current.dimensions
         ]
     }
 
 
+@app.get("/dimensions/{dimension}/values", response_model=DimensionValuesResponse)
+def get_dimension_values(
+    dimension: str,
+    q: str = Query("", description="Prefix or approximate spelling of the value"),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    """Search the distinct values of a dimension, most frequent first."""
+    index = semantic_runtime.current.value_index
+    if dimension not in index.dimensions:
+        raise HTTPException(status_code=404, detail=f"Unknown dimension: {dimension}")
+
+    matches = index.search(q, dimension=dimension, limit=limit)
+    return DimensionValuesResponse(
+        dimension=dimension,
+        values=[{"value": m["value"], "count": m["count"]} for m in matches],
+        distinct=index.dimensions[dimension].distinct,
+    )
+
+
 @app.get("/measures")
 def get_measures():
     """List all available measures."""
     return {
         "measures": [
             {"name": name, "title": name.replace("_", " ").title()}
-            for name in semantic_model.measures
+            for name in semantic_runtime.current.measures
         ]
     }
 
 
-@app.post("/query", response_model=JsonDataResponse)
-def execute_query(query: QueryRequest):
-    """Execute a semantic query and return results as JSON."""
-    semantic_query = SemanticQueryRequest(
+def _semantic_query(query: QueryRequest) -> SemanticQueryRequest:
+    return SemanticQueryRequest(
         measures=query.measures,
         dimensions=query.dimensions,
         filters=[
@@ -63,18 +104,112 @@ def execute_query(query: QueryRequest):
         ],
         limit=query.limit,
         offset=query.offset,
+        currency=query.currency,
+        top_n_per=SemanticTopNPer(**query.top_n_per.model_dump())
+        if query.top_n_per
+        else None,
     )
 
-    result = build_semantic_query(semantic_model, semantic_query)
-    df = result.execute()
 
-    if query.offset and query.offset > 0:
-        df = df.iloc[query.offset:]
-    if query.limit and query.limit > 0:
-        df = df.head(query.limit)
+@app.post("/query", response_model=JsonDataResponse)
+def execute_query(query: QueryRequest):
+    """Execute a semantic query and return results as JSON."""
+    semantic_query = _semantic_query(query)
+
+    runtime = semantic_runtime.current
+    try:
+        admission = runtime.admit(semantic_query)
+    except QueryRejectedError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    semantic_query = admission.query
+
+    try:
+        df = runtime.execute(semantic_query)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if semantic_query.offset and semantic_query.offset > 0:
+        df = df.iloc[semantic_query.offset:]
+    if semantic_query.limit and semantic_query.limit > 0:
+        df = df.head(semantic_query.limit)
 
     data = df.to_dict(orient="records")
-    return JsonDataResponse(data=data, row_count=len(data))
+    return JsonDataResponse(data=data, row_count=len(data), notice=admission.notice)
+
+
+
+def _job_response(job) -> JobResponse:
+    return JobResponse(**job.model_dump(exclude={"request", "pid", "generation"}))
+
+
+def _get_job(job_id: str):
+    try:
+        return job_manager.get(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+
+
+def _succeeded_job(job_id: str):
+    job = _get_job(job_id)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}")
+    return job
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+def submit_job(query: JobRequest):
+    """Queue a long-running query; poll /jobs/{id} for its status."""
+    try:
+        job = job_manager.submit(_semantic_query(query), priority=query.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return _job_response(job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str):
+    """Status and progress of a job."""
+    return _job_response(_get_job(job_id))
+
+
+@app.get("/jobs/{job_id}/result", response_model=JobResultResponse)
+def get_job_result(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=100000),
+):
+    """A range of the rows of a finished job's result."""
+    job = _succeeded_job(job_id)
+    rows = read_result_range(job_manager.result_path(job_id), offset, limit)
+    data = rows.to_pandas().to_dict(orient="records")
+    return JobResultResponse(
+        data=data, offset=offset, row_count=len(data), total_rows=job.row_count
+    )
+
+
+@app.get("/jobs/{job_id}/download")
+def download_job_result(job_id: str):
+    """The whole result of a finished job as a Parquet file."""
+    _succeeded_job(job_id)
+    return FileResponse(
+        job_manager.result_path(job_id),
+        media_type="application/vnd.apache.parquet",
+        filename=f"{job_id}.parquet",
+    )
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+def cancel_job(job_id: str, remove: bool = Query(False, description="Also delete the result")):
+    """Cancel a queued or running job, and with `remove` delete it and its result."""
+    try:
+        job = job_manager.cancel(job_id)
+        if remove:
+            job_manager.delete(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return _job_response(job)
 
 
 if __name__ == "__main__":
@@ -1,20 +1,40 @@
-"""Streamlit KPI Explorer for the BSL semantic model."""
+"""Streamlit KPI Explorer for the BSL semantic model.
+
+Query results are cached as Arrow tables in a cache shared by all sessions
+(see `semantics.result_cache`); sorting, paging and exports work on the cached
+result instead of running the query again. As results are paged, queries are
+admitted against the group, scan and result row budgets of query jobs rather
+than the interactive ones.
+"""
 
 import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from constants import PIPELINE_NAME
-from semantics.model import create_semantic_model
+from constants import (
+    EXPORT_DOWNLOAD_MB,
+    JOB_MAX_GROUPS,
+    JOB_MAX_RESULT_ROWS,
+    JOB_MAX_SCAN_ROWS,
+    PIPELINE_NAME,
+    REPORTING_CURRENCIES,
+)
+from semantics.reload import ReloadingRuntime
+from semantics.admission import QueryRejectedError
 from semantics.query_builder import (
     QueryRequest,
     FilterCondition,
-    build_semantic_query,
+)
+from semantics.result_cache import (
+    ResultCache,
+    export_result,
+    request_key,
+    result_page,
+    sort_result,
 )
 
 import streamlit as st
-import dlt
 
 
 st.set_page_config(page_title="Vero KPI Explorer", layout="wide")
@@ -22,15 +42,22 @@ st.title("Vero KPI Explorer")
 
 
 @st.cache_resource
-def get_semantic_model():
-    pipeline = dlt.attach(pipeline_name=PIPELINE_NAME)
-    return create_semantic_model(pipeline)
+def get_semantic_runtime():
+    runtime = ReloadingRuntime(PIPELINE_NAME)
+    runtime.start()
+    return runtime
 
 
-semantic_model = get_semantic_model()
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
 
-dim_names = list(semantic_model.dimensions)
-measure_names = list(semantic_model.measures)
+# Pin the current model for this rerun; reloads only affect later reruns
+semantic_runtime = get_semantic_runtime().current
+
+dim_names = list(semantic_runtime.dimensions)
+measure_names = list(semantic_runtime.measures)
 
 # Sidebar: dimension and measure selection
 st.sidebar.header("Query Builder")
@@ -65,42 +92,120 @@ for i in range(int(num_filters)):
             key=f"filter_op_{i}",
         )
     with col3:
-        value = st.text_input(f"Value {i+1}", key=f"filter_value_{i}")
+        values = semantic_runtime.value_index.dimensions.get(field)
+        if op in ("=", "!=") and values is not None and not values.truncated:
+            # The selectbox filters the indexed values as the user types
+            counts = dict(zip(values.values, values.counts))
+            value = st.selectbox(
+                f"Value {i+1}",
+                options=values.values,
+                index=None,
+                format_func=lambda v, counts=counts: f"{v} ({counts[v]})",
+                key=f"filter_value_{i}",
+            )
+        else:
+            value = st.text_input(f"Value {i+1}", key=f"filter_value_{i}")
     if field and value:
         filters.append(FilterCondition(field=field, operator=op, value=value))
 
-limit = st.sidebar.number_input("Limit", min_value=1, max_value=10000, value=500)
+currency = st.sidebar.selectbox(
+    "Currency",
+    options=REPORTING_CURRENCIES,
+    index=None,
+    placeholder="Order currency",
+    help="Convert revenue, cost and profit at the rate on the order date",
+)
+
+limit = st.sidebar.number_input(
+    "Limit", min_value=1, max_value=JOB_MAX_RESULT_ROWS or None, value=500
+)
 
-# Execute query
+# The last query run stays in the session, so paging and sorting reruns show it again
 if st.sidebar.button("Run Query", type="primary"):
     if not selected_measures and not selected_dims:
         st.warning("Please select at least one dimension or measure.")
+        st.session_state.pop("query_request", None)
     else:
-        query_request = QueryRequest(
+        st.session_state["query_request"] = QueryRequest(
             measures=selected_measures,
             dimensions=selected_dims,
             filters=filters,
             limit=limit,
+            currency=currency,
+        )
+        st.session_state["page"] = 1
+
+query_request = st.session_state.get("query_request")
+if query_request is not None:
+    try:
+        admission = semantic_runtime.admit(
+            query_request,
+            max_groups=JOB_MAX_GROUPS,
+            max_scan_rows=JOB_MAX_SCAN_ROWS,
+            max_result_rows=JOB_MAX_RESULT_ROWS,
+        )
+    except QueryRejectedError as e:
+        st.error(str(e))
+        st.stop()
+
+    with st.spinner("Executing query..."):
+        result = get_result_cache().get(
+            semantic_runtime.generation,
+            admission.query,
+            lambda: semantic_runtime.execute_arrow(admission.query),
         )
 
-        with st.spinner("Executing query..."):
-            result = build_semantic_query(semantic_model, query_request)
-            df = result.execute()
-
-            if limit:
-                df = df.head(limit)
-
-        st.success(f"Query returned {len(df)} rows")
-        st.dataframe(df, use_container_width=True)
+    if admission.notice:
+        st.warning(admission.notice)
+    st.success(f"Query returned {result.num_rows:,} rows")
 
-        # Download button
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="Download CSV",
-            data=csv,
-            file_name="query_results.csv",
-            mime="text/csv",
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort_column = st.selectbox(
+            "Sort by", options=result.column_names, index=None, placeholder="Query order"
+        )
+    with col2:
+        descending = st.toggle("Descending", value=True)
+    with col3:
+        page_size = st.selectbox("Rows per page", options=[50, 100, 500, 1000], index=1)
+
+    pages = max(1, -(-result.num_rows // page_size))
+    if st.session_state.get("page", 1) > pages:
+        st.session_state["page"] = pages
+    page = st.number_input("Page", min_value=1, max_value=pages, key="page")
+
+    # Only the rows of the page are converted to pandas and sent to the browser
+    rows = result_page(sort_result(result, sort_column, descending), page, page_size)
+    st.dataframe(rows.to_pandas(), use_container_width=True, hide_index=True)
+    first = (page - 1) * page_size
+    st.caption(f"Rows {first + 1:,}–{first + rows.num_rows:,} of {result.num_rows:,}")
+
+    # DuckDB writes the export file from the cached result
+    export_format = st.radio("Export format", options=["csv", "parquet"], horizontal=True)
+    if st.button("Prepare export"):
+        path = export_result(
+            result,
+            f"{semantic_runtime.generation}|{request_key(admission.query)}",
+            export_format,
+            order_by=sort_column,
+            descending=descending,
         )
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        if size_mb > EXPORT_DOWNLOAD_MB:
+            # Streamlit reads the whole download into memory
+            st.warning(
+                f"The export is {size_mb:,.0f} MB, more than the {EXPORT_DOWNLOAD_MB:,} MB "
+                "offered as downloads here. Submit the query as a job to the API "
+                "(POST /jobs) and download its result from /jobs/{id}/download."
+            )
+        else:
+            with open(path, "rb") as export_file:
+                st.download_button(
+                    label=f"Download {export_format.upper()}",
+                    data=export_file,
+                    file_name=f"query_results.{export_format}",
+                    mime="text/csv" if export_format == "csv" else "application/octet-stream",
+                )
 else:
     st.info("Configure your query in the sidebar and click 'Run Query'.")
 
@@ -0,0 +1,208 @@
+"""Post-load physical layout optimization of the loaded DuckDB database.
+
+dlt writes the tables in the order of the CSV files, with every string column
+as VARCHAR. After a load, this stage
+  - re-sorts the fact tables by `LAYOUT_SORT_KEYS`, so the min/max zone maps
+    of DuckDB's row groups let filters on those columns skip most of a table;
+  - converts the low-cardinality columns in `LAYOUT_ENUM_COLUMNS` to ENUM
+    types, which store a small integer per row instead of the string.
+
+Tables are rewritten in place with `CREATE OR REPLACE TABLE ... AS SELECT`,
+so this runs on the freshly loaded database before it is published to readers.
+A report compares the storage size and the timings of a few typical group-by
+and filter queries before and after the rewrite.
+
+Usage (needs write access, i.e. no reader may have the file open):
+    python layout.py                      # optimize the pipeline's database
+    python layout.py -d path/to/db.duckdb
+"""
+
+from constants import (
+    PIPELINE_NAME,
+    DATASET_NAME,
+    LAYOUT_SORT_KEYS,
+    LAYOUT_ENUM_COLUMNS,
+    ENUM_MAX_CARDINALITY,
+)
+from datetime import date
+from pydantic import BaseModel
+from typing import Dict, List
+import argparse
+import statistics
+import time
+import duckdb
+
+
+# Typical dashboard queries on the fact table, timed before and after
+BENCHMARK_QUERIES = {
+    "group by currency_code": (
+        "SELECT currency_code, SUM(net_price) FROM {ds}.fact_sales GROUP BY 1"
+    ),
+    "group by continent (join)": (
+        "SELECT c.continent, SUM(f.net_price) FROM {ds}.fact_sales f "
+        "JOIN {ds}.dim_customer c ON f.customer_key = c.customer_key GROUP BY 1"
+    ),
+    "filter order_date (one month)": (
+        "SELECT SUM(quantity) FROM {ds}.fact_sales "
+        "WHERE order_date >= '{month_start}' AND order_date < '{month_end}'"
+    ),
+    "filter store_key": (
+        "SELECT COUNT(*), SUM(net_price) FROM {ds}.fact_sales WHERE store_key = {store_key}"
+    ),
+}
+
+
+class LayoutStats(BaseModel):
+    size_bytes: int
+    timings: Dict[str, float]
+
+
+class LayoutReport(BaseModel):
+    actions: List[str]
+    before: LayoutStats
+    after: LayoutStats
+
+    def format(self) -> str:
+        lines = ["Layout optimization:"]
+        lines += [f"  - {action}" for action in self.actions]
+        lines.append(
+            f"  storage: {self.before.size_bytes / 2**20:.1f} MiB -> "
+            f"{self.after.size_bytes / 2**20:.1f} MiB"
+        )
+        for name, before in self.before.timings.items():
+            after = self.after.timings[name]
+            speedup = before / after if after else float("inf")
+            lines.append(
+                f"  {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms "
+                f"({speedup:.1f}x)"
+            )
+        return "\n".join(lines)
+
+
+def _columns(connection: duckdb.DuckDBPyConnection, dataset_name: str, table_name: str) -> Dict[str, str]:
+    rows = connection.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = ? AND table_name = ?",
+        [dataset_name, table_name],
+    ).fetchall()
+    return dict(rows)
+
+
+def _database_size(connection: duckdb.DuckDBPyConnection) -> int:
+    connection.execute("CHECKPOINT")
+    block_size, used_blocks = connection.execute(
+        "SELECT block_size, used_blocks FROM pragma_database_size()"
+    ).fetchone()
+    return block_size * used_blocks
+
+
+def measure_layout(
+    connection: duckdb.DuckDBPyConnection,
+    dataset_name: str = DATASET_NAME,
+    repeat: int = 5,
+) -> LayoutStats:
+    """Storage size and median benchmark query timings of the database."""
+    ds = f'"{dataset_name}"'
+    last_order, store_key = connection.execute(
+        f"SELECT MAX(order_date), MIN(store_key) FROM {ds}.fact_sales"
+    ).fetchone()
+    month_start = date.fromisoformat(str(last_order)[:7] + "-01")
+    month_end = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+    params = dict(ds=ds, month_start=month_start, month_end=month_end, store_key=store_key)
+
+    timings = {}
+    for name, template in BENCHMARK_QUERIES.items():
+        sql = template.format(**params)
+        connection.execute(sql).fetchall()  # warm up
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            connection.execute(sql).fetchall()
+            samples.append(time.perf_counter() - start)
+        timings[name] = statistics.median(samples)
+
+    return LayoutStats(size_bytes=_database_size(connection), timings=timings)
+
+
+def optimize_layout(
+    connection: duckdb.DuckDBPyConnection,
+    dataset_name: str = DATASET_NAME,
+    sort_keys: Dict[str, List[str]] = LAYOUT_SORT_KEYS,
+    enum_columns: Dict[str, List[str]] = LAYOUT_ENUM_COLUMNS,
+    max_cardinality: int = ENUM_MAX_CARDINALITY,
+) -> List[str]:
+    """Rewrite the tables sorted and with ENUM columns; return what was done."""
+    actions = []
+    for table_name in sorted(set(sort_keys) | set(enum_columns)):
+        columns = _columns(connection, dataset_name, table_name)
+        if not columns:
+            continue
+        source = f'"{dataset_name}"."{table_name}"'
+
+        replacements = []
+        for column in enum_columns.get(table_name, []):
+            if columns.get(column) != "VARCHAR":
+                # Missing, or already converted by an earlier run
+                continue
+            (cardinality,) = connection.execute(
+                f'SELECT COUNT(DISTINCT "{column}") FROM {source}'
+            ).fetchone()
+            if cardinality > max_cardinality:
+                actions.append(
+                    f"{table_name}.{column}: kept VARCHAR ({cardinality} distinct values)"
+                )
+                continue
+
+            enum_type = f'"{dataset_name}"."{table_name}__{column}"'
+            connection.execute(f"DROP TYPE IF EXISTS {enum_type}")
+            connection.execute(
+                f'CREATE TYPE {enum_type} AS ENUM (SELECT DISTINCT "{column}" '
+                f'FROM {source} WHERE "{column}" IS NOT NULL ORDER BY 1)'
+            )
+            replacements.append(f'CAST("{column}" AS {enum_type}) AS "{column}"')
+            actions.append(f"{table_name}.{column}: ENUM ({cardinality} values)")
+
+        keys = [key for key in sort_keys.get(table_name, []) if key in columns]
+        if not replacements and not keys:
+            continue
+
+        select = "*"
+        if replacements:
+            select = f"* REPLACE ({', '.join(replacements)})"
+        order_by = ""
+        if keys:
+            order_by = " ORDER BY " + ", ".join(f'"{key}"' for key in keys)
+            actions.append(f"{table_name}: sorted by {', '.join(keys)}")
+
+        connection.execute(
+            f"CREATE OR REPLACE TABLE {source} AS SELECT {select} FROM {source}{order_by}"
+        )
+
+    return actions
+
+
+def optimize_database(database: str, dataset_name: str = DATASET_NAME) -> LayoutReport:
+    """Optimize a DuckDB database file in place and report the effect."""
+    with duckdb.connect(database) as connection:
+        before = measure_layout(connection, dataset_name)
+        actions = optimize_layout(connection, dataset_name)
+        after = measure_layout(connection, dataset_name)
+    return LayoutReport(actions=actions, before=before, after=after)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-d", "--database", required=False, type=str)
+    args = parser.parse_args()
+
+    database = args.database
+    if database is None:
+        import dlt
+        from semantics.execution import staging_database
+
+        database = staging_database(
+            dlt.attach(pipeline_name=args.pipeline if args.pipeline else PIPELINE_NAME)
+        )
+
+    print(optimize_database(database).format())
@@ -28,12 +28,42 @@ def main():
         default=None,
         help="dlt pipeline name to attach to",
     )
+    parser.add_argument(
+        "--max_workers",
+        required=False,
+        type=int,
+        default=None,
+        help="Size of the query worker pool (defaults to the number of cores)",
+    )
+    parser.add_argument(
+        "--session_concurrency",
+        required=False,
+        type=int,
+        default=None,
+        help="Maximum number of queries a single MCP session can run at once",
+    )
+    parser.add_argument(
+        "--query_timeout",
+        required=False,
+        type=float,
+        default=None,
+        help="Seconds after which a running query is interrupted (0 disables)",
+    )
 
     dotenv.load_dotenv()
 
     args, _ = parser.parse_known_args()
 
     pipeline_name = args.pipeline_name or os.getenv("PIPELINE_NAME", "contoso")
+    max_workers = args.max_workers or int(os.getenv("MCP_MAX_WORKERS") or 0) or None
+    session_concurrency = args.session_concurrency or int(
+        os.getenv("MCP_SESSION_CONCURRENCY") or 2
+    )
+    query_timeout = (
+        args.query_timeout
+        if args.query_timeout is not None
+        else float(os.getenv("MCP_QUERY_TIMEOUT") or 60)
+    )
 
     logger = logging.getLogger(__name__)
     logger.propagate = False
@@ -52,7 +82,13 @@ def main():
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
 
-    server.main(pipeline_name=pipeline_name, logger=logger)
+    server.main(
+        pipeline_name=pipeline_name,
+        logger=logger,
+        max_workers=max_workers,
+        session_concurrency=session_concurrency,
+        query_timeout=query_timeout or None,
+    )
 
 
 __all__ = ["main", "server"]
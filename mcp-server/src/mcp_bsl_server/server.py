@@ -1,34 +1,86 @@
 """BSL MCP Server — replaces the Cube.js REST API with direct BSL semantic queries."""
 
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal, Optional, Union
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
 from mcp.types import TextContent, EmbeddedResource, TextResourceContents
 from pydantic import BaseModel, Field
+import asyncio
 import json
 import logging
+import os
+import threading
 import uuid
+import weakref
 import yaml
 
 from constants import PIPELINE_NAME
-from semantics.model import create_semantic_model
+from semantics.reload import ReloadingRuntime
 from semantics.query_builder import (
     QueryRequest,
     TimeDimension,
     FilterCondition,
-    build_semantic_query,
+    TopNPer,
 )
-import dlt
+from semantics.execution import QueryInterruptedError
+from semantics.jobs import JobManager, JobNotFoundError, read_result_range
+
+# Seconds between progress notifications sent while a query is running
+PROGRESS_INTERVAL = 1.0
+# Seconds a timed out query may take to unwind before read_data returns anyway
+INTERRUPT_GRACE_PERIOD = 5.0
 
 
 def data_to_yaml(data) -> str:
     return yaml.dump(data, indent=2, sort_keys=False)
 
 
+class QueryHandle:
+    """The running query of a read_data call, registered by its worker thread.
+
+    Starting a query may wait for the model to compile and opens the database
+    connection, so it happens on the worker; the event loop only reports
+    progress and interrupts through the handle. The query closes itself once
+    it finished or failed.
+    """
+
+    def __init__(self):
+        self.running = None
+        self._interrupted = False
+        self._lock = threading.Lock()
+
+    def start(self, runtime):
+        running = runtime.executor.start()
+        with self._lock:
+            self.running = running
+            if self._interrupted:
+                # Timed out before it started; execute raises right away
+                running.interrupt()
+        return running
+
+    def progress(self) -> Optional[float]:
+        running = self.running
+        return running.progress() if running is not None else None
+
+    def interrupt(self) -> None:
+        with self._lock:
+            self._interrupted = True
+            if self.running is not None:
+                self.running.interrupt()
+
+
 class Query(BaseModel):
     """Query model matching the interface the Agno agent already uses."""
 
-    measures: list[str] = Field([], description="Names of measures to query")
+    measures: list[str] = Field(
+        [],
+        description=(
+            "Names of measures to query; time-intelligence measures like "
+            "netRevenueYoY or netRevenue3MonthAvg need year, yearquarter or "
+            "yearmonth among the dimensions"
+        ),
+    )
     dimensions: list[str] = Field([], description="Names of dimensions to group by")
     timeDimensions: list[TimeDimension] = Field(
         [], description="Time dimensions to group by"
@@ -39,28 +91,78 @@ class Query(BaseModel):
     order: dict[str, Literal["asc", "desc"]] = Field(
         {}, description="Ordering of results"
     )
+    currency: Optional[str] = Field(
+        None,
+        description="Convert amount measures (revenue, cost, profit) to this currency, e.g. USD or EUR",
+    )
+    top_n_per: Optional[TopNPer] = Field(
+        None,
+        description=(
+            "Return only the top n rows per group instead of the whole aggregate, "
+            "e.g. the most popular color per country: n=1, dimensions=['country'], "
+            "measure='totalUnitsSold' with dimensions country and color"
+        ),
+    )
 
 
-def main(pipeline_name: str, logger: logging.Logger):
+def main(
+    pipeline_name: str,
+    logger: logging.Logger,
+    max_workers: Optional[int] = None,
+    session_concurrency: int = 2,
+    query_timeout: Optional[float] = 60.0,
+):
     logger.info("Starting BSL MCP server initialization")
     mcp = FastMCP("Vero")
     logger.info("FastMCP instance created")
 
-    # Attach to the existing dlt pipeline and build semantic model
-    logger.info("Attaching to dlt pipeline: %s", pipeline_name)
-    pipeline = dlt.attach(pipeline_name=pipeline_name)
-    semantic_model = create_semantic_model(pipeline)
-    logger.info("Semantic model created successfully")
+    # Load the cached model metadata; the model is compiled in the background
+    # and replaced after new pipeline loads
+    logger.info("Loading semantic model for dlt pipeline: %s", pipeline_name)
+    semantic_runtime = ReloadingRuntime(pipeline_name)
+    semantic_runtime.start()
+    logger.info("Semantic model metadata loaded successfully")
+
+    # Queries too slow for read_data run as jobs with Parquet results
+    job_manager = JobManager(semantic_runtime)
+
+    # Queries and result serialization run on a bounded worker pool so a heavy
+    # query never blocks the event loop serving the other SSE sessions.
+    max_workers = max_workers or os.cpu_count() or 1
+    worker_pool = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="read_data"
+    )
+    session_limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+    logger.info(
+        "Query workers: %d, per-session concurrency: %d, timeout: %s",
+        max_workers,
+        session_concurrency,
+        f"{query_timeout}s" if query_timeout else "none",
+    )
 
-    # Extract metadata for describe_data
-    dim_names = list(semantic_model.dimensions) if hasattr(semantic_model, "dimensions") else []
-    measure_names = list(semantic_model.measures) if hasattr(semantic_model, "measures") else []
-    logger.info("Model has %d dimensions and %d measures", len(dim_names), len(measure_names))
+    def _session_limit(ctx: Context) -> asyncio.Semaphore:
+        limit = session_limits.get(ctx.session)
+        if limit is None:
+            limit = session_limits[ctx.session] = asyncio.Semaphore(session_concurrency)
+        return limit
+
+    logger.info(
+        "Model has %d dimensions and %d measures",
+        len(semantic_runtime.current.dimensions),
+        len(semantic_runtime.current.measures),
+    )
+
+    @mcp.resource("context://model_version")
+    def model_version_resource() -> str:
+        """Version of the semantic model; changes whenever its metadata changes."""
+        # Clients cache the data description and only re-read it when this changes
+        return semantic_runtime.current.version
 
     @mcp.resource("context://data_description")
     def data_description() -> str:
         """Describe the data available in the semantic model."""
         logger.info("Resource 'context://data_description' called")
+        runtime = semantic_runtime.current
 
         description = [
             {
@@ -69,11 +171,11 @@ def main(pipeline_name: str, logger: logging.Logger):
                 "description": "Unified semantic model for Contoso retail sales data with customers, products, stores, and dates.",
                 "dimensions": [
                     {"name": name, "title": name.replace("_", " ").title()}
-                    for name in dim_names
+                    for name in runtime.dimensions
                 ],
                 "measures": [
                     {"name": name, "title": name.replace("_", " ").title()}
-                    for name in measure_names
+                    for name in runtime.measures
                 ],
             }
         ]
@@ -86,56 +188,137 @@ def main(pipeline_name: str, logger: logging.Logger):
         )
 
     @mcp.tool("describe_data")
-    def describe_data() -> str:
+    async def describe_data() -> str:
         """Describe the data available in the semantic model."""
         logger.info("Tool 'describe_data' invoked")
         description_text = data_description()
         return {"type": "text", "text": description_text}
 
-    @mcp.tool("read_data")
-    def read_data(query: Query) -> str:
-        """Read data from the semantic model."""
-        try:
-            logger.info("Tool 'read_data' invoked with query: %s", query)
+    @mcp.tool("search_dimension_values")
+    async def search_dimension_values(
+        query: str = "", dimension: Optional[str] = None, limit: int = 20
+    ) -> str:
+        """Look up the exact values a dimension contains before filtering on it.
 
-            # Convert Query to QueryRequest for the query builder
-            query_request = QueryRequest(
-                measures=query.measures,
-                dimensions=query.dimensions,
-                filters=query.filters,
-                timeDimensions=query.timeDimensions,
-                limit=query.limit,
-                offset=query.offset,
-                order=query.order,
+        Matches values starting with or containing `query` and, failing that,
+        similar spellings, most frequent first. Leave `dimension` empty to
+        search all dimensions, e.g. to find which one holds "Germany".
+        """
+        logger.info(
+            "Tool 'search_dimension_values' invoked: %r in %s", query, dimension or "all"
+        )
+        runtime = semantic_runtime.current
+        try:
+            # Loading the index may have to build it once for a new model generation
+            index = await asyncio.get_running_loop().run_in_executor(
+                worker_pool, lambda: runtime.value_index
             )
+            matches = index.search(query, dimension=dimension, limit=limit)
+        except KeyError:
+            return f"Error: Unknown dimension: {dimension}"
+        return data_to_yaml({"type": "dimension_values", "matches": matches})
+
+    def _query_request(query: Query) -> QueryRequest:
+        """Convert Query to QueryRequest for the query builder."""
+        return QueryRequest(
+            measures=query.measures,
+            dimensions=query.dimensions,
+            filters=query.filters,
+            timeDimensions=query.timeDimensions,
+            limit=query.limit,
+            offset=query.offset,
+            order=query.order,
+            currency=query.currency,
+            top_n_per=query.top_n_per,
+        )
 
-            result = build_semantic_query(semantic_model, query_request)
+    def _run_query(
+        query: Query, data_id: str, runtime, handle: QueryHandle
+    ) -> tuple[list, str, str]:
+        """Build, execute and serialize a query. Runs on a worker thread."""
+        query_request = _query_request(query)
+        # Rejected queries raise QueryRejectedError, reported back as an error
+        admission = runtime.admit(query_request)
+        query_request = admission.query
 
-            # Execute the query to get a pandas DataFrame
-            df = result.execute()
-            logger.info("Query returned %d rows", len(df))
+        # Reuses the compiled SQL of earlier queries of the same shape
+        sql, parameters = runtime.compile(query_request)
 
-            # Apply limit/offset
-            if query.offset and query.offset > 0:
-                df = df.iloc[query.offset :]
-            if query.limit and query.limit > 0:
-                df = df.head(query.limit)
+        # Execute the query to get a pandas DataFrame
+        df = handle.start(runtime).execute(sql, parameters)
+        logger.info("Query returned %d rows", len(df))
+        runtime.record(query_request)
 
-            data = df.to_dict(orient="records")
+        # Apply limit/offset
+        if query_request.offset and query_request.offset > 0:
+            df = df.iloc[query_request.offset :]
+        if query_request.limit and query_request.limit > 0:
+            df = df.head(query_request.limit)
 
-            data_id = str(uuid.uuid4())
+        data = df.to_dict(orient="records")
+
+        output = {
+            "type": "data",
+            "data_id": data_id,
+            "data": data,
+        }
+        if admission.notice:
+            output["notice"] = admission.notice
+        return data, data_to_yaml(output), json.dumps(output, default=str)
+
+    async def _wait_with_progress(ctx: Context, future, running: QueryHandle):
+        """Wait for a query, reporting progress and interrupting it on timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + query_timeout if query_timeout else None
+        while True:
+            wait = PROGRESS_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - loop.time())
+                if wait <= 0:
+                    running.interrupt()
+                    # Interrupting is immediate for DuckDB; give the worker a
+                    # moment to unwind so it is free before the session slot is
+                    # released, but do not wait on a worker still compiling the
+                    # query: it stops once it starts executing
+                    await asyncio.wait({future}, timeout=INTERRUPT_GRACE_PERIOD)
+                    raise TimeoutError(
+                        f"Query exceeded the {query_timeout}s time limit and was cancelled"
+                    )
+            done, _ = await asyncio.wait({future}, timeout=wait)
+            if done:
+                return future.result()
+            progress = running.progress()
+            await ctx.report_progress(
+                progress if progress is not None else 0,
+                100,
+                message="Query running",
+            )
+
+    @mcp.tool("read_data")
+    async def read_data(query: Query, ctx: Context) -> str:
+        """Read data from the semantic model."""
+        try:
+            logger.info("Tool 'read_data' invoked with query: %s", query)
+
+            async with _session_limit(ctx):
+                data_id = str(uuid.uuid4())
+                # Pin the current model so a reload cannot swap it mid-query
+                runtime = semantic_runtime.current
+                handle = QueryHandle()
+                future = asyncio.get_running_loop().run_in_executor(
+                    worker_pool, _run_query, query, data_id, runtime, handle
+                )
+                # A worker that timed out may finish in the background; its
+                # query closes itself, and its result or error is dropped
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                data, yaml_output, json_output = await _wait_with_progress(
+                    ctx, future, handle
+                )
 
             @mcp.resource(f"data://{data_id}")
             def data_resource() -> str:
                 return json.dumps(data, default=str)
 
-            output = {
-                "type": "data",
-                "data_id": data_id,
-                "data": data,
-            }
-            yaml_output = data_to_yaml(output)
-            json_output = json.dumps(output, default=str)
             logger.info("Tool 'read_data' completed successfully")
             return [
                 TextContent(type="text", text=yaml_output),
@@ -149,14 +332,92 @@ def main(pipeline_name: str, logger: logging.Logger):
                 ),
             ]
 
+        except (TimeoutError, QueryInterruptedError) as e:
+            logger.warning("Query in read_data cancelled: %s", str(e))
+            return f"Error: {str(e)}"
         except Exception as e:
             logger.exception("Error in read_data: %s", str(e))
             return f"Error: {str(e)}"
 
+    def _job_status(job) -> str:
+        status = job.model_dump(
+            include={"id", "status", "progress", "row_count", "notice", "error"},
+            exclude_none=True,
+        )
+        return data_to_yaml({"type": "query_job", **status})
+
+    @mcp.tool("submit_query_job")
+    async def submit_query_job(query: Query, priority: int = 5) -> str:
+        """Run a query too large or slow for read_data in the background.
+
+        Returns a job id; poll it with get_query_job and read the rows with
+        read_job_result once it succeeded. Jobs with a lower priority run
+        first. The limit of the query defaults to 500 rows; set it to null
+        for the whole result.
+        """
+        logger.info("Tool 'submit_query_job' invoked with query: %s", query)
+        try:
+            job = await asyncio.get_running_loop().run_in_executor(
+                worker_pool, job_manager.submit, _query_request(query), priority
+            )
+        except Exception as e:
+            logger.warning("Query job rejected: %s", str(e))
+            return f"Error: {str(e)}"
+        return _job_status(job)
+
+    @mcp.tool("get_query_job")
+    async def get_query_job(job_id: str) -> str:
+        """Status and progress (in percent) of a query job."""
+        try:
+            return _job_status(job_manager.get(job_id))
+        except JobNotFoundError:
+            return f"Error: Unknown or expired job: {job_id}"
+
+    @mcp.tool("read_job_result")
+    async def read_job_result(job_id: str, offset: int = 0, limit: int = 500) -> str:
+        """Read `limit` rows of a succeeded query job's result, starting at `offset`."""
+        try:
+            job = job_manager.get(job_id)
+        except JobNotFoundError:
+            return f"Error: Unknown or expired job: {job_id}"
+        if job.status != "succeeded":
+            return f"Error: Job {job_id} is {job.status}"
+        rows = await asyncio.get_running_loop().run_in_executor(
+            worker_pool,
+            read_result_range,
+            job_manager.result_path(job_id),
+            offset,
+            limit,
+        )
+        data = rows.to_pandas().to_dict(orient="records")
+        return data_to_yaml(
+            {
+                "type": "data",
+                "data_id": job_id,
+                "offset": offset,
+                "total_rows": job.row_count,
+                "data": json.loads(json.dumps(data, default=str)),
+            }
+        )
+
+    @mcp.tool("cancel_query_job")
+    async def cancel_query_job(job_id: str) -> str:
+        """Cancel a queued or running query job."""
+        try:
+            return _job_status(job_manager.cancel(job_id))
+        except JobNotFoundError:
+            return f"Error: Unknown or expired job: {job_id}"
+
     exposed_services = [
         "Resource: context://data_description",
+        "Resource: context://model_version",
         "Tool: describe_data",
+        "Tool: search_dimension_values",
         "Tool: read_data",
+        "Tool: submit_query_job",
+        "Tool: get_query_job",
+        "Tool: read_job_result",
+        "Tool: cancel_query_job",
     ]
     logger.info("Exposing the following service endpoints:")
     for service in exposed_services:
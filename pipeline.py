@@ -1,14 +1,38 @@
-"""Main dlt pipeline for loading Contoso retail data into DuckDB."""
+"""Main dlt pipeline for loading Contoso retail data into DuckDB (and PostgreSQL)."""
 
-from constants import PIPELINE_NAME, DATASET_NAME, DESTINATION
+from constants import (
+    PIPELINE_NAME,
+    DATASET_NAME,
+    DESTINATION,
+    DUCKDB_SNAPSHOTS,
+    SNAPSHOT_RETENTION,
+    STORAGE_BACKEND,
+    LAKE_DIR,
+    OPTIMIZE_LAYOUT,
+)
+from layout import optimize_database
+from quality import schema_primary_keys, validate_database
+from semantics.currency import materialize_exchange_rates
+from semantics.lake import export_lake
+from semantics.model_cache import refresh_model_metadata
+from semantics.value_index import refresh_value_index
+from semantics.column_stats import refresh_statistics
+from semantics.snapshots import new_snapshot_path, publish_snapshot, prune_snapshots
 from sources import get_sources
+from warehouse import load_warehouse
 import dlt
+import duckdb
 
 
 if __name__ == "__main__":
+    # In snapshot mode each run loads into a new file while readers keep
+    # querying the previously published one
+    snapshot = new_snapshot_path(PIPELINE_NAME) if DUCKDB_SNAPSHOTS else None
+    destination = dlt.destinations.duckdb(snapshot) if snapshot else DESTINATION
+
     pipeline = dlt.pipeline(
         pipeline_name=PIPELINE_NAME,
-        destination=DESTINATION,
+        destination=destination,
         dataset_name=DATASET_NAME,
     )
 
@@ -29,3 +53,56 @@ if __name__ == "__main__":
         if not table.startswith("_dlt")
     ]
     print(f"\nTables loaded: {', '.join(tables_loaded)}")
+
+    database = pipeline.destination_client().config.credentials.database
+
+    # Keys, references, NULL rates and types; with fail-fast a failed check
+    # stops here, before the load is published to readers
+    primary_keys = schema_primary_keys(pipeline.default_schema)
+    quality = validate_database(database, PIPELINE_NAME, primary_keys, DATASET_NAME)
+    print(quality.format())
+
+    # Exchange rate of every order for the currency-converted measures; before
+    # the layout optimization, which restores the sort order of the fact table
+    with duckdb.connect(database) as connection:
+        rate_columns = materialize_exchange_rates(connection, DATASET_NAME)
+    print(f"Exchange rates materialized: {', '.join(rate_columns) or 'none'}")
+
+    if STORAGE_BACKEND == "postgres":
+        # Bulk load the warehouse from the checked tables and their rates
+        print(load_warehouse(database, primary_keys, DATASET_NAME).format())
+
+    if OPTIMIZE_LAYOUT:
+        # Sort and dictionary-encode before readers get to see the database
+        print(optimize_database(database, DATASET_NAME).format())
+
+    if snapshot:
+        publish_snapshot(PIPELINE_NAME, snapshot)
+        print(f"Published DuckDB snapshot {snapshot}")
+
+    if STORAGE_BACKEND == "parquet":
+        # Export the loaded tables to a new Parquet lake snapshot for the readers
+        lake = new_snapshot_path(PIPELINE_NAME, LAKE_DIR, suffix="")
+        with duckdb.connect(database, read_only=True) as connection:
+            export_lake(connection, DATASET_NAME, tables_loaded, lake)
+        publish_snapshot(PIPELINE_NAME, lake, LAKE_DIR)
+        print(f"Published Parquet lake {lake}")
+
+    # Precompile the semantic model metadata so servers start from the cache
+    metadata = refresh_model_metadata(pipeline)
+    print(f"Semantic model metadata cached (version {metadata.version})")
+
+    # Distinct dimension values for filter pickers and the agent
+    index = refresh_value_index(metadata)
+    print(f"Dimension value index built for {len(index.dimensions)} dimensions")
+
+    # Column statistics for the query cost estimates
+    statistics = refresh_statistics(metadata)
+    print(f"Column statistics gathered for {len(statistics.dimensions)} dimensions")
+
+    if snapshot:
+        for path in prune_snapshots(PIPELINE_NAME, SNAPSHOT_RETENTION):
+            print(f"Removed expired snapshot {path}")
+    if STORAGE_BACKEND == "parquet":
+        for path in prune_snapshots(PIPELINE_NAME, SNAPSHOT_RETENTION, LAKE_DIR):
+            print(f"Removed expired lake snapshot {path}")
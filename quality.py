@@ -0,0 +1,345 @@
+"""Post-load data-quality and referential-integrity checks.
+
+The semantic model left-joins the fact tables to their dimension tables, so a
+duplicate dimension key multiplies fact rows and an orphan foreign key turns
+into NULL dimension values without any error. After each load this stage
+checks in DuckDB
+  - primary-key uniqueness and NULL keys, for the primary keys of the dlt
+    schema (declared in `sources.py`);
+  - foreign-key coverage of the references in `semantics.table_references`,
+    with an anti join per reference;
+  - NULL rates of every column, reported as warnings above
+    `QUALITY_MAX_NULL_RATE`;
+  - type conformance: text columns in `QUALITY_TYPE_CHECKS` must cast to their
+    type, and no column may have a dlt variant column (`<column>__v_<type>`),
+    which dlt adds for values that do not match the column type.
+
+Every table is scanned once for its key, NULL and type checks, with all
+counts computed in a single aggregate, plus one hash anti join per reference.
+The report is written as JSON next to the other derived artifacts; with
+fail-fast, failed checks raise `DataQualityError` before the load is published.
+
+Usage:
+    python quality.py                     # check the pipeline's database
+    python quality.py -d path/to/db.duckdb --fail-fast
+"""
+
+from constants import (
+    CACHE_DIR,
+    DATASET_NAME,
+    PIPELINE_NAME,
+    QUALITY_FAIL_FAST,
+    QUALITY_MAX_NULL_RATE,
+    QUALITY_TYPE_CHECKS,
+)
+from semantics.model_cache import write_atomic
+from semantics.table_references import get_semantic_table_references
+from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional
+import argparse
+import os
+import time
+import duckdb
+
+# Orphan key values listed per failed reference
+EXAMPLE_VALUES = 5
+
+
+class DataQualityError(RuntimeError):
+    """Raised in fail-fast mode when a data-quality check failed."""
+
+
+class CheckResult(BaseModel):
+    check: Literal["primary_key", "foreign_key", "null_rate", "type"]
+    table: str
+    columns: List[str]
+    status: Literal["passed", "warning", "failed"]
+    rows: int
+    failed_rows: int
+    message: str
+    examples: List[str] = []
+
+    @property
+    def rate(self) -> float:
+        return self.failed_rows / self.rows if self.rows else 0.0
+
+
+class QualityReport(BaseModel):
+    dataset_name: str
+    seconds: float
+    checks: List[CheckResult]
+
+    @property
+    def failed(self) -> List[CheckResult]:
+        return [c for c in self.checks if c.status == "failed"]
+
+    @property
+    def warnings(self) -> List[CheckResult]:
+        return [c for c in self.checks if c.status == "warning"]
+
+    def format(self) -> str:
+        lines = [
+            f"Data quality: {len(self.checks)} checks in {self.seconds:.2f}s, "
+            f"{len(self.failed)} failed, {len(self.warnings)} warnings"
+        ]
+        for check in self.failed + self.warnings:
+            line = f"  - {check.status.upper()} {check.message}"
+            if check.examples:
+                line += f" (e.g. {', '.join(check.examples)})"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _columns(connection: duckdb.DuckDBPyConnection, dataset_name: str) -> Dict[str, List[str]]:
+    rows = connection.execute(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = ? ORDER BY table_name, ordinal_position",
+        [dataset_name],
+    ).fetchall()
+    columns: Dict[str, List[str]] = {}
+    for table_name, column_name in rows:
+        columns.setdefault(table_name, []).append(column_name)
+    return columns
+
+
+def schema_primary_keys(schema) -> Dict[str, List[str]]:
+    """Primary key columns per table of a dlt schema."""
+    return {
+        table_name: [
+            name
+            for name, column in schema.get_table_columns(table_name).items()
+            if column.get("primary_key")
+        ]
+        for table_name in schema.data_table_names()
+    }
+
+
+def _table_checks(
+    connection: duckdb.DuckDBPyConnection,
+    dataset_name: str,
+    table_name: str,
+    columns: List[str],
+    primary_key: List[str],
+    type_checks: Dict[str, str],
+    max_null_rate: float,
+) -> List[CheckResult]:
+    """Key, NULL and type checks of one table, computed in a single scan."""
+    source = f"{_quote(dataset_name)}.{_quote(table_name)}"
+    data_columns = [c for c in columns if not c.startswith("_dlt_")]
+
+    aggregates = ["COUNT(*)"]
+    aggregates += [f"COUNT({_quote(c)})" for c in data_columns]
+    key = [c for c in primary_key if c in columns]
+    if key:
+        key_row = ", ".join(_quote(c) for c in key)
+        null_key = " OR ".join(f"{_quote(c)} IS NULL" for c in key)
+        aggregates.append(f"COUNT(DISTINCT ROW({key_row})) FILTER (WHERE NOT ({null_key}))")
+        aggregates.append(f"COUNT(*) FILTER (WHERE {null_key})")
+    typed = {c: t for c, t in type_checks.items() if c in columns}
+    aggregates += [
+        f"COUNT(*) FILTER (WHERE {_quote(c)} IS NOT NULL "
+        f"AND TRY_CAST({_quote(c)} AS {t}) IS NULL)"
+        for c, t in typed.items()
+    ]
+
+    values = list(connection.execute(f"SELECT {', '.join(aggregates)} FROM {source}").fetchone())
+    rows = values.pop(0)
+    non_null = dict(zip(data_columns, values[: len(data_columns)]))
+    values = values[len(data_columns):]
+
+    results = []
+    if key:
+        distinct, null_keys = values.pop(0), values.pop(0)
+        duplicates = rows - null_keys - distinct
+        failed = duplicates + null_keys
+        results.append(
+            CheckResult(
+                check="primary_key",
+                table=table_name,
+                columns=key,
+                status="failed" if failed else "passed",
+                rows=rows,
+                failed_rows=failed,
+                message=f"{table_name}({', '.join(key)}): {duplicates:,} duplicate "
+                f"and {null_keys:,} NULL keys in {rows:,} rows",
+            )
+        )
+
+    for column, count in non_null.items():
+        nulls = rows - count
+        rate = nulls / rows if rows else 0.0
+        results.append(
+            CheckResult(
+                check="null_rate",
+                table=table_name,
+                columns=[column],
+                status="warning" if rate > max_null_rate else "passed",
+                rows=rows,
+                failed_rows=nulls,
+                message=f"{table_name}.{column}: {rate:.1%} NULL",
+            )
+        )
+
+    for (column, type_name), invalid in zip(typed.items(), values):
+        results.append(
+            CheckResult(
+                check="type",
+                table=table_name,
+                columns=[column],
+                status="failed" if invalid else "passed",
+                rows=rows,
+                failed_rows=invalid,
+                message=f"{table_name}.{column}: {invalid:,} values are not {type_name}",
+            )
+        )
+
+    for column in columns:
+        if "__v_" in column:
+            results.append(
+                CheckResult(
+                    check="type",
+                    table=table_name,
+                    columns=[column],
+                    status="failed",
+                    rows=rows,
+                    failed_rows=non_null.get(column, 0),
+                    message=f"{table_name}.{column}: variant column for "
+                    f"{non_null.get(column, 0):,} values of another type",
+                )
+            )
+    return results
+
+
+def _reference_check(
+    connection: duckdb.DuckDBPyConnection,
+    dataset_name: str,
+    table_name: str,
+    reference: Dict,
+) -> CheckResult:
+    """Rows whose non-NULL foreign key has no match in the referenced table."""
+    source = f"{_quote(dataset_name)}.{_quote(table_name)}"
+    target = f"{_quote(dataset_name)}.{_quote(reference['referenced_table'])}"
+    columns, referenced = reference["columns"], reference["referenced_columns"]
+    on = " AND ".join(
+        f"f.{_quote(c)} = r.{_quote(rc)}" for c, rc in zip(columns, referenced)
+    )
+    not_null = " AND ".join(f"f.{_quote(c)} IS NOT NULL" for c in columns)
+    key = " || '/' || ".join(f"CAST(f.{_quote(c)} AS VARCHAR)" for c in columns)
+
+    rows, orphans, examples = connection.execute(
+        f"""
+        WITH orphans AS (
+            SELECT {key} AS key FROM {source} AS f
+            ANTI JOIN {target} AS r ON {on}
+            WHERE {not_null}
+        )
+        SELECT
+            (SELECT COUNT(*) FROM {source}),
+            (SELECT COUNT(*) FROM orphans),
+            (SELECT list(key) FROM (SELECT DISTINCT key FROM orphans ORDER BY key LIMIT {EXAMPLE_VALUES}))
+        """
+    ).fetchone()
+
+    target_name = f"{reference['referenced_table']}({', '.join(referenced)})"
+    return CheckResult(
+        check="foreign_key",
+        table=table_name,
+        columns=columns,
+        status="failed" if orphans else "passed",
+        rows=rows,
+        failed_rows=orphans,
+        message=f"{table_name}({', '.join(columns)}) -> {target_name}: "
+        f"{orphans:,} of {rows:,} rows have no match",
+        examples=examples or [],
+    )
+
+
+def check_database(
+    connection: duckdb.DuckDBPyConnection,
+    primary_keys: Dict[str, List[str]],
+    dataset_name: str = DATASET_NAME,
+    references: Optional[Dict[str, List[Dict]]] = None,
+    type_checks: Dict[str, Dict[str, str]] = QUALITY_TYPE_CHECKS,
+    max_null_rate: float = QUALITY_MAX_NULL_RATE,
+) -> QualityReport:
+    """Run all checks on the loaded tables of a dataset."""
+    start = time.perf_counter()
+    if references is None:
+        references = get_semantic_table_references()
+    columns = _columns(connection, dataset_name)
+
+    checks = []
+    for table_name, table_columns in columns.items():
+        if table_name.startswith("_dlt"):
+            continue
+        checks += _table_checks(
+            connection,
+            dataset_name,
+            table_name,
+            table_columns,
+            primary_keys.get(table_name, []),
+            type_checks.get(table_name, {}),
+            max_null_rate,
+        )
+    for table_name, table_references in references.items():
+        for reference in table_references:
+            if table_name in columns and reference["referenced_table"] in columns:
+                checks.append(_reference_check(connection, dataset_name, table_name, reference))
+
+    return QualityReport(
+        dataset_name=dataset_name, seconds=time.perf_counter() - start, checks=checks
+    )
+
+
+def quality_report_path(pipeline_name: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{pipeline_name}.quality.json")
+
+
+def write_quality_report(
+    report: QualityReport, pipeline_name: str, cache_dir: str = CACHE_DIR
+) -> str:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = quality_report_path(pipeline_name, cache_dir)
+    write_atomic(path, report.model_dump_json(indent=2))
+    return path
+
+
+def validate_database(
+    database: str,
+    pipeline_name: str,
+    primary_keys: Dict[str, List[str]],
+    dataset_name: str = DATASET_NAME,
+    fail_fast: bool = QUALITY_FAIL_FAST,
+) -> QualityReport:
+    """Check a DuckDB database file, store the report and, with fail-fast, raise on failures."""
+    with duckdb.connect(database, read_only=True) as connection:
+        report = check_database(connection, primary_keys, dataset_name)
+    write_quality_report(report, pipeline_name)
+    if fail_fast and report.failed:
+        raise DataQualityError(report.format())
+    return report
+
+
+if __name__ == "__main__":
+    import dlt
+    from semantics.execution import staging_database
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-d", "--database", required=False, type=str)
+    parser.add_argument("--fail-fast", action="store_true", default=QUALITY_FAIL_FAST)
+    args = parser.parse_args()
+
+    pipeline = dlt.attach(pipeline_name=args.pipeline if args.pipeline else PIPELINE_NAME)
+    report = validate_database(
+        args.database or staging_database(pipeline),
+        pipeline.pipeline_name,
+        schema_primary_keys(pipeline.default_schema),
+        pipeline.dataset_name,
+        fail_fast=args.fail_fast,
+    )
+    print(report.format())
@@ -0,0 +1,249 @@
+"""Cost estimation and admission control for semantic queries.
+
+Before a query runs, its number of groups, result rows and scanned rows are
+estimated from the column statistics (see `semantics.column_stats`):
+
+- a filter keeps 1/distinct rows for `=`, the covered share of the min/max
+  range for range filters and date ranges, and a fixed share otherwise;
+- the groups of the dimensions of one table are capped at its row count, and
+  all groups at the fact rows that pass the filters; `top_n_per` caps the
+  result at n rows per group;
+- a query scans the fact tables of its measures (see
+  `MultiFactModel.fact_of`) and every table joined into their stars; a fact
+  table scan shrinks with filters on its first sort key or its partition key,
+  which DuckDB prunes via zone maps or partition directories.
+
+Queries over the group or scan budget are rejected with an explanation;
+results over the row budget are limited to it.
+"""
+
+from __future__ import annotations
+
+from constants import (
+    LAKE_PARTITIONS,
+    LAYOUT_SORT_KEYS,
+    MAX_QUERY_GROUPS,
+    MAX_RESULT_ROWS,
+    MAX_SCAN_ROWS,
+    OPTIMIZE_LAYOUT,
+    STORAGE_BACKEND,
+)
+from semantics.column_stats import ColumnStats, ModelStatistics
+from semantics.query_builder import QueryRequest, _field_name, filter_values
+from datetime import date
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+if TYPE_CHECKING:
+    from semantics.drill_across import MultiFactModel
+
+# Share of rows assumed to pass a filter the statistics cannot judge
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+CONTAINS_SELECTIVITY = 0.1
+
+
+class QueryRejectedError(ValueError):
+    """Raised when a query's estimated cost exceeds the configured budgets."""
+
+
+class QueryEstimate(BaseModel):
+    groups: int
+    result_rows: int
+    scanned_rows: int
+    selectivity: float
+    dimension_groups: Dict[str, int]
+
+
+class Admission(BaseModel):
+    query: QueryRequest
+    estimate: QueryEstimate
+    notice: Optional[str] = None
+
+
+def _position(value) -> Optional[float]:
+    """Place a value on a numeric axis: dates by day, numbers as they are."""
+    if value is None:
+        return None
+    text = str(value)
+    try:
+        return float(date.fromisoformat(text[:10]).toordinal())
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _range_selectivity(stats: ColumnStats, low=None, high=None) -> float:
+    minimum, maximum = _position(stats.min), _position(stats.max)
+    if minimum is None or maximum is None:
+        return DEFAULT_RANGE_SELECTIVITY
+    if maximum <= minimum:
+        return 1.0
+
+    start = _position(low) if low is not None else minimum
+    end = _position(high) if high is not None else maximum
+    if start is None or end is None:
+        return DEFAULT_RANGE_SELECTIVITY
+    covered = min(end, maximum) - max(start, minimum)
+    return max(0.0, min(1.0, covered / (maximum - minimum)))
+
+
+def _filter_selectivity(stats: ColumnStats, operator: str, value) -> float:
+    distinct = max(stats.distinct, 1)
+    if operator == "=":
+        return 1 / distinct
+    if operator == "!=":
+        return 1 - 1 / distinct
+    if operator in (">", ">="):
+        return _range_selectivity(stats, low=value)
+    if operator in ("<", "<="):
+        return _range_selectivity(stats, high=value)
+    return CONTAINS_SELECTIVITY
+
+
+def _prunable_columns(fact_table: str) -> Set[str]:
+    """Fact table columns whose filters let DuckDB skip data."""
+    columns = set()
+    sort_keys = LAYOUT_SORT_KEYS.get(fact_table)
+    if OPTIMIZE_LAYOUT and sort_keys:
+        columns.add(sort_keys[0])
+    if STORAGE_BACKEND == "parquet" and fact_table in LAKE_PARTITIONS:
+        columns.add(LAKE_PARTITIONS[fact_table][0])
+    return columns
+
+
+def _query_facts(model: MultiFactModel, query_request: QueryRequest) -> List[str]:
+    """Fact tables a query request runs on, as drill-across plans it."""
+    facts = {}
+    for name in map(_field_name, query_request.measures):
+        try:
+            facts[model.fact_of(name)] = None
+        except KeyError:
+            # Unknown measures are dropped by the query builder
+            continue
+    if facts:
+        return list(facts)
+    # Dimension-only queries run on the first fact that has them all
+    needed = [_field_name(name) for name in query_request.dimensions] + [
+        _field_name(f.field) for f in query_request.filters
+    ]
+    for fact, semantic_model in model.facts.items():
+        if all(name in semantic_model.dimensions for name in needed):
+            return [fact]
+    return list(model.facts)[:1]
+
+
+def estimate_query(
+    statistics: ModelStatistics, model: MultiFactModel, query_request: QueryRequest
+) -> QueryEstimate:
+    """Estimate groups, result rows and scanned rows of a query request."""
+    facts = _query_facts(model, query_request)
+    fact_rows = sum(statistics.table_rows.get(fact, 0) for fact in facts)
+
+    dimensions = [
+        name for name in map(_field_name, query_request.dimensions)
+        if name in statistics.dimensions
+    ]
+    dimension_groups = {
+        name: max(statistics.dimensions[name].distinct, 1) for name in dimensions
+    }
+
+    conditions = [
+        (_field_name(field), operator, value)
+        for field, operator, value in filter_values(query_request)
+    ]
+
+    selectivity = 1.0
+    scanned_share: Dict[str, float] = {}
+    for name, operator, value in conditions:
+        stats = statistics.dimensions.get(name)
+        if stats is None:
+            continue
+        share = _filter_selectivity(stats, operator, value)
+        selectivity *= share
+        if name in dimension_groups:
+            groups = 1 if operator == "=" else dimension_groups[name] * share
+            dimension_groups[name] = max(1, round(groups))
+        if stats.table in facts and stats.column in _prunable_columns(stats.table):
+            scanned_share[stats.table] = scanned_share.get(stats.table, 1.0) * share
+
+    matched_rows = fact_rows * selectivity
+
+    # Dimensions of one table cannot have more combinations than it has rows
+    per_table: Dict[str, float] = {}
+    for name, groups in dimension_groups.items():
+        table = statistics.dimensions[name].table
+        per_table[table] = per_table.get(table, 1) * groups
+    groups = 1.0
+    for table, combinations in per_table.items():
+        groups *= min(combinations, statistics.table_rows.get(table, combinations))
+    if dimensions:
+        groups = min(groups, max(matched_rows, 1))
+
+    result_rows = int(groups)
+    top_n = query_request.top_n_per
+    if top_n is not None:
+        per_groups = 1
+        for name in map(_field_name, top_n.dimensions):
+            per_groups *= dimension_groups.get(name, 1)
+        result_rows = min(result_rows, per_groups * top_n.n)
+    if query_request.limit and query_request.limit > 0:
+        result_rows = min(result_rows, query_request.limit)
+
+    scanned_rows = sum(
+        statistics.table_rows.get(fact, 0) * scanned_share.get(fact, 1.0)
+        + sum(statistics.table_rows.get(table, 0) for table in model.stars[fact][1:])
+        for fact in facts
+    )
+
+    return QueryEstimate(
+        groups=int(groups),
+        result_rows=result_rows,
+        scanned_rows=int(scanned_rows),
+        selectivity=selectivity,
+        dimension_groups=dimension_groups,
+    )
+
+
+def _largest_dimensions(estimate: QueryEstimate, count: int = 3) -> List[str]:
+    largest = sorted(estimate.dimension_groups.items(), key=lambda item: -item[1])
+    return [f"{name} (~{groups:,})" for name, groups in largest[:count]]
+
+
+def admit_query(
+    statistics: ModelStatistics,
+    model: MultiFactModel,
+    query_request: QueryRequest,
+    max_groups: int = MAX_QUERY_GROUPS,
+    max_scan_rows: int = MAX_SCAN_ROWS,
+    max_result_rows: int = MAX_RESULT_ROWS,
+) -> Admission:
+    """Check a query against the budgets; raise QueryRejectedError or limit it."""
+    estimate = estimate_query(statistics, model, query_request)
+
+    if max_scan_rows and estimate.scanned_rows > max_scan_rows:
+        raise QueryRejectedError(
+            f"Query rejected: it would scan about {estimate.scanned_rows:,} rows "
+            f"(budget {max_scan_rows:,}). Add a filter on a date range to narrow it."
+        )
+
+    if max_groups and estimate.groups > max_groups:
+        raise QueryRejectedError(
+            f"Query rejected: grouping by {', '.join(_largest_dimensions(estimate))} "
+            f"would produce about {estimate.groups:,} groups (budget {max_groups:,}). "
+            "Remove a high-cardinality dimension or add filters."
+        )
+
+    if max_result_rows and estimate.result_rows > max_result_rows:
+        return Admission(
+            query=query_request.model_copy(update={"limit": max_result_rows}),
+            estimate=estimate,
+            notice=(
+                f"Result limited to {max_result_rows:,} of about "
+                f"{estimate.result_rows:,} rows."
+            ),
+        )
+
+    return Admission(query=query_request, estimate=estimate)
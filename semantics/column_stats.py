@@ -0,0 +1,162 @@
+"""Per-column statistics of the semantic model, gathered after each load.
+
+For every table of the model the row count, and for every dimension its
+approximate number of distinct values, null count and min/max are collected
+with one aggregate query per table. They are stored next to the model metadata
+cache for the current model generation and feed the query cost estimates in
+`semantics.admission`.
+
+Usage:
+    python -m semantics.column_stats              # (re)gather the statistics
+"""
+
+from __future__ import annotations
+
+from constants import CACHE_DIR, PIPELINE_NAME
+from semantics.model_cache import ModelMetadata, _cache_lock, write_atomic
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Dict, Optional
+import argparse
+import os
+
+if TYPE_CHECKING:
+    from semantics.execution import QueryExecutor
+
+
+class ColumnStats(BaseModel):
+    table: str
+    # Underlying table column when the dimension is a plain column reference
+    column: Optional[str] = None
+    distinct: int
+    nulls: int
+    min: Optional[str] = None
+    max: Optional[str] = None
+
+
+class ModelStatistics(BaseModel):
+    generation: str
+    fact_table: str
+    table_rows: Dict[str, int]
+    dimensions: Dict[str, ColumnStats]
+
+
+def column_stats_path(pipeline_name: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{pipeline_name}.stats.json")
+
+
+def gather_statistics(metadata: ModelMetadata, executor: QueryExecutor) -> ModelStatistics:
+    """Run one aggregate query per table over all of its dimensions."""
+    import ibis
+    from semantics.lake import source_column
+    from semantics.model import (
+        FACT_TABLE,
+        SEMANTIC_DEFINITIONS,
+        _prepare_table,
+        metadata_tables,
+    )
+
+    tables = metadata_tables(metadata)
+    table_rows = {}
+    dimensions = {}
+    for table_name, definition in SEMANTIC_DEFINITIONS.items():
+        if table_name not in tables:
+            continue
+        table = _prepare_table(tables[table_name], table_name)
+
+        aggregates = {"rows": ibis._.count()}
+        columns = {}
+        for name, expr in definition["dimensions"].items():
+            value = expr(table)
+            source = source_column(value)
+            if source is not None:
+                columns[name] = source.removeprefix(f"{table_name}__")
+            aggregates[f"{name}__distinct"] = value.approx_nunique()
+            aggregates[f"{name}__count"] = value.count()
+            aggregates[f"{name}__min"] = value.min().cast("string")
+            aggregates[f"{name}__max"] = value.max().cast("string")
+
+        sql = ibis.to_sql(table.aggregate(**aggregates), dialect=executor.dialect)
+        row = executor.start().execute(sql).iloc[0]
+
+        rows = int(row["rows"])
+        table_rows[table_name] = rows
+        for name in definition["dimensions"]:
+            minimum, maximum = row[f"{name}__min"], row[f"{name}__max"]
+            dimensions[name] = ColumnStats(
+                table=table_name,
+                column=columns.get(name),
+                distinct=int(row[f"{name}__distinct"]),
+                nulls=rows - int(row[f"{name}__count"]),
+                min=None if minimum is None else str(minimum),
+                max=None if maximum is None else str(maximum),
+            )
+
+    return ModelStatistics(
+        generation=metadata.generation,
+        fact_table=FACT_TABLE,
+        table_rows=table_rows,
+        dimensions=dimensions,
+    )
+
+
+def load_statistics(
+    metadata: ModelMetadata, cache_dir: str = CACHE_DIR
+) -> Optional[ModelStatistics]:
+    """Return the stored statistics, or None if missing or from another generation."""
+    try:
+        with open(column_stats_path(metadata.pipeline_name, cache_dir), "r", encoding="utf-8") as f:
+            statistics = ModelStatistics.model_validate_json(f.read())
+    except (OSError, ValueError):
+        return None
+    return statistics if statistics.generation == metadata.generation else None
+
+
+def write_statistics(
+    statistics: ModelStatistics, pipeline_name: str, cache_dir: str = CACHE_DIR
+) -> str:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = column_stats_path(pipeline_name, cache_dir)
+    write_atomic(path, statistics.model_dump_json(indent=2))
+    return path
+
+
+def get_statistics(
+    metadata: ModelMetadata, executor: QueryExecutor, cache_dir: str = CACHE_DIR
+) -> ModelStatistics:
+    """Return the stored statistics, gathering them once per generation if needed."""
+    statistics = load_statistics(metadata, cache_dir)
+    if statistics is not None:
+        return statistics
+
+    with _cache_lock(metadata.pipeline_name, cache_dir):
+        statistics = load_statistics(metadata, cache_dir)
+        if statistics is None:
+            statistics = gather_statistics(metadata, executor)
+            write_statistics(statistics, metadata.pipeline_name, cache_dir)
+        return statistics
+
+
+def refresh_statistics(metadata: ModelMetadata, cache_dir: str = CACHE_DIR) -> ModelStatistics:
+    """Gather and store the statistics, e.g. right after a pipeline run."""
+    from semantics.execution import QueryExecutor
+
+    executor = QueryExecutor.from_metadata(metadata)
+    try:
+        statistics = gather_statistics(metadata, executor)
+    finally:
+        executor.close()
+    write_statistics(statistics, metadata.pipeline_name, cache_dir)
+    return statistics
+
+
+if __name__ == "__main__":
+    from semantics.model_cache import get_model_metadata
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    args = parser.parse_args()
+
+    metadata = get_model_metadata(args.pipeline if args.pipeline else PIPELINE_NAME)
+    statistics = refresh_statistics(metadata)
+    print(f"Statistics of {len(statistics.dimensions)} dimensions written to "
+          f"{column_stats_path(metadata.pipeline_name)}")
@@ -0,0 +1,115 @@
+"""Exchange rates materialized on the fact table for currency-normalized measures.
+
+Sales amounts are stored in the currency of each order (`currency_code`).
+After each load `materialize_exchange_rates` adds one column per currency in
+`REPORTING_CURRENCIES` to `fact_sales`, e.g. `rate_to_usd`, holding the rate
+from the order's currency on its order date. The rate is the most recent one
+in `currencyexchange` on or before that date (a DuckDB ASOF join), so queries
+only multiply by a column instead of joining the rates by date range.
+
+The semantic model derives a converted variant of every amount measure per
+currency, e.g. `netRevenueEUR` (see `semantics.model.CURRENCY_MEASURES`),
+which query requests select with their `currency` parameter.
+
+Usage (needs write access, i.e. no reader may have the file open):
+    python -m semantics.currency -d path/to/db.duckdb
+"""
+
+from __future__ import annotations
+
+from constants import DATASET_NAME, PIPELINE_NAME, REPORTING_CURRENCIES
+from typing import TYPE_CHECKING, List
+import argparse
+
+if TYPE_CHECKING:
+    import duckdb
+
+RATES_TABLE = "currencyexchange"
+FACT_TABLE = "fact_sales"
+
+
+def rate_column(currency: str) -> str:
+    return f"rate_to_{currency.lower()}"
+
+
+def currency_measure(measure: str, currency: str) -> str:
+    """Name of the variant of an amount measure converted to `currency`."""
+    return f"{measure}{currency.upper()}"
+
+
+def materialize_exchange_rates(
+    connection: duckdb.DuckDBPyConnection,
+    dataset_name: str = DATASET_NAME,
+    currencies: List[str] = REPORTING_CURRENCIES,
+) -> List[str]:
+    """Rewrite the fact table with one rate column per currency; return the columns."""
+    tables = {
+        name
+        for (name,) in connection.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = ?",
+            [dataset_name],
+        ).fetchall()
+    }
+    if RATES_TABLE not in tables or FACT_TABLE not in tables or not currencies:
+        return []
+
+    source = f'"{dataset_name}"."{FACT_TABLE}"'
+    rates = f'"{dataset_name}"."{RATES_TABLE}"'
+    existing = {
+        name
+        for (name,) in connection.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = ? AND table_name = ?",
+            [dataset_name, FACT_TABLE],
+        ).fetchall()
+    }
+
+    columns = [rate_column(currency) for currency in currencies]
+    select = "f.*"
+    stale = [column for column in columns if column in existing]
+    if stale:
+        # Materialized by an earlier run on the same database
+        select = f"f.* EXCLUDE ({', '.join(stale)})"
+
+    joins = []
+    for i, (currency, column) in enumerate(zip(currencies, columns)):
+        alias = f"r{i}"
+        # Same-currency rows get 1.0 even if the rates table lacks the identity pair
+        select += (
+            f", COALESCE({alias}.exchange, "
+            f"CASE WHEN f.currency_code = '{currency}' THEN 1.0 END) AS {column}"
+        )
+        joins.append(
+            f"ASOF LEFT JOIN (SELECT TRY_CAST(date AS DATE) AS rate_date, "
+            f"from_currency, exchange FROM {rates} WHERE to_currency = '{currency}') "
+            f"AS {alias} ON CAST(f.currency_code AS VARCHAR) = {alias}.from_currency "
+            f"AND TRY_CAST(f.order_date AS DATE) >= {alias}.rate_date"
+        )
+
+    connection.execute(
+        f"CREATE OR REPLACE TABLE {source} AS SELECT {select} "
+        f"FROM {source} AS f {' '.join(joins)}"
+    )
+    return columns
+
+
+if __name__ == "__main__":
+    import duckdb
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-d", "--database", required=False, type=str)
+    args = parser.parse_args()
+
+    database = args.database
+    if database is None:
+        import dlt
+        from semantics.execution import staging_database
+
+        database = staging_database(
+            dlt.attach(pipeline_name=args.pipeline if args.pipeline else PIPELINE_NAME)
+        )
+
+    with duckdb.connect(database) as connection:
+        columns = materialize_exchange_rates(connection)
+    print(f"Materialized {', '.join(columns) or 'no'} exchange rate columns in {database}")
@@ -0,0 +1,289 @@
+"""Drill-across queries over several fact tables with conformed dimensions.
+
+`fact_sales`, `orders` and `orderrows` each get their own star (see
+`semantics.table_references`), joined to the same dimension tables. A fact
+table referenced from another fact, like `orders` from `orderrows`, only
+contributes its dimensions there: its measures would be repeated on every
+line of the order and double count.
+
+A query whose measures come from one fact runs on that fact's star as before.
+A query mixing facts, e.g. the delivery lead time per order with the line
+revenue, is split into one aggregate per fact at the requested grain, and the
+aggregates are merged with a full outer join on the dimensions. Every side has
+one row per dimension combination, so the fan-out join of the fact tables is
+never materialized. All dimensions and filters must therefore be shared by the
+facts involved.
+
+Usage:
+    python -m semantics.drill_across      # benchmark against the naive join
+"""
+
+from __future__ import annotations
+
+from constants import PIPELINE_NAME
+from typing import TYPE_CHECKING, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+import argparse
+
+if TYPE_CHECKING:
+    import ibis.expr.types as ir
+    from boring_semantic_layer import SemanticModel
+    from semantics.semi_join import DimensionKeys
+    from semantics.window_measures import WindowMeasure
+
+_RIGHT_SUFFIX = "__right"
+
+
+def _merge(tables: List[ir.Table], dimensions: Sequence[str]) -> ir.Table:
+    """Full outer join of per-fact aggregates on their (nullable) dimensions."""
+    import ibis
+
+    merged = tables[0]
+    for table in tables[1:]:
+        if not dimensions:
+            merged = merged.cross_join(table)
+            continue
+        # The facts share dimension tables, so both sides need distinct identities
+        merged = merged.view()
+        right = table.rename({f"{d}{_RIGHT_SUFFIX}": d for d in dimensions}).view()
+        joined = merged.outer_join(
+            right,
+            [merged[d].identical_to(right[f"{d}{_RIGHT_SUFFIX}"]) for d in dimensions],
+        )
+        merged = joined.select(
+            *[
+                ibis.coalesce(joined[d], joined[f"{d}{_RIGHT_SUFFIX}"]).name(d)
+                for d in dimensions
+            ],
+            *[
+                c
+                for c in joined.columns
+                if c not in dimensions and not c.endswith(_RIGHT_SUFFIX)
+            ],
+        )
+    return merged
+
+
+class MultiFactModel:
+    """The semantic models of several fact tables, queried as one.
+
+    Args:
+        facts: Semantic model per fact table; the first one is the primary fact
+            that measures and dimension-only queries default to.
+        windows: Window measures over the aggregated rows, by name (see
+            `semantics.window_measures`).
+        dimension_keys: Keys of the dimension tables per dimension, for the
+            semi-join reduction of filters (see `semantics.semi_join`).
+        converted_measures: Currency-converted variants of the measures, e.g.
+            netRevenueEUR; they can be queried but are not listed in `measures`,
+            as requests reach them through their `currency`.
+        stars: Tables joined into each fact table's star, the fact table
+            first and every other table once per join; a query scans all of
+            them (see `semantics.admission`).
+    """
+
+    def __init__(
+        self,
+        facts: Dict[str, SemanticModel],
+        windows: Optional[Dict[str, WindowMeasure]] = None,
+        dimension_keys: Optional[Dict[str, DimensionKeys]] = None,
+        converted_measures: Collection[str] = (),
+        stars: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.facts = facts
+        self.windows = windows or {}
+        self.dimension_keys = dimension_keys or {}
+        self.converted_measures = frozenset(converted_measures)
+        self.stars = stars or {fact: [fact] for fact in facts}
+
+    @property
+    def dimensions(self) -> Tuple[str, ...]:
+        names = {}
+        for model in self.facts.values():
+            names.update(dict.fromkeys(model.dimensions))
+        return tuple(names)
+
+    @property
+    def measures(self) -> Tuple[str, ...]:
+        names = {}
+        for model in self.facts.values():
+            names.update(dict.fromkeys(model.measures))
+        names.update(dict.fromkeys(self.windows))
+        return tuple(name for name in names if name not in self.converted_measures)
+
+    def fact_of(self, measure: str) -> str:
+        """Fact table a measure is computed on; the primary fact if several have it."""
+        if measure in self.windows:
+            measure = self.windows[measure].measure
+        for fact, model in self.facts.items():
+            if measure in model.measures:
+                return fact
+        raise KeyError(measure)
+
+    def _plan(
+        self, dimensions: Sequence[str], measures: Sequence[str], filters: Sequence[Callable]
+    ) -> Dict[str, List[str]]:
+        """Measures per fact table, checking the facts share dimensions and filters."""
+        groups: Dict[str, List[str]] = {}
+        for measure in measures:
+            groups.setdefault(self.fact_of(measure), []).append(measure)
+
+        needed = list(dimensions) + [
+            f.dimension for f in filters if getattr(f, "dimension", None)
+        ]
+        if not groups:
+            # Dimension-only queries run on the first fact that has them all
+            for fact, model in self.facts.items():
+                if all(name in model.dimensions for name in needed):
+                    return {fact: []}
+            return {next(iter(self.facts)): []}
+
+        if len(groups) > 1:
+            for fact in groups:
+                missing = [n for n in needed if n not in self.facts[fact].dimensions]
+                if missing:
+                    raise ValueError(
+                        f"Dimension {missing[0]} is not available for the measures of "
+                        f"{fact} ({', '.join(groups[fact])}); measures of different "
+                        f"fact tables can only be combined on shared dimensions"
+                    )
+        return groups
+
+    def query(
+        self,
+        dimensions: Optional[Sequence[str]] = None,
+        measures: Optional[Sequence[str]] = None,
+        filters: Optional[list] = None,
+        order_by: Optional[Sequence[Tuple[str, str]]] = None,
+        limit: Optional[int] = None,
+    ):
+        """Same as `SemanticModel.query`; returns an Ibis table when drilling across
+        or computing window measures."""
+        from boring_semantic_layer import to_untagged
+
+        windows = {m: self.windows[m] for m in measures or [] if m in self.windows}
+        if windows:
+            return self._query_windows(
+                windows, dimensions or [], measures, filters, order_by, limit
+            )
+
+        groups = self._plan(dimensions or [], measures or [], filters or [])
+        if len(groups) == 1:
+            fact, fact_measures = next(iter(groups.items()))
+            return self.facts[fact].query(
+                dimensions=dimensions,
+                measures=fact_measures or None,
+                filters=filters,
+                order_by=order_by,
+                limit=limit,
+            )
+
+        merged = _merge(
+            [
+                to_untagged(
+                    self.facts[fact].query(
+                        dimensions=dimensions, measures=fact_measures, filters=filters
+                    )
+                )
+                for fact, fact_measures in groups.items()
+            ],
+            list(dimensions or []),
+        )
+        # Keep the requested column order: dimensions, then measures
+        return order_and_limit(
+            merged.select(*(dimensions or []), *measures), order_by, limit
+        )
+
+    def _query_windows(
+        self,
+        windows: Dict[str, WindowMeasure],
+        dimensions: Sequence[str],
+        measures: Sequence[str],
+        filters: Optional[list],
+        order_by: Optional[Sequence[Tuple[str, str]]],
+        limit: Optional[int],
+    ) -> ir.Table:
+        """Aggregate without order and limit, then add the window measures."""
+        from boring_semantic_layer import SemanticTable, to_untagged
+        from semantics.window_measures import apply_window_measures, window_columns
+
+        extra_dimensions, base_measures = window_columns(windows, dimensions)
+        grain = list(dimensions) + extra_dimensions
+        aggregated = self.query(
+            dimensions=grain or None,
+            measures=list(dict.fromkeys(
+                [m for m in measures if m not in windows] + base_measures
+            )),
+            filters=filters,
+        )
+        if isinstance(aggregated, SemanticTable):
+            aggregated = to_untagged(aggregated)
+
+        # Windows see every aggregated row; order and limit apply afterwards
+        result = apply_window_measures(aggregated, windows, grain)
+        return order_and_limit(result.select(*dimensions, *measures), order_by, limit)
+
+
+def order_and_limit(table: ir.Table, order_by, limit) -> ir.Table:
+    """Apply `SemanticModel.query`-style order_by pairs and a limit to an Ibis table."""
+    import ibis
+
+    if order_by:
+        table = table.order_by(
+            [ibis.desc(name) if direction == "desc" else ibis.asc(name) for name, direction in order_by]
+        )
+    if limit:
+        table = table.limit(limit)
+    return table
+
+
+# Delivery lead time per order with the line revenue, by year
+_NAIVE_JOIN_SQL = """
+SELECT
+  d.year,
+  COUNT(*) AS ordersPlaced,
+  AVG(date_diff('day', TRY_CAST(o.order_date AS DATE), TRY_CAST(o.delivery_date AS DATE))) AS avgDeliveryDays,
+  SUM(r.net_price * r.quantity) AS orderLineNetRevenue
+FROM "{ds}".orders AS o
+JOIN "{ds}".orderrows AS r ON r.order_key = o.order_key
+LEFT JOIN "{ds}".dim_date AS d ON o.order_date = d.date
+GROUP BY 1
+ORDER BY 1
+"""
+
+
+if __name__ == "__main__":
+    import statistics
+    import time
+    from semantics.query_builder import QueryRequest
+    from semantics.runtime import SemanticRuntime
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-r", "--repeat", default=20, type=int)
+    args = parser.parse_args()
+
+    runtime = SemanticRuntime(args.pipeline if args.pipeline else PIPELINE_NAME)
+    request = QueryRequest(
+        measures=["ordersPlaced", "avgDeliveryDays", "orderLineNetRevenue"],
+        dimensions=["year"],
+        order={"year": "asc"},
+        limit=None,
+    )
+    naive_sql = _NAIVE_JOIN_SQL.format(ds=runtime.metadata.dataset_name)
+
+    def _time(run) -> float:
+        run()
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run()
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples) * 1000
+
+    drill_across = runtime.execute(request)
+    naive = runtime.executor.start().execute(naive_sql)
+    print("drill-across:\n", drill_across.to_string(index=False))
+    print("naive join (ordersPlaced and avgDeliveryDays weighted by lines):\n",
+          naive.to_string(index=False))
+    print(f"drill-across: {_time(lambda: runtime.execute(request)):.1f} ms, "
+          f"naive join: {_time(lambda: runtime.executor.start().execute(naive_sql)):.1f} ms")
@@ -0,0 +1,533 @@
+"""Execution of compiled semantic queries on DuckDB or PostgreSQL.
+
+BSL queries are compiled to SQL with Ibis and run on a cursor of a shared,
+read-only DuckDB connection instead of going through the dlt dataset. Every
+cursor can run in its own thread and be interrupted on its own, so servers can
+execute queries in parallel and cancel a single slow query without touching
+the others.
+
+With the PostgreSQL backend (see `warehouse.py`) queries are compiled to the
+postgres dialect and run on pooled psycopg connections, one per running query.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Optional
+import threading
+import duckdb
+
+# Ibis, BSL, dlt and pandas are imported lazily so servers can start (and
+# answer metadata requests) before the semantic model is compiled.
+if TYPE_CHECKING:
+    import dlt
+    import pandas as pd
+    import pyarrow as pa
+    from semantics.model_cache import ModelMetadata
+
+
+# Idle PostgreSQL connections kept for reuse by the next queries
+POSTGRES_IDLE_CONNECTIONS = 8
+# Seconds between the repeated interrupts of a query that has not stopped yet
+INTERRUPT_RETRY_INTERVAL = 0.1
+
+
+class QueryInterruptedError(RuntimeError):
+    """Raised when a running query was interrupted (e.g. after a timeout)."""
+
+
+def database_path(pipeline: dlt.Pipeline) -> str:
+    """Return the database readers should query.
+
+    In snapshot mode this is the most recently published snapshot, with the
+    Parquet backend the published lake directory (see `semantics.snapshots`),
+    with the PostgreSQL backend the warehouse URL, otherwise the file the
+    pipeline loads into.
+    """
+    from semantics.snapshots import published_database
+
+    return (
+        published_database(pipeline.pipeline_name)
+        or pipeline.destination_client().config.credentials.database
+    )
+
+
+def staging_database(pipeline: dlt.Pipeline) -> str:
+    """Return the DuckDB file holding the pipeline's latest load.
+
+    In snapshot mode this is the most recent snapshot, otherwise the file the
+    pipeline loads into. The post-load tools (data-quality checks, exchange
+    rates, layout) work on it whatever storage the readers query; with the
+    PostgreSQL or Parquet backend `database_path` is not a DuckDB file.
+    """
+    from constants import DUCKDB_SNAPSHOTS
+    from semantics.snapshots import current_snapshot
+
+    return (
+        DUCKDB_SNAPSHOTS and current_snapshot(pipeline.pipeline_name)
+    ) or pipeline.destination_client().config.credentials.database
+
+
+def compile_query(query, dialect: str = "duckdb") -> str:
+    """Compile a BSL query (as returned by build_semantic_query) to SQL.
+
+    Drill-across queries are already plain Ibis tables.
+    """
+    from boring_semantic_layer import SemanticTable, to_untagged
+    import ibis
+
+    if isinstance(query, SemanticTable):
+        query = to_untagged(query)
+    return ibis.to_sql(query, dialect=dialect)
+
+
+def _result_schema(schema: pa.Schema) -> pa.Schema:
+    """`schema` with DECIMAL and HUGEINT fields (e.g. integer sums) as double and
+    ENUM fields as strings, which pandas and Parquet readers handle everywhere."""
+    import pyarrow as pa
+
+    fields = []
+    for field in schema:
+        if pa.types.is_decimal(field.type):
+            field = field.with_type(pa.float64())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(field.type.value_type)
+        fields.append(field)
+    return pa.schema(fields)
+
+
+class RunningQuery:
+    """A single query execution bound to its own DuckDB cursor.
+
+    `execute` blocks the calling thread; `progress` and `interrupt` are safe to
+    call from any other thread while it runs.
+
+    DuckDB drops an interrupt that arrives before the statement started, so
+    once interrupted the query is interrupted again every
+    `INTERRUPT_RETRY_INTERVAL` seconds until it is closed.
+    """
+
+    def __init__(self, cursor: duckdb.DuckDBPyConnection):
+        self._cursor = cursor
+        self._interrupted = threading.Event()
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def execute(self, sql: str, parameters: Optional[List] = None) -> pd.DataFrame:
+        """Run `sql`, binding `parameters` to its `$n` placeholders if given."""
+        try:
+            if self.interrupted:
+                raise QueryInterruptedError("Query was interrupted before it started")
+            return self._cursor.execute(sql, parameters).df()
+        except duckdb.InterruptException as e:
+            raise QueryInterruptedError("Query was interrupted") from e
+        except duckdb.ConversionException as e:
+            # A parameter the column's type cannot hold
+            raise ValueError(str(e)) from e
+        finally:
+            self.close()
+
+    def execute_arrow(self, sql: str, parameters: Optional[List] = None) -> pa.Table:
+        """Like `execute`, but returns the result as an Arrow table."""
+        try:
+            if self.interrupted:
+                raise QueryInterruptedError("Query was interrupted before it started")
+            result = self._cursor.execute(sql, parameters).fetch_record_batch().read_all()
+            return result.cast(_result_schema(result.schema))
+        except duckdb.InterruptException as e:
+            raise QueryInterruptedError("Query was interrupted") from e
+        except duckdb.ConversionException as e:
+            # A parameter the column's type cannot hold
+            raise ValueError(str(e)) from e
+        finally:
+            self.close()
+
+    def write_parquet(
+        self,
+        sql: str,
+        path: str,
+        parameters: Optional[List] = None,
+        batch_rows: int = 100000,
+        offset: int = 0,
+    ) -> int:
+        """Stream the result to a Parquet file, one row group per batch; return its rows.
+
+        The first `offset` rows of the result are skipped.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            if self.interrupted:
+                raise QueryInterruptedError("Query was interrupted before it started")
+            reader = self._cursor.execute(sql, parameters).fetch_record_batch(batch_rows)
+            schema = _result_schema(reader.schema)
+            rows = 0
+            with pq.ParquetWriter(path, schema) as writer:
+                for batch in reader:
+                    if offset >= batch.num_rows:
+                        offset -= batch.num_rows
+                        continue
+                    batch, offset = batch.slice(offset), 0
+                    writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+                    rows += batch.num_rows
+            return rows
+        except duckdb.InterruptException as e:
+            raise QueryInterruptedError("Query was interrupted") from e
+        except duckdb.ConversionException as e:
+            # A parameter the column's type cannot hold
+            raise ValueError(str(e)) from e
+        except OSError as e:
+            # Interrupts while streaming surface through the Arrow reader
+            if self.interrupted:
+                raise QueryInterruptedError("Query was interrupted") from e
+            raise
+        finally:
+            self.close()
+
+    def progress(self) -> Optional[float]:
+        """Percentage of the query completed, or None if DuckDB cannot tell."""
+        try:
+            value = self._cursor.query_progress()
+        except duckdb.Error:
+            return None
+        return value if value >= 0 else None
+
+    def interrupt(self) -> None:
+        with self._lock:
+            repeat = not self._interrupted.is_set() and not self._closed.is_set()
+            self._interrupted.set()
+            self._cancel()
+        if repeat:
+            threading.Thread(
+                target=self._repeat_interrupt, name="query-interrupt", daemon=True
+            ).start()
+
+    def _repeat_interrupt(self) -> None:
+        while not self._closed.wait(INTERRUPT_RETRY_INTERVAL):
+            with self._lock:
+                if not self._closed.is_set():
+                    self._cancel()
+
+    def _cancel(self) -> None:
+        """Interrupt the statement running now, if any; called holding the lock."""
+        try:
+            self._cursor.interrupt()
+        except duckdb.Error:
+            # The cursor is already closed, i.e. the query finished meanwhile
+            pass
+
+    @property
+    def interrupted(self) -> bool:
+        return self._interrupted.is_set()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed.set()
+            try:
+                self._cursor.close()
+            except duckdb.Error:
+                pass
+
+
+class QueryExecutor:
+    """Runs compiled semantic queries against a DuckDB database file.
+
+    The connection is opened read-only on first use and shared by all callers;
+    each query gets a fresh cursor from it.
+    """
+
+    # SQL dialect queries for this executor are compiled to
+    dialect = "duckdb"
+
+    def __init__(self, database: str, threads: Optional[int] = None):
+        self.database = database
+        self.threads = threads
+        self._connection: Optional[duckdb.DuckDBPyConnection] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pipeline(cls, pipeline: dlt.Pipeline, **kwargs) -> QueryExecutor:
+        return cls(database_path(pipeline), **kwargs)
+
+    @staticmethod
+    def from_metadata(metadata: ModelMetadata, **kwargs) -> QueryExecutor:
+        """Executor for the storage backend the model metadata was compiled for."""
+        if metadata.storage == "postgres":
+            return PostgresQueryExecutor(metadata.database, **kwargs)
+        if metadata.storage == "parquet":
+            return LakeQueryExecutor(
+                metadata.database,
+                dataset_name=metadata.dataset_name,
+                table_names=list(metadata.tables),
+                **kwargs,
+            )
+        return QueryExecutor(metadata.database, **kwargs)
+
+    def _connect(self) -> duckdb.DuckDBPyConnection:
+        config = {"threads": self.threads} if self.threads else {}
+        return duckdb.connect(self.database, read_only=True, config=config)
+
+    @property
+    def connection(self) -> duckdb.DuckDBPyConnection:
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect()
+            return self._connection
+
+    def start(self) -> RunningQuery:
+        """Create a RunningQuery on a new cursor with progress tracking enabled."""
+        cursor = self.connection.cursor()
+        cursor.execute("SET enable_progress_bar = true")
+        cursor.execute("SET enable_progress_bar_print = false")
+        return RunningQuery(cursor)
+
+    def execute(self, query) -> pd.DataFrame:
+        """Compile and execute a BSL query, returning a pandas DataFrame."""
+        return self.start().execute(compile_query(query, self.dialect))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class LakeQueryExecutor(QueryExecutor):
+    """Runs compiled semantic queries against a published Parquet lake snapshot.
+
+    The tables are views over the Parquet files in a private in-memory
+    database, so no database file is locked.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        dataset_name: str,
+        table_names: List[str],
+        threads: Optional[int] = None,
+    ):
+        super().__init__(database, threads=threads)
+        self.dataset_name = dataset_name
+        self.table_names = table_names
+
+    def _connect(self) -> duckdb.DuckDBPyConnection:
+        from semantics.lake import create_lake_views
+
+        config = {"threads": self.threads} if self.threads else {}
+        connection = duckdb.connect(config=config)
+        create_lake_views(connection, self.dataset_name, self.table_names, self.database)
+        return connection
+
+
+def _arrow_type(type_info) -> Optional[pa.DataType]:
+    """Arrow type of a PostgreSQL result column, or None for types kept as text.
+
+    Numerics come back as floats (see `PostgresQueryExecutor`), as from DuckDB.
+    """
+    import pyarrow as pa
+
+    return {
+        "bool": pa.bool_(),
+        "int2": pa.int16(),
+        "int4": pa.int32(),
+        "int8": pa.int64(),
+        "float4": pa.float32(),
+        "float8": pa.float64(),
+        "numeric": pa.float64(),
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+        "timestamptz": pa.timestamp("us", tz="UTC"),
+        "text": pa.string(),
+        "varchar": pa.string(),
+        "bpchar": pa.string(),
+        "name": pa.string(),
+    }.get(type_info.name if type_info is not None else None)
+
+
+class PostgresRunningQuery(RunningQuery):
+    """A single query execution on a pooled PostgreSQL connection.
+
+    Postgres reports no progress; `interrupt` cancels the query on the server,
+    but only once its statement was sent and until the query is closed: the
+    connection goes back to the executor's pool then and may run another
+    query.
+    """
+
+    def __init__(self, executor: PostgresQueryExecutor, connection):
+        self._executor = executor
+        self._connection = connection
+        self._executing = False
+        self._interrupted = threading.Event()
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def _execute(self, cursor, sql: str, parameters: Optional[List]) -> None:
+        with self._lock:
+            self._executing = True
+        cursor.execute(sql, parameters)
+
+    def _fetch(self, sql: str, parameters: Optional[List]) -> pd.DataFrame:
+        import pandas as pd
+        import psycopg
+
+        try:
+            if self.interrupted:
+                raise QueryInterruptedError("Query was interrupted before it started")
+            # Raw cursors bind the plans' `$n` placeholders server-side
+            with psycopg.RawCursor(self._connection) as cursor:
+                self._execute(cursor, sql, parameters)
+                columns = [column.name for column in cursor.description]
+                return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+        except psycopg.errors.QueryCanceled as e:
+            raise QueryInterruptedError("Query was interrupted") from e
+        except psycopg.DataError as e:
+            # A parameter the column's type cannot hold
+            raise ValueError(str(e)) from e
+        finally:
+            self.close()
+
+    def execute(self, sql: str, parameters: Optional[List] = None) -> pd.DataFrame:
+        return self._fetch(sql, parameters)
+
+    def execute_arrow(self, sql: str, parameters: Optional[List] = None) -> pa.Table:
+        import pyarrow as pa
+
+        return pa.Table.from_pandas(self._fetch(sql, parameters), preserve_index=False)
+
+    def write_parquet(
+        self,
+        sql: str,
+        path: str,
+        parameters: Optional[List] = None,
+        batch_rows: int = 100000,
+        offset: int = 0,
+    ) -> int:
+        """Stream the result from a server-side cursor to a Parquet file, one row
+        group per batch; return its rows.
+
+        The first `offset` rows of the result are skipped on the server.
+        """
+        import psycopg
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            if self.interrupted:
+                raise QueryInterruptedError("Query was interrupted before it started")
+            # Server-side cursors only live inside a transaction
+            with self._connection.transaction(), psycopg.RawServerCursor(
+                self._connection, "job_result"
+            ) as cursor:
+                self._execute(cursor, sql, parameters)
+                if offset:
+                    cursor.scroll(offset)
+                types = [
+                    _arrow_type(self._connection.adapters.types.get(column.type_code))
+                    for column in cursor.description
+                ]
+                schema = pa.schema(
+                    [
+                        (column.name, arrow_type or pa.string())
+                        for column, arrow_type in zip(cursor.description, types)
+                    ]
+                )
+                rows = 0
+                with pq.ParquetWriter(path, schema) as writer:
+                    while batch := cursor.fetchmany(batch_rows):
+                        columns = []
+                        for values, arrow_type in zip(zip(*batch), types):
+                            if arrow_type is None:
+                                # Intervals, UUIDs, JSON etc. as their text
+                                values = [None if v is None else str(v) for v in values]
+                            columns.append(pa.array(values, type=arrow_type or pa.string()))
+                        writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                        rows += len(batch)
+            return rows
+        except psycopg.errors.QueryCanceled as e:
+            raise QueryInterruptedError("Query was interrupted") from e
+        except psycopg.DataError as e:
+            # A parameter the column's type cannot hold
+            raise ValueError(str(e)) from e
+        finally:
+            self.close()
+
+    def progress(self) -> Optional[float]:
+        return None
+
+    def _cancel(self) -> None:
+        import psycopg
+
+        if not self._executing or self._connection is None:
+            return
+        try:
+            self._connection.cancel()
+        except psycopg.Error:
+            # The query finished meanwhile
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed.set()
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            self._executor.release(connection)
+
+
+class PostgresQueryExecutor(QueryExecutor):
+    """Runs compiled semantic queries against the PostgreSQL warehouse.
+
+    psycopg and its connections are only loaded on first use. Each running
+    query takes a connection from a small pool of idle ones, or opens a new
+    one, so queries run in parallel; `threads` sets the parallel workers per
+    query.
+    """
+
+    dialect = "postgres"
+
+    def __init__(self, database: str, threads: Optional[int] = None):
+        super().__init__(database, threads=threads)
+        self._idle: List = []
+
+    def _connect(self):
+        import psycopg
+        from psycopg.types.numeric import FloatLoader
+
+        connection = psycopg.connect(self.database, autocommit=True)
+        # Numeric sums come back as floats, as from DuckDB, instead of Decimals
+        connection.adapters.register_loader("numeric", FloatLoader)
+        if self.threads:
+            connection.execute(
+                f"SET max_parallel_workers_per_gather = {int(self.threads)}"
+            )
+        return connection
+
+    @property
+    def connection(self):
+        """An idle pooled connection, opened if there is none yet."""
+        with self._lock:
+            if not self._idle:
+                self._idle.append(self._connect())
+            return self._idle[-1]
+
+    def start(self) -> PostgresRunningQuery:
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None or connection.closed:
+            connection = self._connect()
+        return PostgresRunningQuery(self, connection)
+
+    def release(self, connection) -> None:
+        """Return a connection to the pool, or close it if the pool is full."""
+        with self._lock:
+            if connection.broken or connection.closed:
+                return
+            if len(self._idle) < POSTGRES_IDLE_CONNECTIONS:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
@@ -0,0 +1,373 @@
+"""Asynchronous query jobs with their results persisted as Parquet files.
+
+Full customer-level exports or multi-year daily breakdowns run longer than an
+HTTP or MCP request may take. They are submitted as jobs instead: the
+request is admitted against the job budgets right away and queued, and the
+caller polls the job for its status and progress and then reads its result
+in ranges or downloads it.
+
+Each server runs a `JobManager` with `JOB_WORKERS` worker threads taking the
+queued jobs by priority (lower runs first), then in order of submission; at
+most `JOB_QUEUE_SIZE` jobs wait. A job runs on the runtime current when it
+starts and streams its result from DuckDB into `<job>.parquet` in `JOB_DIR`,
+one row group per batch, so ranges only read the row groups they cover.
+
+The state of a job is a JSON file next to its result, so every server process
+sharing `JOB_DIR` can report on and serve any job. Cancelling a job of
+another process leaves a marker file that its owner picks up. Jobs of a
+process that died are reported as failed. Finished jobs and their results are
+removed `JOB_RETENTION` seconds after they finished.
+"""
+
+from __future__ import annotations
+
+from constants import (
+    JOB_DIR,
+    JOB_MAX_GROUPS,
+    JOB_MAX_RESULT_ROWS,
+    JOB_MAX_SCAN_ROWS,
+    JOB_QUEUE_SIZE,
+    JOB_RETENTION,
+    JOB_WORKERS,
+)
+from semantics.model_cache import write_atomic
+from semantics.query_builder import QueryRequest
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from semantics.execution import RunningQuery
+    from semantics.reload import ReloadingRuntime
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress updates and checks for cancellations of running jobs
+PROGRESS_INTERVAL = 1.0
+# Rows per Parquet row group of a result
+BATCH_ROWS = 100000
+# Priority of jobs submitted without one; lower runs first
+DEFAULT_PRIORITY = 5
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when a job is submitted while `JOB_QUEUE_SIZE` jobs are waiting."""
+
+
+class JobNotFoundError(KeyError):
+    """Raised for unknown job ids, including expired jobs."""
+
+
+class Job(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    priority: int
+    request: QueryRequest
+    pid: int
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Set when the job finishes, from the retention of the manager running it
+    expires_at: Optional[float] = None
+    generation: Optional[str] = None
+    progress: Optional[float] = None
+    row_count: Optional[int] = None
+    size_bytes: Optional[int] = None
+    notice: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_result_range(path: str, offset: int, limit: int) -> pa.Table:
+    """Rows `offset` to `offset + limit` of a Parquet file, reading only their row groups."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    metadata = parquet.metadata
+    row_groups, first_row, start = [], None, 0
+    for i in range(metadata.num_row_groups):
+        rows = metadata.row_group(i).num_rows
+        if start + rows > offset and start < offset + limit:
+            row_groups.append(i)
+            if first_row is None:
+                first_row = start
+        start += rows
+    if not row_groups:
+        return parquet.schema_arrow.empty_table()
+    table = parquet.read_row_groups(row_groups)
+    return table.slice(offset - first_row, limit)
+
+
+class JobManager:
+    """Queue and worker threads running the query jobs of one server process.
+
+    Args:
+        runtime: The server's runtime; each job runs on its current model.
+        workers: Jobs running at the same time.
+        queue_size: Jobs that may wait; more are rejected with JobQueueFullError.
+        directory: Where job states and results are kept.
+        retention: Seconds finished jobs are kept.
+    """
+
+    def __init__(
+        self,
+        runtime: ReloadingRuntime,
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+        directory: str = JOB_DIR,
+        retention: float = JOB_RETENTION,
+    ):
+        self.runtime = runtime
+        self.workers = workers
+        self.directory = directory
+        self.retention = retention
+        self._queue: queue.PriorityQueue = queue.PriorityQueue(maxsize=queue_size)
+        self._sequence = itertools.count()
+        self._running: Dict[str, RunningQuery] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stopped = threading.Event()
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{job_id}{suffix}")
+
+    def result_path(self, job_id: str) -> str:
+        return self._path(job_id, ".parquet")
+
+    def _save(self, job: Job) -> None:
+        write_atomic(self._path(job.id, ".json"), job.model_dump_json())
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        try:
+            with open(self._path(job_id, ".json"), "r", encoding="utf-8") as f:
+                return Job.model_validate_json(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _start(self) -> None:
+        """Start the workers and the progress monitor on the first submitted job."""
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f"query-job-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            self._threads.append(
+                threading.Thread(target=self._monitor, name="query-job-monitor", daemon=True)
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, query_request: QueryRequest, priority: int = DEFAULT_PRIORITY) -> Job:
+        """Admit and queue a query request.
+
+        Raises QueryRejectedError, a ValueError for invalid requests, e.g. a
+        filter value the dimension's type cannot hold, or JobQueueFullError.
+        """
+        runtime = self.runtime.current
+        admission = runtime.admit(
+            query_request,
+            max_groups=JOB_MAX_GROUPS,
+            max_scan_rows=JOB_MAX_SCAN_ROWS,
+            max_result_rows=JOB_MAX_RESULT_ROWS,
+        )
+        # Fails now rather than once the job runs; the plan is cached for the run
+        runtime.plans.compile(admission.query)
+        os.makedirs(self.directory, exist_ok=True)
+        self.prune()
+        self._start()
+
+        job = Job(
+            id=uuid.uuid4().hex,
+            status="queued",
+            priority=priority,
+            request=admission.query,
+            pid=os.getpid(),
+            submitted_at=time.time(),
+            notice=admission.notice,
+        )
+        self._save(job)
+        try:
+            self._queue.put_nowait((priority, next(self._sequence), job.id))
+        except queue.Full:
+            self._remove(job.id)
+            raise JobQueueFullError(
+                f"{self._queue.maxsize} jobs are already waiting; try again later"
+            )
+        return job
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status, job.finished_at = status, time.time()
+        job.expires_at = job.finished_at + self.retention
+
+    def get(self, job_id: str) -> Job:
+        """The current state of a job of any process sharing the job directory."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = self._load(job_id)
+        if job is None or (job.expires_at and job.expires_at < time.time()):
+            raise JobNotFoundError(job_id)
+        if not job.finished and job.pid != os.getpid() and not _process_alive(job.pid):
+            job.status, job.error = "failed", "The server running the job stopped"
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """Cancel a queued or running job; finished jobs are returned unchanged."""
+        job = self.get(job_id)
+        if job.finished:
+            return job
+        with self._lock:
+            running = self._running.get(job_id)
+        if running is not None:
+            running.interrupt()
+            return job
+        # Queued here or in another process; running elsewhere, its owner
+        # interrupts it when it sees the marker
+        with open(self._path(job_id, ".cancel"), "w"):
+            pass
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+            self._save(job)
+        return job
+
+    def delete(self, job_id: str) -> None:
+        """Cancel a job and remove its state and result."""
+        self.cancel(job_id)
+        self._remove(job_id)
+
+    def _remove(self, job_id: str) -> None:
+        for suffix in (".json", ".parquet", ".cancel"):
+            try:
+                os.remove(self._path(job_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def prune(self) -> List[str]:
+        """Remove the jobs whose expiry time passed.
+
+        Job states written without one expire `retention` seconds after the
+        job finished.
+        """
+        removed = []
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return removed
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            job = self._load(entry.name[: -len(".json")])
+            if job is None or not job.finished_at:
+                continue
+            if (job.expires_at or job.finished_at + self.retention) < now:
+                self._remove(job.id)
+                removed.append(job.id)
+        return removed
+
+    def _work(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                _, _, job_id = self._queue.get(timeout=PROGRESS_INTERVAL)
+            except queue.Empty:
+                continue
+            job = self._load(job_id)
+            if job is None or job.status != "queued":
+                # Cancelled (or deleted) while it was waiting
+                continue
+            if os.path.exists(self._path(job_id, ".cancel")):
+                self._finish(job, "cancelled")
+                self._save(job)
+                continue
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        from semantics.execution import QueryInterruptedError
+
+        runtime = self.runtime.current
+        path = self.result_path(job.id)
+        partial = f"{path}.partial"
+        job.status, job.started_at, job.generation = "running", time.time(), runtime.generation
+        running = None
+        with self._lock:
+            self._jobs[job.id] = job
+            self._save(job)
+        try:
+            sql, parameters = runtime.compile(job.request)
+            running = runtime.executor.start()
+            with self._lock:
+                self._running[job.id] = running
+            if os.path.exists(self._path(job.id, ".cancel")):
+                running.interrupt()
+            job.row_count = running.write_parquet(
+                sql, partial, parameters, BATCH_ROWS, offset=job.request.offset or 0
+            )
+            os.replace(partial, path)
+            runtime.record(job.request)
+            job.status, job.progress = "succeeded", 100.0
+            job.size_bytes = os.path.getsize(path)
+        except QueryInterruptedError:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.exception("Query job %s failed", job.id)
+            job.status, job.error = "failed", str(e)
+        finally:
+            if running is not None:
+                running.close()
+            if job.status != "succeeded" and os.path.exists(partial):
+                os.remove(partial)
+            self._finish(job, job.status)
+            with self._lock:
+                self._jobs.pop(job.id, None)
+                self._running.pop(job.id, None)
+                self._save(job)
+
+    def _monitor(self) -> None:
+        """Record the progress of running jobs and interrupt cancelled ones."""
+        while not self._stopped.wait(PROGRESS_INTERVAL):
+            with self._lock:
+                running = list(self._running.items())
+            for job_id, query in running:
+                if os.path.exists(self._path(job_id, ".cancel")):
+                    query.interrupt()
+                    continue
+                progress = query.progress()
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                    if job is not None and progress is not None and progress != job.progress:
+                        job.progress = progress
+                        self._save(job)
+
+    def stop(self) -> None:
+        """Stop taking jobs and interrupt the running ones."""
+        self._stopped.set()
+        with self._lock:
+            running = list(self._running.values())
+        for query in running:
+            query.interrupt()
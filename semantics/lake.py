@@ -0,0 +1,167 @@
+"""Hive-partitioned Parquet lake as an alternative storage backend.
+
+With `STORAGE_BACKEND = "parquet"` the pipeline exports every loaded table to
+Parquet after each run, partitioned as configured in `LAKE_PARTITIONS`, e.g.
+`fact_sales/order_date_year=2016/data_0.parquet`. Each export is a snapshot
+directory published like the DuckDB snapshots (see `semantics.snapshots`).
+
+Readers query the files through views in an in-memory DuckDB database, so they
+hold no lock on any database file and any number of processes or nodes sharing
+`LAKE_DIR` can serve queries at the same time.
+
+A partitioned column gets a sibling column named `<column>_<transform>` that
+holds the partition key. Filters on the column are extended with a predicate
+on that key (see `partition_predicates`), which lets DuckDB skip whole
+partition directories instead of only row groups.
+"""
+
+from __future__ import annotations
+
+from constants import LAKE_DIR, LAKE_PARTITIONS
+from datetime import date
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+import operator
+import os
+
+if TYPE_CHECKING:
+    import duckdb
+    import ibis.expr.types as ir
+
+# SQL computing the partition key from a (DATE or ISO date string) column
+PARTITION_TRANSFORMS = {
+    "year": "year(TRY_CAST({column} AS DATE))",
+    "month": "year(TRY_CAST({column} AS DATE)) * 100 + month(TRY_CAST({column} AS DATE))",
+}
+
+# The same keys computed from an Ibis date expression
+_PARTITION_KEYS = {
+    "year": lambda d: d.year(),
+    "month": lambda d: d.year() * 100 + d.month(),
+}
+
+# Both transforms are monotonic, so range filters map to inclusive key ranges
+_PARTITION_OPERATORS = {
+    "=": operator.eq,
+    ">": operator.ge,
+    ">=": operator.ge,
+    "<": operator.le,
+    "<=": operator.le,
+}
+
+
+def partition_column(column: str, transform: str) -> str:
+    return f"{column}_{transform}"
+
+
+def _table_glob(path: str, table_name: str) -> str:
+    return os.path.join(path, table_name, "**", "*.parquet")
+
+
+def export_lake(
+    connection: duckdb.DuckDBPyConnection,
+    dataset_name: str,
+    table_names: Iterable[str],
+    path: str,
+    partitions: Dict[str, Tuple[str, str]] = LAKE_PARTITIONS,
+) -> None:
+    """Write each table of the loaded DuckDB dataset to `path` as Parquet."""
+    os.makedirs(path, exist_ok=True)
+    for table_name in table_names:
+        source = f'"{dataset_name}"."{table_name}"'
+        target = os.path.join(path, table_name)
+        spec = partitions.get(table_name)
+        if spec is None:
+            os.makedirs(target, exist_ok=True)
+            connection.execute(
+                f"COPY {source} TO '{os.path.join(target, 'data_0.parquet')}' "
+                "(FORMAT PARQUET)"
+            )
+            continue
+
+        column, transform = spec
+        key = partition_column(column, transform)
+        key_expr = PARTITION_TRANSFORMS[transform].format(column=f'"{column}"')
+        connection.execute(
+            f'COPY (SELECT *, {key_expr} AS "{key}" FROM {source}) TO \'{target}\' '
+            f'(FORMAT PARQUET, PARTITION_BY ("{key}"))'
+        )
+
+
+def create_lake_views(
+    connection: duckdb.DuckDBPyConnection,
+    dataset_name: str,
+    table_names: Iterable[str],
+    path: str,
+) -> None:
+    """Expose the lake tables as `dataset_name.table_name` views on `connection`."""
+    connection.execute(f'CREATE SCHEMA IF NOT EXISTS "{dataset_name}"')
+    for table_name in table_names:
+        hive = "true" if table_name in LAKE_PARTITIONS else "false"
+        connection.execute(
+            f'CREATE OR REPLACE VIEW "{dataset_name}"."{table_name}" AS '
+            f"SELECT * FROM read_parquet('{_table_glob(path, table_name)}', "
+            f"hive_partitioning = {hive})"
+        )
+
+
+def lake_tables(
+    pipeline_name: str, dataset_name: str, table_names: Iterable[str]
+) -> Dict[str, ir.Table]:
+    """Ibis tables over the published lake snapshot of the pipeline."""
+    from semantics.snapshots import current_snapshot
+    import ibis
+
+    path = current_snapshot(pipeline_name, LAKE_DIR)
+    if path is None:
+        raise RuntimeError(
+            f"No Parquet lake published for pipeline '{pipeline_name}' in "
+            f"{LAKE_DIR}; run pipeline.py with VERO_STORAGE_BACKEND=parquet"
+        )
+
+    table_names = list(table_names)
+    con = ibis.duckdb.connect()
+    create_lake_views(con.con, dataset_name, table_names, path)
+    return {
+        table_name: con.table(table_name, database=dataset_name)
+        for table_name in table_names
+    }
+
+
+def source_column(expr) -> Optional[str]:
+    """Name of the table column a dimension expression refers to, if it is one."""
+    import ibis.expr.operations as ops
+
+    op = expr.op()
+    while isinstance(op, ops.Alias):
+        op = op.arg
+    return op.name if isinstance(op, ops.Field) else None
+
+
+def partition_predicates(table, expr, operator_name: str, value, literal=None) -> List:
+    """Predicates on partition keys implied by filtering `expr` with `operator_name`.
+
+    `table` is the (joined) table the filter is applied to; the predicates are
+    only produced when it has a partition key column for the filtered column,
+    i.e. when the model was built on the lake, and `value` is an ISO date.
+    The keys are computed in SQL from `literal` (by default the value itself),
+    so a query parameter can stand in for the value.
+    """
+    import ibis
+
+    compare = _PARTITION_OPERATORS.get(operator_name)
+    column = source_column(expr)
+    if compare is None or column is None:
+        return []
+
+    try:
+        date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return []
+    day = ibis.literal(str(value if literal is None else literal)).substr(0, 10).cast("date")
+
+    predicates = []
+    for transform, to_key in _PARTITION_KEYS.items():
+        key = partition_column(column, transform)
+        if key in table.columns:
+            predicates.append(compare(getattr(table, key), to_key(day)))
+    return predicates
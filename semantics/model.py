@@ -8,12 +8,20 @@ Note: dlt's snake_case normalizer converts PascalCase CSV column names:
 All column references below use the normalized snake_case names.
 """
 
-from constants import PIPELINE_NAME
+from constants import PIPELINE_NAME, REPORTING_CURRENCIES, STORAGE_BACKEND
+from semantics.currency import currency_measure, rate_column
+from semantics.drill_across import MultiFactModel
+from semantics.lake import lake_tables
+from semantics.semi_join import dimension_keys
 from semantics.table_references import get_semantic_table_references
+from semantics.window_measures import WindowMeasure
 from boring_semantic_layer import to_semantic_table, SemanticModel
 from typing import Dict, List
+import ibis.expr.datatypes as dt
+import ibis.expr.types as ir
 import copy
 import argparse
+import ibis
 import dlt
 
 
@@ -82,6 +90,26 @@ def _recursive_semantic_join(
     return semantic_model
 
 
+def _star_tables(semantic_table_references, root: str) -> List[str]:
+    """Tables `_recursive_semantic_join` joins from `root`, once per join."""
+    remaining = copy.deepcopy(semantic_table_references)
+    tables = [root]
+
+    def _join(referencing_table: str) -> None:
+        for reference in remaining.pop(referencing_table, []):
+            tables.append(reference["referenced_table"])
+            _join(reference["referenced_table"])
+
+    _join(root)
+    return tables
+
+
+# Root of the main star schema; every query on sales scans it and joins the
+# dimension tables
+FACT_TABLE = "fact_sales"
+# Roots of the stars queried together by drill-across, primary fact first
+FACT_TABLES = [FACT_TABLE, "orders", "orderrows"]
+
 # -- Dimension and measure definitions per table --
 # Column names use dlt's snake_case normalization of the PascalCase CSV headers.
 # Prefixed with {table_name}__ for join uniqueness.
@@ -104,6 +132,28 @@ SEMANTIC_DEFINITIONS = {
             "profit": lambda t: (t.fact_sales__net_price - t.fact_sales__unit_cost * t.fact_sales__quantity).sum(),
         },
     },
+    "orders": {
+        "dimensions": {},
+        "measures": {
+            "ordersPlaced": lambda t: t.count(),
+            "avgDeliveryDays": lambda t: t.orders__delivery_date.try_cast("date")
+            .delta(t.orders__order_date.try_cast("date"), unit="day")
+            .mean(),
+            "maxDeliveryDays": lambda t: t.orders__delivery_date.try_cast("date")
+            .delta(t.orders__order_date.try_cast("date"), unit="day")
+            .max(),
+        },
+    },
+    "orderrows": {
+        "dimensions": {},
+        "measures": {
+            "orderLines": lambda t: t.count(),
+            "orderLineUnits": lambda t: t.orderrows__quantity.sum(),
+            "orderLineRevenue": lambda t: (t.orderrows__unit_price * t.orderrows__quantity).sum(),
+            "orderLineNetRevenue": lambda t: (t.orderrows__net_price * t.orderrows__quantity).sum(),
+            "avgLinesPerOrder": lambda t: t.count() / t.orderrows__order_key.nunique(),
+        },
+    },
     "dim_customer": {
         "dimensions": {
             "surname": lambda t: t.dim_customer__surname,
@@ -160,7 +210,10 @@ SEMANTIC_DEFINITIONS = {
             "date": lambda t: t.dim_date__date,
             "year": lambda t: t.dim_date__year,
             "quarter": lambda t: t.dim_date__quarter,
+            "yearquarter": lambda t: t.dim_date__year_quarter,
+            "yearquarternumber": lambda t: t.dim_date__year_quarter_number,
             "yearmonth": lambda t: t.dim_date__year_month,
+            "yearmonthnumber": lambda t: t.dim_date__year_month_number,
             "month": lambda t: t.dim_date__month,
             "dayofweek": lambda t: t.dim_date__dayof_week,
             "workingday": lambda t: t.dim_date__working_day,
@@ -170,53 +223,210 @@ SEMANTIC_DEFINITIONS = {
 }
 
 
-def create_semantic_model(pipeline: dlt.Pipeline) -> SemanticModel:
-    """Build the full BSL semantic model from the dlt pipeline's loaded data."""
+# Fact table amount measures with a variant per reporting currency, e.g.
+# netRevenueEUR, as (amount in the order's currency, aggregation). The amount is
+# multiplied by the rate materialized at load time (see semantics.currency).
+CURRENCY_MEASURES = {
+    "totalRevenue": (lambda t: t.fact_sales__unit_price * t.fact_sales__quantity, "sum"),
+    "netRevenue": (lambda t: t.fact_sales__net_price, "sum"),
+    "totalCost": (lambda t: t.fact_sales__unit_cost * t.fact_sales__quantity, "sum"),
+    "averageOrderValue": (lambda t: t.fact_sales__net_price, "mean"),
+    "profit": (
+        lambda t: t.fact_sales__net_price - t.fact_sales__unit_cost * t.fact_sales__quantity,
+        "sum",
+    ),
+}
+
+
+# Measures computed with window functions over the aggregated rows (see
+# semantics.window_measures); they need a time dimension like year or yearmonth
+# in the query, except for the shares
+WINDOW_MEASURES = {
+    "netRevenueYoY": WindowMeasure(measure="netRevenue", function="change", unit="year"),
+    "netRevenueYoYGrowth": WindowMeasure(measure="netRevenue", function="growth", unit="year"),
+    "netRevenueMoM": WindowMeasure(measure="netRevenue", function="change", unit="month"),
+    "netRevenueMoMGrowth": WindowMeasure(measure="netRevenue", function="growth", unit="month"),
+    "netRevenueRunningTotal": WindowMeasure(measure="netRevenue", function="running_total"),
+    "netRevenue3MonthAvg": WindowMeasure(
+        measure="netRevenue", function="moving_average", unit="month", periods=3
+    ),
+    "netRevenueShare": WindowMeasure(measure="netRevenue", function="percent_of_total"),
+    "profitYoY": WindowMeasure(measure="profit", function="change", unit="year"),
+    "profitYoYGrowth": WindowMeasure(measure="profit", function="growth", unit="year"),
+    "profitShare": WindowMeasure(measure="profit", function="percent_of_total"),
+    "totalUnitsSoldYoYGrowth": WindowMeasure(
+        measure="totalUnitsSold", function="growth", unit="year"
+    ),
+    "totalUnitsSoldRunningTotal": WindowMeasure(
+        measure="totalUnitsSold", function="running_total"
+    ),
+    "orderCountYoYGrowth": WindowMeasure(measure="orderCount", function="growth", unit="year"),
+    "ordersPlacedMoM": WindowMeasure(measure="ordersPlaced", function="change", unit="month"),
+}
+
+
+def _window_measures(measures) -> Dict[str, WindowMeasure]:
+    """Window measures whose measure is in the model, with converted variants.
+
+    The variants are only reachable through a query's currency, like the
+    converted measures they are computed on.
+    """
+    windows = {}
+    for name, window in WINDOW_MEASURES.items():
+        if window.measure not in measures:
+            continue
+        windows[name] = window
+        for currency in REPORTING_CURRENCIES:
+            converted = currency_measure(window.measure, currency)
+            if converted in measures:
+                windows[currency_measure(name, currency)] = window.model_copy(
+                    update={"measure": converted}
+                )
+    return windows
+
+
+def _currency_measures(table) -> Dict:
+    """Converted measures for the currencies whose rate column was materialized."""
+    measures = {}
+    for currency in REPORTING_CURRENCIES:
+        column = f"{FACT_TABLE}__{rate_column(currency)}"
+        if column not in table.columns:
+            continue
+        for name, (amount, aggregation) in CURRENCY_MEASURES.items():
+            measures[currency_measure(name, currency)] = (
+                lambda t, amount=amount, aggregation=aggregation, column=column: getattr(
+                    amount(t) * getattr(t, column), aggregation
+                )()
+            )
+    return measures
+
+
+def _prepare_table(table, table_name: str):
+    """Drop internal dlt columns and prefix the remaining ones with the table name."""
+    dlt_cols = [c for c in table.columns if c.startswith("_dlt_")]
+    if dlt_cols:
+        table = table.drop(*dlt_cols)
+
+    return _prefix_columns(table, table_name)
+
+
+def build_semantic_model(tables: Dict[str, ir.Table]) -> MultiFactModel:
+    """Build the BSL semantic model from one Ibis table per referenced table name.
+
+    Every fact table in `FACT_TABLES` gets its own star of joins; fact tables
+    referenced from another star are joined with their dimensions only, so
+    their measures are never computed on fanned-out rows. Filters on the
+    dimension tables can be reduced to key predicates (see `semantics.semi_join`).
+    The currency-converted measures are not listed in the model's `measures`.
+    """
     semantic_table_references = get_semantic_table_references()
 
     semantic_model_base: Dict[str, SemanticModel] = {}
+    joined_base: Dict[str, SemanticModel] = {}
+    prepared: Dict[str, ir.Table] = {}
+    converted = set()
 
     for table_name in semantic_table_references.keys():
         defn = SEMANTIC_DEFINITIONS.get(table_name)
-        if defn is None:
+        if defn is None or table_name not in tables:
             continue
 
-        # Get the Ibis table from the dlt pipeline dataset
-        table = (
-            pipeline.dataset()
-            .table(table_name)
-            .to_ibis()
-        )
+        table = prepared[table_name] = _prepare_table(tables[table_name], table_name)
 
-        # Drop internal dlt columns if present
-        dlt_cols = [c for c in table.columns if c.startswith("_dlt_")]
-        if dlt_cols:
-            table = table.drop(*dlt_cols)
+        measures = dict(defn["measures"])
+        if table_name == FACT_TABLE:
+            currency_measures = _currency_measures(table)
+            converted.update(currency_measures)
+            measures.update(currency_measures)
 
-        # Prefix columns with table name
-        table = _prefix_columns(table, table_name)
-
-        st = (
-            to_semantic_table(table)
-            .with_dimensions(**defn["dimensions"])
-            .with_measures(**defn["measures"])
-        )
+        dimensions_only = to_semantic_table(table).with_dimensions(**defn["dimensions"])
+        st = dimensions_only.with_measures(**measures)
 
         semantic_model_base[table_name] = st
+        joined_base[table_name] = dimensions_only if table_name in FACT_TABLES else st
 
-    # Build relationships via recursive joins starting from fact table
-    root = "fact_sales"
-    semantic_model = semantic_model_base[root]
-    refs_copy = copy.deepcopy(semantic_table_references)
+    # Build relationships via recursive joins starting from each fact table
+    facts = {}
+    for root in FACT_TABLES:
+        if root not in semantic_model_base:
+            continue
+        facts[root] = _recursive_semantic_join(
+            copy.deepcopy(semantic_table_references),
+            semantic_model_base[root],
+            joined_base,
+            root,
+        )
 
-    semantic_model = _recursive_semantic_join(
-        refs_copy,
-        semantic_model,
-        semantic_model_base,
-        root,
+    measures = [m for model in facts.values() for m in model.measures]
+    windows = _window_measures(measures)
+    # Only reachable through a query's currency, so the catalog lists each
+    # measure once (see semantics.query_builder._resolve_measure)
+    converted_measures = converted | {
+        name for name, window in windows.items() if window.measure in converted
+    }
+    keys = dimension_keys(
+        prepared, SEMANTIC_DEFINITIONS, semantic_table_references, FACT_TABLES
     )
+    stars = {root: _star_tables(semantic_table_references, root) for root in facts}
+    return MultiFactModel(facts, windows, keys, converted_measures, stars)
+
+
+def load_tables(pipeline: dlt.Pipeline) -> Dict[str, ir.Table]:
+    """Ibis tables for the semantic model from the configured storage backend."""
+    table_names = [
+        table_name
+        for table_name in get_semantic_table_references().keys()
+        if table_name in SEMANTIC_DEFINITIONS
+    ]
+
+    if STORAGE_BACKEND == "parquet":
+        # Read the published Parquet lake instead of the DuckDB database
+        return lake_tables(pipeline.pipeline_name, pipeline.dataset_name, table_names)
+
+    from semantics.execution import database_path
+
+    if STORAGE_BACKEND == "postgres":
+        # Read the warehouse schema the pipeline bulk-loads (see warehouse.py)
+        con = ibis.connect(database_path(pipeline))
+        return {
+            table_name: con.table(table_name, database=pipeline.dataset_name)
+            for table_name in table_names
+        }
+
+    # Read the tables from the database itself rather than the dlt dataset:
+    # columns added after the load (e.g. the exchange rates materialized by
+    # semantics.currency) are not part of the dlt schema
+    con = ibis.duckdb.connect(database_path(pipeline), read_only=True)
+    return {
+        table_name: con.table(table_name, database=pipeline.dataset_name)
+        for table_name in table_names
+    }
 
-    return semantic_model
+
+def create_semantic_model(pipeline: dlt.Pipeline) -> MultiFactModel:
+    """Build the full BSL semantic model from the dlt pipeline's loaded data."""
+    return build_semantic_model(load_tables(pipeline))
+
+
+def metadata_tables(metadata) -> Dict[str, ir.Table]:
+    """Unbound Ibis tables from the cached table schemas."""
+    return {
+        table_name: ibis.table(
+            ibis.schema({col: dt.dtype(dtype) for col, dtype in columns.items()}),
+            name=table_name,
+            database=metadata.dataset_name,
+        )
+        for table_name, columns in metadata.tables.items()
+    }
+
+
+def create_semantic_model_from_metadata(metadata) -> MultiFactModel:
+    """Build the semantic model from cached table schemas, without attaching to dlt.
+
+    The Ibis tables are unbound, so queries against this model must be run
+    through `semantics.execution.QueryExecutor`.
+    """
+    return build_semantic_model(metadata_tables(metadata))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,309 @@
+"""On-disk cache of the compiled semantic model metadata.
+
+Attaching to the dlt pipeline, reflecting every table schema and building the
+joined BSL model costs more than a second per process. The result that servers
+need at startup (table schemas, dimension and measure names, join graph and the
+DuckDB file location) is small, so it is written to a JSON file and reused by
+every worker until either the pipeline's schema or the model definitions
+change.
+
+The cache is keyed by the dlt schema `version_hash`, read directly from the
+schema file in the pipeline's working directory, and by a hash of the model
+definition sources. Checking it needs neither dlt nor Ibis. The latest
+completed load id is read from the pipeline's working directory as well, and
+the published DuckDB snapshot from its pointer file, so processes can tell
+when new data was loaded (see `semantics.reload` and `semantics.snapshots`).
+
+Usage:
+    python -m semantics.model_cache                  # (re)build the cache
+    python -m semantics.model_cache --check-startup downstream_apps.api.server
+"""
+
+from __future__ import annotations
+
+from constants import CACHE_DIR, PIPELINE_NAME, STORAGE_BACKEND
+from semantics.snapshots import published_database
+from pydantic import BaseModel
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+if TYPE_CHECKING:
+    import dlt
+
+# Bump when the layout of ModelMetadata changes
+CACHE_FORMAT = 3
+
+# Startup budget in seconds for importing a server module
+STARTUP_BUDGET = 0.8
+
+_DEFINITION_FILES = ("model.py", "table_references.py")
+
+
+class ModelMetadata(BaseModel):
+    format: int = CACHE_FORMAT
+    version: str
+    pipeline_name: str
+    schema_file: str
+    schema_version_hash: str
+    definitions_hash: str
+    loads_dir: str
+    load_id: Optional[str] = None
+    storage: str = "duckdb"
+    database: str
+    dataset_name: str
+    tables: Dict[str, Dict[str, str]]
+    dimensions: List[str]
+    measures: List[str]
+    joins: Dict[str, List[dict]]
+
+    @property
+    def generation(self) -> str:
+        """Changes with the model version, every new load and every new snapshot."""
+        return f"{self.version}:{self.load_id}:{os.path.basename(self.database)}"
+
+
+def model_cache_path(pipeline_name: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{pipeline_name}.model.json")
+
+
+def _definitions_hash() -> str:
+    """Hash of the source files that define dimensions, measures and joins."""
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in _DEFINITION_FILES:
+        with open(os.path.join(here, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _schema_version_hash(schema_file: str) -> Optional[str]:
+    try:
+        with open(schema_file, "r", encoding="utf-8") as f:
+            return json.load(f).get("version_hash")
+    except (OSError, ValueError):
+        return None
+
+
+def _latest_load_id(loads_dir: str) -> Optional[str]:
+    """Most recent load package dlt moved to the pipeline's `load/loaded` folder."""
+    try:
+        entries = os.listdir(loads_dir)
+    except OSError:
+        return None
+    # Load ids are timestamps; skip temp files and other stray entries
+    load_ids = []
+    for entry in entries:
+        try:
+            float(entry)
+        except ValueError:
+            continue
+        load_ids.append(entry)
+    return max(load_ids, key=float, default=None)
+
+
+@contextmanager
+def _cache_lock(pipeline_name: str, cache_dir: str):
+    """Inter-process lock so only one worker compiles a stale cache at a time."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(model_cache_path(pipeline_name, cache_dir) + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _version(schema_version_hash: str, definitions_hash: str) -> str:
+    return hashlib.sha256(
+        f"{schema_version_hash}:{definitions_hash}".encode()
+    ).hexdigest()[:16]
+
+
+def load_cached_metadata(
+    pipeline_name: str, cache_dir: str = CACHE_DIR
+) -> Optional[ModelMetadata]:
+    """Return the cached metadata, or None if it is missing or out of date."""
+    try:
+        with open(model_cache_path(pipeline_name, cache_dir), "r", encoding="utf-8") as f:
+            metadata = ModelMetadata.model_validate_json(f.read())
+    except (OSError, ValueError):
+        return None
+
+    if metadata.format != CACHE_FORMAT or metadata.storage != STORAGE_BACKEND:
+        return None
+    if _schema_version_hash(metadata.schema_file) != metadata.schema_version_hash:
+        return None
+    if _definitions_hash() != metadata.definitions_hash:
+        return None
+    # New loads without schema changes keep the cache valid, only the load id
+    # and, in snapshot mode, the database file move
+    metadata.load_id = _latest_load_id(metadata.loads_dir)
+    metadata.database = published_database(pipeline_name) or metadata.database
+    return metadata
+
+
+def compile_model_metadata(pipeline: dlt.Pipeline) -> ModelMetadata:
+    """Build the semantic model from the pipeline and extract its metadata."""
+    from semantics.execution import database_path
+    from semantics.model import build_semantic_model, load_tables
+    from semantics.table_references import get_semantic_table_references
+
+    ibis_tables = load_tables(pipeline)
+    semantic_model = build_semantic_model(ibis_tables)
+
+    joins = get_semantic_table_references()
+    tables = {}
+    for table_name, table in ibis_tables.items():
+        schema = table.schema()
+        tables[table_name] = {
+            col: str(dtype)
+            for col, dtype in schema.items()
+            if not col.startswith("_dlt_")
+        }
+
+    schema_file = os.path.join(
+        pipeline.working_dir, "schemas", f"{pipeline.default_schema_name}.schema.json"
+    )
+    schema_version_hash = pipeline.default_schema.version_hash
+    definitions_hash = _definitions_hash()
+    loads_dir = os.path.join(pipeline.working_dir, "load", "loaded")
+
+    return ModelMetadata(
+        version=_version(schema_version_hash, definitions_hash),
+        pipeline_name=pipeline.pipeline_name,
+        schema_file=schema_file,
+        schema_version_hash=schema_version_hash,
+        definitions_hash=definitions_hash,
+        loads_dir=loads_dir,
+        load_id=_latest_load_id(loads_dir),
+        storage=STORAGE_BACKEND,
+        database=database_path(pipeline),
+        dataset_name=pipeline.dataset_name,
+        tables=tables,
+        dimensions=list(semantic_model.dimensions),
+        measures=list(semantic_model.measures),
+        joins=joins,
+    )
+
+
+def _without_password(database: str) -> str:
+    """A PostgreSQL URL without its password; other databases unchanged."""
+    parts = urlsplit(database)
+    if parts.scheme not in ("postgres", "postgresql"):
+        return database
+    netloc, query = parts.netloc, parts.query
+    if parts.password is not None:
+        credentials, _, host = netloc.rpartition("@")
+        netloc = f"{credentials.split(':', 1)[0]}@{host}"
+    params = parse_qsl(query, keep_blank_values=True)
+    if any(key == "password" for key, _ in params):
+        query = urlencode([(key, value) for key, value in params if key != "password"])
+    return urlunsplit(parts._replace(netloc=netloc, query=query))
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Write `text` to `path` via a temporary file, so concurrent readers never
+    see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_metadata(metadata: ModelMetadata, cache_dir: str = CACHE_DIR) -> str:
+    """Atomically write the metadata so concurrent readers never see a partial file.
+
+    The warehouse password is not written; `load_cached_metadata` takes the
+    URL from the configuration again.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = model_cache_path(metadata.pipeline_name, cache_dir)
+    stored = metadata.model_copy(update={"database": _without_password(metadata.database)})
+    write_atomic(path, stored.model_dump_json(indent=2))
+    return path
+
+
+def refresh_model_metadata(
+    pipeline: dlt.Pipeline, cache_dir: str = CACHE_DIR
+) -> ModelMetadata:
+    """Recompile and store the metadata, e.g. right after a pipeline run."""
+    metadata = compile_model_metadata(pipeline)
+    write_metadata(metadata, cache_dir)
+    return metadata
+
+
+def get_model_metadata(
+    pipeline_name: str = PIPELINE_NAME, cache_dir: str = CACHE_DIR
+) -> ModelMetadata:
+    """Return cached metadata, compiling it from the dlt pipeline on a cache miss.
+
+    Concurrent workers that all miss the cache wait for the first one to
+    compile it instead of attaching to the pipeline at the same time.
+    """
+    metadata = load_cached_metadata(pipeline_name, cache_dir)
+    if metadata is not None:
+        return metadata
+
+    with _cache_lock(pipeline_name, cache_dir):
+        metadata = load_cached_metadata(pipeline_name, cache_dir)
+        if metadata is not None:
+            return metadata
+
+        import dlt
+
+        pipeline = dlt.attach(pipeline_name=pipeline_name)
+        return refresh_model_metadata(pipeline, cache_dir)
+
+
+def measure_import_time(module: str) -> float:
+    """Seconds a fresh interpreter needs to import `module`."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=repo_root,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument(
+        "--check-startup",
+        required=False,
+        type=str,
+        metavar="MODULE",
+        help="Measure the import time of a server module against the budget",
+    )
+    parser.add_argument("--budget", required=False, type=float, default=STARTUP_BUDGET)
+    args = parser.parse_args()
+
+    if args.check_startup:
+        elapsed = measure_import_time(args.check_startup)
+        print(f"{args.check_startup}: {elapsed:.3f}s (budget {args.budget:.3f}s)")
+        sys.exit(0 if elapsed <= args.budget else 1)
+
+    import dlt
+
+    pipeline = dlt.attach(
+        pipeline_name=args.pipeline if args.pipeline else PIPELINE_NAME,
+    )
+    metadata = refresh_model_metadata(pipeline)
+    print(f"Model metadata version {metadata.version} written to "
+          f"{model_cache_path(metadata.pipeline_name)}")
@@ -0,0 +1,225 @@
+"""Cache of compiled SQL plans keyed by the shape of a query request.
+
+Building a BSL query and compiling it to SQL with Ibis costs far more than
+running a typical dashboard query on DuckDB, and most requests only differ in
+their filter values, e.g. the same tile per country. The shape of a request is
+everything except those values: measures, dimensions, filter fields and
+operators, time dimensions, order, limit, currency and top-N ranking.
+
+A plan is compiled once per shape with placeholder literals for the values
+(see `semantics.query_builder.PARAMETER_TOKEN`), which are then turned into
+`$n` parameters. Requests of the same shape only bind their values and run the
+SQL as a DuckDB prepared statement. DuckDB binds parameters as constants, so
+zone map and partition pruning still apply. On the PostgreSQL backend plans
+are compiled to its dialect and the `$n` parameters are bound server-side.
+
+Each `SemanticRuntime` holds its own cache, so plans never outlive the model
+generation they were compiled for.
+
+Usage:
+    python -m semantics.plan_cache           # benchmark cached vs. uncached
+"""
+
+from __future__ import annotations
+
+from constants import PIPELINE_NAME, PLAN_CACHE_SIZE
+from semantics.query_builder import (
+    PARAMETER_TOKEN,
+    QueryRequest,
+    build_semantic_query,
+    query_parameters,
+)
+from collections import OrderedDict
+from datetime import date
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Collection, List, Tuple
+import argparse
+import json
+import re
+import threading
+
+if TYPE_CHECKING:
+    from semantics.drill_across import MultiFactModel
+
+_TOKEN_PATTERN = re.compile("'" + PARAMETER_TOKEN.format(r"(\d+)") + "'")
+
+
+class QueryPlan(BaseModel):
+    sql: str
+    # Index into query_parameters() of the value bound to each $n, in order
+    parameters: List[int]
+
+    def bind(self, query_request: QueryRequest) -> List[str]:
+        values = query_parameters(query_request)
+        return [values[i] for i in self.parameters]
+
+
+def _is_date(value) -> bool:
+    try:
+        date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return False
+    return True
+
+
+def query_shape(query_request: QueryRequest) -> str:
+    """Key of a query request without its filter and date range values."""
+    # Date values may add partition filters on the lake, so they get their own plan
+    return json.dumps(
+        {
+            "measures": query_request.measures,
+            "dimensions": query_request.dimensions,
+            "filters": [
+                (f.field, f.operator, _is_date(f.value)) for f in query_request.filters
+            ],
+            "timeDimensions": [
+                (
+                    t.dimension,
+                    t.granularity,
+                    [_is_date(v) for v in t.bounds()],
+                )
+                for t in query_request.timeDimensions
+            ],
+            "limit": query_request.limit,
+            "order": query_request.order,
+            "currency": query_request.currency,
+            "top_n_per": query_request.top_n_per.model_dump()
+            if query_request.top_n_per
+            else None,
+        },
+        sort_keys=True,
+    )
+
+
+def compile_plan(
+    model: MultiFactModel,
+    query_request: QueryRequest,
+    dialect: str = "duckdb",
+    reduced_dimensions: Collection[str] = (),
+) -> QueryPlan:
+    """Compile a query request to SQL with `$n` parameters for its values."""
+    from semantics.execution import compile_query
+
+    sql = compile_query(
+        build_semantic_query(
+            model, query_request, parameterize=True, reduced_dimensions=reduced_dimensions
+        ),
+        dialect,
+    )
+
+    # Number the parameters in order of their first use; tokens of ignored
+    # filters never make it into the SQL
+    parameters: List[int] = []
+
+    def _parameter(match: re.Match) -> str:
+        index = int(match.group(1))
+        if index not in parameters:
+            parameters.append(index)
+        return f"${parameters.index(index) + 1}"
+
+    return QueryPlan(sql=_TOKEN_PATTERN.sub(_parameter, sql), parameters=parameters)
+
+
+class PlanCache:
+    """Least recently used cache of query plans for one semantic model.
+
+    Args:
+        model: The compiled semantic model plans are built from.
+        max_size: Number of plans kept; 0 compiles every request.
+        dialect: SQL dialect of the executor the plans run on.
+        reduced_dimensions: Dimensions whose equality filters are reduced to
+            fact table key predicates (see `semantics.semi_join`).
+    """
+
+    def __init__(
+        self,
+        model: MultiFactModel,
+        max_size: int = PLAN_CACHE_SIZE,
+        dialect: str = "duckdb",
+        reduced_dimensions: Collection[str] = (),
+    ):
+        self.model = model
+        self.max_size = max_size
+        self.dialect = dialect
+        self.reduced_dimensions = reduced_dimensions
+        self.hits = 0
+        self.misses = 0
+        self._plans: OrderedDict[str, QueryPlan] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, query_request: QueryRequest) -> QueryPlan:
+        key = query_shape(query_request)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        # Compile outside the lock; concurrent misses of one shape compile twice
+        plan = compile_plan(
+            self.model, query_request, self.dialect, self.reduced_dimensions
+        )
+        if self.max_size > 0:
+            with self._lock:
+                self._plans[key] = plan
+                while len(self._plans) > self.max_size:
+                    self._plans.popitem(last=False)
+        return plan
+
+    def compile(self, query_request: QueryRequest) -> Tuple[str, List[str]]:
+        """SQL and parameter values to execute a query request with."""
+        plan = self.plan(query_request)
+        return plan.sql, plan.bind(query_request)
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+if __name__ == "__main__":
+    import time
+    from semantics.execution import compile_query
+    from semantics.query_builder import FilterCondition
+    from semantics.runtime import SemanticRuntime
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-n", "--requests", default=200, type=int)
+    args = parser.parse_args()
+
+    runtime = SemanticRuntime(args.pipeline if args.pipeline else PIPELINE_NAME)
+    values = runtime.value_index.dimensions["country"].values
+    requests = [
+        QueryRequest(
+            measures=runtime.measures[:2],
+            dimensions=["year"],
+            filters=[FilterCondition(field="country", value=values[i % len(values)])],
+        )
+        for i in range(args.requests)
+    ]
+    model = runtime.model
+    dialect = runtime.executor.dialect
+    runtime.executor.start().execute(
+        compile_query(build_semantic_query(model, requests[0]), dialect)
+    )
+
+    def _run(label, compile_request):
+        start = time.perf_counter()
+        compile_time = 0.0
+        for request in requests:
+            compiled = time.perf_counter()
+            sql, parameters = compile_request(request)
+            compile_time += time.perf_counter() - compiled
+            runtime.executor.start().execute(sql, parameters)
+        total = time.perf_counter() - start
+        print(
+            f"{label:>9}: {len(requests) / total:8.1f} requests/s, "
+            f"compile {compile_time / len(requests) * 1000:7.3f} ms/request"
+        )
+
+    _run(
+        "uncached",
+        lambda r: (compile_query(build_semantic_query(model, r), dialect), None),
+    )
+    _run("cached", PlanCache(model, dialect=dialect).compile)
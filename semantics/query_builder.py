@@ -2,28 +2,155 @@
 
 Translates query requests (measures, dimensions, filters, time dimensions)
 into executable BSL/Ibis queries using SemanticModel.query().
+
+With `parameterize=True` the filter and date range values are replaced by
+placeholder literals (see `PARAMETER_TOKEN` and `query_parameters`), so the
+compiled SQL only depends on the shape of the request and can be cached and
+run as a prepared statement (see `semantics.plan_cache`).
+
+Equality filters on the `reduced_dimensions` are also applied to the fact
+tables' foreign keys as key subqueries (see `semantics.semi_join`).
+
+`top_n_per` keeps the best rows per group, e.g. the top 3 brands per continent,
+with a ranking window that DuckDB filters with QUALIFY, so only the winning
+rows are returned.
 """
 
-from boring_semantic_layer import SemanticModel
-from pydantic import BaseModel, Field
-from typing import Optional, Union, Literal, List
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from pydantic import BaseModel, Field, field_validator
+from typing import TYPE_CHECKING, Callable, Collection, Optional, Union, Literal, List, Tuple
+import operator
+import re
+
+if TYPE_CHECKING:
+    from semantics.drill_across import MultiFactModel
+    from semantics.semi_join import DimensionKeys
+
+_COMPARISONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# Placeholder literal standing in for the i-th value of `query_parameters`
+PARAMETER_TOKEN = "__vero_param_{}__"
 
 
 class FilterCondition(BaseModel):
-    field: str = Field(..., description="Dimension or measure name to filter on")
+    field: str = Field(..., description="Dimension name to filter on")
     operator: str = Field(
         "=", description="Comparison operator: =, !=, <, <=, >, >=, contains"
     )
     value: str = Field(..., description="Value to compare against")
 
 
+# today, yesterday, this/last week|month|quarter|year, last N days|weeks|months|years
+_RELATIVE_RANGE = re.compile(
+    r"(today|yesterday)|(this|last) (week|month|quarter|year)"
+    r"|last (\d+) (day|week|month|year)s?"
+)
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month, 12)
+    # Clamp e.g. March 31st minus a month to the end of February
+    for last_day in (31, 30, 29, 28):
+        try:
+            return date(year, month + 1, min(day.day, last_day))
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {day}")
+
+
+def relative_date_range(text: str, today: Optional[date] = None) -> Tuple[date, date]:
+    """First and last day of a relative range like 'last 7 days' or 'this month'.
+
+    Calendar periods (`this month`, `last year`, ...) cover the whole period;
+    `last N days|weeks|months|years` ends today. Raises a ValueError for
+    unsupported ranges.
+    """
+    match = _RELATIVE_RANGE.fullmatch(text.strip().lower())
+    if match is None:
+        raise ValueError(
+            f"Unsupported dateRange: {text!r}; use a pair of ISO dates, today, "
+            "yesterday, this/last week|month|quarter|year or last N days|weeks|months|years"
+        )
+    today = today or date.today()
+    day, which, period, count, unit = match.groups()
+    if day:
+        start = today if day == "today" else today - timedelta(days=1)
+        return start, start
+    if period:
+        months = {"month": 1, "quarter": 3, "year": 12}.get(period)
+        if months is None:
+            start = today - timedelta(days=today.weekday())
+            if which == "last":
+                start -= timedelta(weeks=1)
+            return start, start + timedelta(days=6)
+        start = date(today.year, today.month - (today.month - 1) % months, 1)
+        if which == "last":
+            start = _add_months(start, -months)
+        return start, _add_months(start, months) - timedelta(days=1)
+    count = int(count)
+    if unit == "day":
+        start = today - timedelta(days=count)
+    elif unit == "week":
+        start = today - timedelta(weeks=count)
+    else:
+        start = _add_months(today, -count * (12 if unit == "year" else 1))
+    return start + timedelta(days=1), today
+
+
 class TimeDimension(BaseModel):
     dimension: str = Field(..., description="Name of the time dimension")
     granularity: Literal[
         "second", "minute", "hour", "day", "week", "month", "quarter", "year"
     ] = Field(..., description="Time granularity")
     dateRange: Union[List[str], str] = Field(
-        ..., description="Pair of ISO date strings or relative range"
+        ...,
+        description="Pair of ISO date strings or relative range, e.g. 'last 30 days'",
+    )
+
+    @field_validator("dateRange")
+    @classmethod
+    def _check_date_range(cls, value: Union[List[str], str]) -> Union[List[str], str]:
+        if isinstance(value, str):
+            relative_date_range(value)
+            return value
+        if len(value) != 2:
+            raise ValueError(
+                f"dateRange must be a pair of ISO dates, got {len(value)} values"
+            )
+        for bound in value:
+            try:
+                datetime.fromisoformat(bound)
+            except ValueError:
+                raise ValueError(f"dateRange bound is not an ISO date: {bound!r}") from None
+        return value
+
+    def bounds(self) -> Tuple[str, str]:
+        """First and last ISO date of the range, relative ranges resolved to today."""
+        if isinstance(self.dateRange, str):
+            start, end = relative_date_range(self.dateRange)
+            return start.isoformat(), end.isoformat()
+        start, end = self.dateRange
+        return start, end
+
+
+class TopNPer(BaseModel):
+    n: int = Field(..., ge=1, description="Rows to keep per group")
+    dimensions: List[str] = Field(
+        ..., description="Dimensions forming the groups, e.g. ['continent']"
+    )
+    measure: str = Field(..., description="Measure to rank the rows of a group by")
+    direction: Literal["asc", "desc"] = Field(
+        "desc", description="desc keeps the highest values, asc the lowest"
     )
 
 
@@ -41,13 +168,170 @@ class QueryRequest(BaseModel):
     order: dict = Field(
         default_factory=dict, description="Ordering: {field: 'asc'|'desc'}"
     )
+    currency: Optional[str] = Field(
+        None, description="Convert amount measures to this currency, e.g. USD or EUR"
+    )
+    top_n_per: Optional[TopNPer] = Field(
+        None, description="Keep only the top n rows per group of dimensions"
+    )
+
+
+def _field_name(name: str) -> str:
+    return name.split(".")[-1] if "." in name else name
+
+
+def _check_value(field: str, value: str, dtype) -> None:
+    """Raise a ValueError if DuckDB could not cast `value` to the type `dtype`."""
+    try:
+        if dtype.is_boolean():
+            if value.strip().lower() not in ("true", "false", "t", "f", "1", "0"):
+                raise ValueError(value)
+        elif dtype.is_numeric():
+            float(value)
+        elif dtype.is_timestamp():
+            datetime.fromisoformat(value)
+        elif dtype.is_date():
+            date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(
+            f"Invalid value for {field}: {value!r} cannot be cast to {str(dtype).lstrip('!')}"
+        ) from None
 
 
-def build_semantic_query(model: SemanticModel, query_request: QueryRequest):
+def _filter_predicate(
+    field: str,
+    operator_name: str,
+    value,
+    literal=None,
+    keys: Optional[DimensionKeys] = None,
+) -> Callable:
+    """BSL filter comparing a dimension with a value cast to the dimension's type.
+
+    A value the type cannot hold, e.g. `year = 'abc'`, raises a ValueError
+    when the filter is applied, rather than a conversion error in DuckDB.
+
+    `literal` replaces the value in the SQL, e.g. with a parameter token.
+    On models built on the Parquet lake the filter also restricts the
+    partition key, so DuckDB only reads the matching partitions. With the
+    dimension table's `keys` it also restricts the fact table's foreign key.
+    """
+    if literal is None:
+        literal = value
+
+    def _condition(column):
+        import ibis
+
+        if operator_name == "contains":
+            return column.cast("string").contains(str(literal))
+        _check_value(field, value, column.type())
+        return _COMPARISONS[operator_name](
+            column, ibis.literal(literal).cast(column.type())
+        )
+
+    def _predicate(t):
+        from semantics.lake import partition_predicates
+
+        column = getattr(t, field)
+        predicate = _condition(column)
+        for partition_predicate in partition_predicates(
+            t, column, operator_name, value, literal
+        ):
+            predicate = predicate & partition_predicate
+        if keys is not None:
+            for key_predicate in keys.predicates(t, _condition):
+                predicate = predicate & key_predicate
+        return predicate
+
+    # Lets drill-across queries check that every fact table has the dimension
+    _predicate.dimension = field
+    return _predicate
+
+
+def filter_values(query_request: QueryRequest) -> List[tuple]:
+    """(field, operator, value) of every filter and date range bound, in order."""
+    values = [(f.field, f.operator, f.value) for f in query_request.filters]
+    for time_dimension in query_request.timeDimensions:
+        start, end = time_dimension.bounds()
+        values.append((time_dimension.dimension, ">=", start))
+        values.append((time_dimension.dimension, "<=", end))
+    return values
+
+
+def query_parameters(query_request: QueryRequest) -> List[str]:
+    """Values the tokens of a parameterized query stand for, by token index."""
+    return [value for _, _, value in filter_values(query_request)]
+
+
+def _build_filters(
+    model: MultiFactModel,
+    query_request: QueryRequest,
+    parameterize: bool = False,
+    reduced_dimensions: Collection[str] = (),
+) -> List[Callable]:
+    filter_count = len(query_request.filters)
+    filters = []
+    for i, (field, operator_name, value) in enumerate(filter_values(query_request)):
+        name = _field_name(field)
+        if i >= filter_count:
+            # Date ranges of time dimensions missing from the model are ignored
+            if name not in model.dimensions:
+                continue
+        elif name not in model.dimensions:
+            raise ValueError(f"Unknown dimension in filter: {field}")
+        elif operator_name not in _COMPARISONS and operator_name != "contains":
+            raise ValueError(f"Unsupported filter operator: {operator_name}")
+        literal = PARAMETER_TOKEN.format(i) if parameterize else None
+        keys = None
+        if operator_name == "=" and name in reduced_dimensions:
+            keys = model.dimension_keys.get(name)
+        filters.append(_filter_predicate(name, operator_name, value, literal, keys))
+
+    return filters
+
+
+def _resolve_measure(model: MultiFactModel, name: str, currency: Optional[str]) -> str:
+    """Measure name, switched to its converted variant if a currency is requested."""
+    from semantics.currency import currency_measure
+
+    if currency:
+        converted = currency_measure(name, currency)
+        if converted in model.converted_measures:
+            return converted
+    return name
+
+
+def _top_n_per(table, top_n: TopNPer, dimensions: List[str], measure: str):
+    """Rows ranked within the first `top_n.n` of their group by `measure`."""
+    import ibis
+
+    per = [_field_name(d) for d in top_n.dimensions]
+    for name in per:
+        if name not in dimensions:
+            raise ValueError(
+                f"top_n_per dimension {name} must be one of the query dimensions"
+            )
+    ranked_by = ibis.asc(measure) if top_n.direction == "asc" else ibis.desc(measure)
+    # The remaining dimensions break ties, so the result is deterministic
+    tie_breakers = [d for d in dimensions if d not in per]
+    rank = ibis.row_number().over(group_by=per, order_by=[ranked_by, *tie_breakers])
+    return table.filter(rank < top_n.n)
+
+
+def build_semantic_query(
+    model: MultiFactModel,
+    query_request: QueryRequest,
+    parameterize: bool = False,
+    reduced_dimensions: Collection[str] = (),
+):
     """Build a BSL semantic query from a QueryRequest.
 
     Uses the SemanticModel.query() API which handles dimensions, measures,
-    filters, ordering, and limits natively.
+    filters, ordering, and limits natively; measures of several fact tables
+    are combined by drill-across (see `semantics.drill_across`). With a `currency`, amount measures
+    are replaced by their converted variants, e.g. netRevenue by netRevenueEUR.
+    Equality filters on `reduced_dimensions` also restrict the fact tables'
+    foreign keys to the matching keys of their dimension table (see
+    `semantics.semi_join`).
 
     Returns an executable result (call .execute() or .to_pandas() on it).
     """
@@ -58,24 +342,62 @@ def build_semantic_query(model: SemanticModel, query_request: QueryRequest):
         if name in model.dimensions:
             selected_dims.append(name)
 
+    # Without converted measures the currency is unknown or its rates were not
+    # materialized; amounts must not silently stay in mixed currencies
+    currency = query_request.currency
+    if currency and not any(
+        _resolve_measure(model, name, currency) != name for name in model.measures
+    ):
+        raise ValueError(f"Unsupported currency: {currency}")
+
+    # Converted variants are not listed in the model's measures, so they are
+    # only reachable through the currency
     selected_measures = []
     for m in query_request.measures:
         name = m.split(".")[-1] if "." in m else m
+        if name in model.converted_measures:
+            raise ValueError(
+                f"Unknown measure: {name}; request the base measure with a currency instead"
+            )
         if name in model.measures:
-            selected_measures.append(name)
+            selected_measures.append(_resolve_measure(model, name, currency))
 
     # Build order_by tuples
     order_by = None
     if query_request.order:
         order_by = [
-            (k.split(".")[-1] if "." in k else k, v)
+            (_resolve_measure(model, k.split(".")[-1] if "." in k else k, currency), v)
             for k, v in query_request.order.items()
         ]
 
+    filters = _build_filters(model, query_request, parameterize, reduced_dimensions)
+
+    top_n = query_request.top_n_per
+    if top_n is not None:
+        from boring_semantic_layer import SemanticTable, to_untagged
+        from semantics.drill_across import order_and_limit
+
+        measure = _resolve_measure(model, _field_name(top_n.measure), currency)
+        if measure not in selected_measures:
+            raise ValueError(
+                f"top_n_per measure {top_n.measure} must be one of the query measures"
+            )
+        # Rank the full aggregate; order and limit apply to the winning rows
+        result = model.query(
+            dimensions=selected_dims if selected_dims else None,
+            measures=selected_measures,
+            filters=filters if filters else None,
+        )
+        if isinstance(result, SemanticTable):
+            result = to_untagged(result)
+        result = _top_n_per(result, top_n, selected_dims, measure)
+        return order_and_limit(result, order_by, query_request.limit)
+
     # Use the native query() method
     result = model.query(
         dimensions=selected_dims if selected_dims else None,
         measures=selected_measures if selected_measures else None,
+        filters=filters if filters else None,
         limit=query_request.limit,
         order_by=order_by,
     )
@@ -0,0 +1,126 @@
+"""Hot reload of the semantic model after new pipeline loads.
+
+`ReloadingRuntime` holds the current `SemanticRuntime` and polls the model
+metadata cache for a new generation, i.e. a new dlt load id, schema version or
+model definition. A replacement runtime is compiled and warmed up on the
+watcher thread, where it also replays the most frequent logged requests
+within the warm-up budgets (see `semantics.workload`), and then swapped in
+with a single attribute assignment.
+
+Callers take `reloading_runtime.current` once per request and use that object
+until the request finishes, so in-flight queries complete on the model they
+started with while new requests already see the new one. The old runtime is
+not closed explicitly, as requests may still hold it: it and its DuckDB
+connection are freed by garbage collection once no request references it
+any more. `on_reload` can be used to release other state tied to it.
+
+Several workers noticing the same load do not all rebuild at once: each waits
+a random delay before reloading, and only one of them compiles a stale
+metadata cache while the others wait for it and read the result (see
+`semantics.model_cache.get_model_metadata`).
+"""
+
+from __future__ import annotations
+
+from constants import PIPELINE_NAME, CACHE_DIR, RELOAD_INTERVAL
+from semantics.model_cache import get_model_metadata, load_cached_metadata
+from semantics.runtime import SemanticRuntime
+from typing import Callable, Optional
+import logging
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ReloadingRuntime:
+    """A `SemanticRuntime` that is replaced whenever the pipeline loads new data.
+
+    Args:
+        pipeline_name: dlt pipeline to follow.
+        cache_dir: Directory of the model metadata cache.
+        poll_interval: Seconds between checks for a new generation; 0 disables
+            the watcher.
+        jitter: Upper bound in seconds of the random delay before reloading.
+        on_reload: Called with `(old, new)` after a new runtime was swapped in.
+    """
+
+    def __init__(
+        self,
+        pipeline_name: str = PIPELINE_NAME,
+        cache_dir: str = CACHE_DIR,
+        poll_interval: float = RELOAD_INTERVAL,
+        jitter: float = 2.0,
+        on_reload: Optional[Callable[[SemanticRuntime, SemanticRuntime], None]] = None,
+    ):
+        self.pipeline_name = pipeline_name
+        self.cache_dir = cache_dir
+        self.poll_interval = poll_interval
+        self.jitter = jitter
+        self.on_reload = on_reload
+        self._current = SemanticRuntime(pipeline_name, cache_dir)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current(self) -> SemanticRuntime:
+        return self._current
+
+    def start(self) -> None:
+        """Warm up the current runtime and start watching for new loads."""
+        self._current.warm_up()
+        if self.poll_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._watch, name="semantic-reload", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_interval + self.jitter)
+            self._thread = None
+        self._current.close()
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Reloading the semantic model failed")
+
+    def check(self) -> bool:
+        """Reload if the pipeline produced a new generation; return True if swapped."""
+        current = self._current
+        cached = load_cached_metadata(self.pipeline_name, self.cache_dir)
+        # A missing or stale cache means the schema or the definitions changed
+        if cached is not None and cached.generation == current.generation:
+            return False
+
+        if self._stopped.wait(random.uniform(0, self.jitter)):
+            return False
+
+        metadata = get_model_metadata(self.pipeline_name, self.cache_dir)
+        if metadata.generation == current.generation:
+            return False
+
+        logger.info(
+            "New model generation %s (was %s), rebuilding",
+            metadata.generation,
+            current.generation,
+        )
+        runtime = SemanticRuntime(self.pipeline_name, self.cache_dir, metadata=metadata)
+        # Compile, connect and warm the caches before the swap so new
+        # requests never wait
+        runtime.model
+        runtime.executor.connection
+        runtime.value_index
+        runtime.statistics
+        runtime.replay_workload()
+
+        self._current = runtime
+        logger.info("Switched to model generation %s", runtime.generation)
+        if self.on_reload is not None:
+            self.on_reload(current, runtime)
+        return True
@@ -0,0 +1,152 @@
+"""Cache of query results as Arrow tables, with pagination and file exports.
+
+The KPI explorer reruns its whole script on every interaction, e.g. when the
+user turns a page. Results are therefore kept as Arrow tables, keyed by the
+model generation and the normalized query request, in one cache shared by all
+sessions of the server. Sorting and paging work on the cached table and only
+convert the rows shown to pandas; exports are written by DuckDB straight from
+the Arrow table to a file, so no CSV or Parquet copy is built in Python.
+
+The cache is bounded by the Arrow size of its results (`RESULT_CACHE_MB`).
+Results of an older model generation are dropped as soon as a result of a new
+one is stored.
+"""
+
+from __future__ import annotations
+
+from constants import CACHE_DIR, RESULT_CACHE_MB
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from semantics.query_builder import QueryRequest
+
+EXPORT_FORMATS = {"csv": "(FORMAT CSV, HEADER)", "parquet": "(FORMAT PARQUET)"}
+# Seconds an export file is kept for further downloads
+EXPORT_RETENTION = 3600
+
+
+def request_key(query_request: QueryRequest) -> str:
+    """Key of a query request; filter order does not change the result."""
+    request = query_request.model_dump()
+    request["filters"] = sorted(
+        request["filters"], key=lambda f: (f["field"], f["operator"], f["value"])
+    )
+    return json.dumps(request, sort_keys=True, default=str)
+
+
+class ResultCache:
+    """Least recently used Arrow results of one or more model generations.
+
+    Args:
+        max_bytes: Arrow size of the results kept; 0 keeps nothing.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._results: OrderedDict[Tuple[str, str], pa.Table] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self, generation: str, query_request: QueryRequest, run: Callable[[], pa.Table]
+    ) -> pa.Table:
+        """The cached result of a query request, running it with `run` on a miss."""
+        key = (generation, request_key(query_request))
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        # Run outside the lock; other sessions keep reading cached results
+        result = run()
+        if result.nbytes > self.max_bytes:
+            return result
+        with self._lock:
+            for old in [k for k in self._results if k[0] != generation]:
+                self._size -= self._results.pop(old).nbytes
+            if key not in self._results:
+                self._results[key] = result
+                self._size += result.nbytes
+            while self._size > self.max_bytes:
+                _, evicted = self._results.popitem(last=False)
+                self._size -= evicted.nbytes
+        return result
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+def sort_result(
+    result: pa.Table, column: Optional[str], descending: bool = False
+) -> pa.Table:
+    if not column:
+        return result
+    return result.sort_by([(column, "descending" if descending else "ascending")])
+
+
+def result_page(result: pa.Table, page: int, page_size: int) -> pa.Table:
+    """Rows of the 1-based `page`; a zero-copy slice of the result."""
+    return result.slice((page - 1) * page_size, page_size)
+
+
+def _prune_exports(directory: str) -> None:
+    cutoff = time.time() - EXPORT_RETENTION
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # Pruned by another process meanwhile
+            pass
+
+
+def export_result(
+    result: pa.Table,
+    key: str,
+    export_format: str,
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    directory: str = os.path.join(CACHE_DIR, "exports"),
+) -> str:
+    """Write a result to a CSV or Parquet file with DuckDB and return its path.
+
+    `key` identifies the result, e.g. its generation and `request_key`; repeated
+    exports of the same result and order reuse the file.
+    """
+    import duckdb
+
+    os.makedirs(directory, exist_ok=True)
+    _prune_exports(directory)
+    digest = hashlib.sha256(f"{key}|{order_by}|{descending}".encode()).hexdigest()
+    path = os.path.join(directory, f"{digest[:16]}.{export_format}")
+    if os.path.exists(path):
+        return path
+
+    order = ""
+    if order_by:
+        escaped = order_by.replace('"', '""')
+        order = f' ORDER BY "{escaped}" {"DESC" if descending else "ASC"}'
+    connection = duckdb.connect()
+    try:
+        connection.register("result", result)
+        # Write to a temporary name so concurrent exports never serve a partial file
+        partial = f"{path}.{threading.get_ident()}.partial"
+        connection.execute(
+            f"COPY (SELECT * FROM result{order}) TO '{partial}' {EXPORT_FORMATS[export_format]}"
+        )
+        os.replace(partial, path)
+    finally:
+        connection.close()
+    return path
@@ -0,0 +1,210 @@
+"""Lazily initialized semantic model and query executor shared by the servers.
+
+`SemanticRuntime` starts from the cached model metadata (see
+`semantics.model_cache`), so a process can list dimensions and measures right
+away. The BSL model is compiled from the cached table schemas, and the DuckDB
+connection, the dimension value index and the column statistics are opened
+only when the first request needs them, or ahead of time in the background via
+`warm_up`. Queries pass admission control (see `semantics.admission`) before
+they run, and their compiled SQL is cached by query shape (see
+`semantics.plan_cache`), with selective dimension filters reduced to fact
+table key predicates (see `semantics.semi_join`). Compiled requests are
+counted in the workload log, whose most frequent requests `warm_up` replays
+(see `semantics.workload`).
+"""
+
+from __future__ import annotations
+
+from constants import PIPELINE_NAME, CACHE_DIR
+from semantics.execution import QueryExecutor
+from semantics.model_cache import ModelMetadata, get_model_metadata
+from typing import TYPE_CHECKING, List, Optional, Tuple
+import logging
+import threading
+import time
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+    from semantics.drill_across import MultiFactModel
+    from semantics.admission import Admission
+    from semantics.column_stats import ModelStatistics
+    from semantics.plan_cache import PlanCache
+    from semantics.query_builder import QueryRequest
+    from semantics.value_index import ValueIndex
+    from semantics.workload import WarmupReport, WorkloadLog
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticRuntime:
+    def __init__(
+        self,
+        pipeline_name: str = PIPELINE_NAME,
+        cache_dir: str = CACHE_DIR,
+        metadata: Optional[ModelMetadata] = None,
+    ):
+        start = time.perf_counter()
+        self.cache_dir = cache_dir
+        self.metadata: ModelMetadata = metadata or get_model_metadata(
+            pipeline_name, cache_dir
+        )
+        self._model = None
+        self._executor = None
+        self._value_index = None
+        self._statistics = None
+        self._plans = None
+        self._lock = threading.Lock()
+        logger.info(
+            "Loaded model metadata %s in %.3fs",
+            self.metadata.version,
+            time.perf_counter() - start,
+        )
+
+    @property
+    def version(self) -> str:
+        return self.metadata.version
+
+    @property
+    def generation(self) -> str:
+        return self.metadata.generation
+
+    @property
+    def dimensions(self) -> List[str]:
+        return self.metadata.dimensions
+
+    @property
+    def measures(self) -> List[str]:
+        return self.metadata.measures
+
+    @property
+    def model(self) -> MultiFactModel:
+        with self._lock:
+            if self._model is None:
+                from semantics.model import create_semantic_model_from_metadata
+
+                start = time.perf_counter()
+                self._model = create_semantic_model_from_metadata(self.metadata)
+                logger.info(
+                    "Compiled semantic model in %.3fs", time.perf_counter() - start
+                )
+            return self._model
+
+    @property
+    def executor(self) -> QueryExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = QueryExecutor.from_metadata(self.metadata)
+            return self._executor
+
+    @property
+    def value_index(self) -> ValueIndex:
+        """Distinct values of every dimension, see `semantics.value_index`."""
+        if self._value_index is None:
+            from semantics.value_index import get_value_index
+
+            self._value_index = get_value_index(self.metadata, self.executor, self.cache_dir)
+        return self._value_index
+
+    @property
+    def statistics(self) -> ModelStatistics:
+        """Column statistics for cost estimates, see `semantics.column_stats`."""
+        if self._statistics is None:
+            from semantics.column_stats import get_statistics
+
+            self._statistics = get_statistics(self.metadata, self.executor, self.cache_dir)
+        return self._statistics
+
+    @property
+    def workload(self) -> WorkloadLog:
+        """Log of the most frequent query requests, see `semantics.workload`."""
+        from semantics.workload import get_workload_log
+
+        return get_workload_log(self.metadata.pipeline_name, self.cache_dir)
+
+    def replay_workload(self) -> WarmupReport:
+        """Run the most frequent logged requests within the warm-up budgets."""
+        from semantics.workload import replay_workload
+
+        report = replay_workload(self)
+        logger.info(report.format())
+        return report
+
+    def warm_up(self) -> threading.Thread:
+        """Compile the model, connect, load the index and statistics and replay the workload."""
+
+        def _warm():
+            try:
+                self.model
+                self.executor.connection
+                self.value_index
+                self.statistics
+                self.replay_workload()
+            except Exception:
+                logger.exception("Warming up the semantic runtime failed")
+
+        thread = threading.Thread(target=_warm, name="semantic-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def admit(self, query_request: QueryRequest, **budgets) -> Admission:
+        """Estimate the cost of a query request; raises QueryRejectedError over budget.
+
+        `budgets` override the default budgets of `admit_query`.
+        """
+        from semantics.admission import admit_query
+
+        return admit_query(self.statistics, self.model, query_request, **budgets)
+
+    @property
+    def plans(self) -> PlanCache:
+        """Compiled SQL by query shape, see `semantics.plan_cache`."""
+        if self._plans is None:
+            from semantics.plan_cache import PlanCache
+            from semantics.semi_join import reduced_dimensions
+
+            model = self.model
+            executor = self.executor
+            reduced = reduced_dimensions(model, self.statistics)
+            with self._lock:
+                if self._plans is None:
+                    self._plans = PlanCache(
+                        model, dialect=executor.dialect, reduced_dimensions=reduced
+                    )
+        return self._plans
+
+    def compile(self, query_request: QueryRequest) -> Tuple[str, List[str]]:
+        """SQL and parameter values of a query request."""
+        return self.plans.compile(query_request)
+
+    def record(self, query_request: QueryRequest) -> None:
+        """Count a request in the workload log once it ran successfully.
+
+        Failing requests are not recorded, so they are not replayed on every
+        warm-up (see `semantics.workload`).
+        """
+        self.workload.record(query_request)
+
+    def execute(self, query_request: QueryRequest) -> pd.DataFrame:
+        """Compile (or reuse the plan of) and execute a query request.
+
+        Callers run `admit` first and execute the admitted query.
+        """
+        sql, parameters = self.compile(query_request)
+        result = self.executor.start().execute(sql, parameters)
+        self.record(query_request)
+        return result
+
+    def execute_arrow(self, query_request: QueryRequest) -> pa.Table:
+        """Like `execute`, but returns the result as an Arrow table."""
+        sql, parameters = self.compile(query_request)
+        result = self.executor.start().execute_arrow(sql, parameters)
+        self.record(query_request)
+        return result
+
+    def close(self) -> None:
+        self.workload.flush()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.close()
+                self._executor = None
@@ -0,0 +1,256 @@
+"""Semi-join reduction of selective dimension filters into fact table key predicates.
+
+A filter on a dimension attribute, e.g. `surname = 'Smith'`, is applied to the
+joined star, so DuckDB joins every fact row before it can drop it. The
+dimension tables are small, so the filter is also evaluated on its dimension
+table alone, and the matching keys restrict the fact table's foreign key:
+
+    ... AND fact_sales.customer_key IN (
+        SELECT customer_key FROM dim_customer WHERE surname = 'Smith'
+    )
+
+The key predicate holds exactly for the rows the original filter keeps (the
+dimension is joined one-to-one on that key), and the original filter stays in
+place, so the result is identical to the full join.
+
+DuckDB already pushes the min/max of the keys of a filtered dimension into
+the fact scan, so the reduction only pays off for filters matching a few
+scattered keys. It is applied to `=` filters whose dimension the column
+statistics (see `semantics.column_stats`) estimate to keep at most
+`SEMI_JOIN_MAX_SELECTIVITY` of its table but at least `MIN_KEYS` keys, once
+the fact table has `MIN_FACT_ROWS`, and never to foreign keys the fact table
+is sorted by (see `LAYOUT_SORT_KEYS`), whose ranges DuckDB prunes via zone
+maps anyway. On the Contoso sample repeated to 10M fact rows, filters on a
+product's weight, cost or price ran 1.4-2.1x faster, while broad filters like
+a gender or a brand ran up to 1.6x slower with the key subquery.
+
+The foreign keys come from `semantics.table_references`: every single-column
+reference to a dimension table that is not a fact table itself. A star with
+several references to the same dimension table is not reduced, as it is
+unclear which one the dimension was joined on.
+
+Usage:
+    python -m semantics.semi_join             # benchmark with and without the reduction
+    python -m semantics.semi_join -s 250      # ... on fact_sales repeated 250 times
+"""
+
+from __future__ import annotations
+
+from constants import (
+    LAYOUT_SORT_KEYS,
+    OPTIMIZE_LAYOUT,
+    PIPELINE_NAME,
+    SEMI_JOIN_MAX_SELECTIVITY,
+)
+from typing import TYPE_CHECKING, Callable, Dict, List, Set, Tuple
+import argparse
+
+if TYPE_CHECKING:
+    import ibis.expr.types as ir
+    from semantics.column_stats import ModelStatistics
+    from semantics.drill_across import MultiFactModel
+
+# Below this many fact rows the key subquery costs more than it saves
+MIN_FACT_ROWS = 1000000
+# Filters matching fewer keys are pruned as well by DuckDB's min/max join filter
+MIN_KEYS = 2
+
+
+class DimensionKeys:
+    """The keys of a dimension table, filtered on one of its dimensions.
+
+    Args:
+        table: The dimension table with its prefixed columns.
+        dimension: Expression of the dimension on `table`.
+        references: (foreign key, key) column pairs of the tables referencing
+            the dimension table, e.g. `fact_sales__customer_key`.
+    """
+
+    def __init__(
+        self,
+        table: ir.Table,
+        dimension: Callable,
+        references: List[Tuple[str, str]],
+    ):
+        self.table = table
+        self.dimension = dimension
+        self.references = references
+
+    def predicates(self, table: ir.Table, condition: Callable) -> List:
+        """Predicates restricting the foreign key of `table` to the matching keys.
+
+        `condition` builds the filter from a dimension expression; it is applied
+        to the dimension on the dimension table alone.
+        """
+        references = [(fk, key) for fk, key in self.references if fk in table.columns]
+        if len(references) != 1:
+            return []
+        foreign_key, key = references[0]
+        keys = self.table.filter(condition(self.dimension(self.table)))
+        return [getattr(table, foreign_key).isin(keys[key])]
+
+
+def _sorted_by(table_name: str, column: str) -> bool:
+    return OPTIMIZE_LAYOUT and column in LAYOUT_SORT_KEYS.get(table_name, [])
+
+
+def dimension_keys(
+    tables: Dict[str, ir.Table],
+    definitions: Dict[str, Dict],
+    references: Dict[str, List[Dict]],
+    fact_tables: List[str],
+) -> Dict[str, DimensionKeys]:
+    """`DimensionKeys` per dimension of the referenced dimension tables.
+
+    Args:
+        tables: Prepared table (with prefixed columns) per table name.
+        definitions: Dimension and measure definitions per table name.
+        references: Star schema relationships, see `semantics.table_references`.
+        fact_tables: Tables whose dimensions are never reduced.
+    """
+    foreign_keys: Dict[str, List[Tuple[str, str]]] = {}
+    for referencing_table, table_references in references.items():
+        for reference in table_references:
+            columns = reference["columns"]
+            if len(columns) != 1 or _sorted_by(referencing_table, columns[0]):
+                continue
+            referenced_table = reference["referenced_table"]
+            foreign_keys.setdefault(referenced_table, []).append(
+                (
+                    f"{referencing_table}__{columns[0]}",
+                    f"{referenced_table}__{reference['referenced_columns'][0]}",
+                )
+            )
+
+    keys = {}
+    for table_name, table_foreign_keys in foreign_keys.items():
+        if table_name in fact_tables or table_name not in tables:
+            continue
+        for name, dimension in definitions.get(table_name, {}).get("dimensions", {}).items():
+            keys[name] = DimensionKeys(tables[table_name], dimension, table_foreign_keys)
+    return keys
+
+
+def reduced_dimensions(
+    model: MultiFactModel,
+    statistics: ModelStatistics,
+    max_selectivity: float = SEMI_JOIN_MAX_SELECTIVITY,
+) -> Set[str]:
+    """Dimensions whose `=` filters are estimated to match a few scattered keys."""
+    reduced = set()
+    if statistics.table_rows.get(statistics.fact_table, 0) < MIN_FACT_ROWS:
+        return reduced
+    for name in model.dimension_keys:
+        stats = statistics.dimensions.get(name)
+        if stats is None or stats.distinct <= 0:
+            continue
+        rows = statistics.table_rows.get(stats.table, 0)
+        keys = rows / stats.distinct
+        if MIN_KEYS <= keys <= rows * max_selectivity:
+            reduced.add(name)
+    return reduced
+
+
+def _scaled_database(path: str, scale: int, runtime) -> Dict[str, ir.Table]:
+    """Copy the model's tables into a DuckDB file with the fact rows repeated `scale` times."""
+    import ibis
+    from semantics.model import FACT_TABLE, metadata_tables
+
+    dataset_name = runtime.metadata.dataset_name
+    table_names = list(metadata_tables(runtime.metadata))
+    con = ibis.duckdb.connect(path)
+    for table_name in table_names:
+        table = runtime.executor.start().execute_arrow(
+            f'SELECT * FROM "{dataset_name}"."{table_name}"'
+        )
+        con.con.register("source", table)
+        select = "SELECT * FROM source"
+        if table_name == FACT_TABLE:
+            select = f"SELECT source.* FROM source, range({scale})"
+            sort_keys = LAYOUT_SORT_KEYS.get(table_name)
+            if sort_keys:
+                select += f" ORDER BY {', '.join(sort_keys)}"
+        con.con.execute(f'CREATE TABLE "{table_name}" AS {select}')
+        con.con.unregister("source")
+    return {table_name: con.table(table_name) for table_name in table_names}
+
+
+if __name__ == "__main__":
+    import numpy as np
+    import os
+    import statistics
+    import tempfile
+    import time
+    from semantics.execution import compile_query
+    from semantics.model import build_semantic_model
+    from semantics.query_builder import FilterCondition, QueryRequest, build_semantic_query
+    from semantics.runtime import SemanticRuntime
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-r", "--repeat", default=5, type=int)
+    parser.add_argument("-s", "--scale", default=1, type=int)
+    args = parser.parse_args()
+
+    runtime = SemanticRuntime(args.pipeline if args.pipeline else PIPELINE_NAME)
+    model_statistics = runtime.statistics
+    fact_table = model_statistics.fact_table
+    # The dimensions the runtime would reduce on the (scaled) fact table
+    reduced = reduced_dimensions(
+        runtime.model,
+        model_statistics.model_copy(
+            update={
+                "table_rows": {
+                    **model_statistics.table_rows,
+                    fact_table: model_statistics.table_rows.get(fact_table, 0) * args.scale,
+                }
+            }
+        ),
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = runtime.model
+        if args.scale > 1:
+            # Bound to the scaled copy, so its queries run through Ibis
+            model = build_semantic_model(
+                _scaled_database(os.path.join(directory, "scaled.duckdb"), args.scale, runtime)
+            )
+
+        def _time(expr) -> Tuple[float, object]:
+            if args.scale > 1:
+                execute = expr.execute
+            else:
+                sql = compile_query(expr, runtime.executor.dialect)
+                execute = lambda: runtime.executor.start().execute(sql)  # noqa: E731
+            result = execute()
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                execute()
+                samples.append(time.perf_counter() - start)
+            return statistics.median(samples) * 1000, result.sort_values("year")
+
+        for name in model.dimension_keys:
+            values = runtime.value_index.dimensions.get(name)
+            if values is None or not values.values:
+                continue
+            # The most frequent value, so the filter is as broad as it gets
+            request = QueryRequest(
+                measures=["netRevenue"],
+                dimensions=["year"],
+                filters=[FilterCondition(field=name, value=values.values[0])],
+            )
+            full, expected = _time(build_semantic_query(model, request))
+            semi, result = _time(
+                build_semantic_query(model, request, reduced_dimensions={name})
+            )
+            # Sums may differ in the last digits, as the rows are added up in another order
+            identical = np.allclose(
+                expected.to_numpy(dtype=float), result.to_numpy(dtype=float), equal_nan=True
+            )
+            print(
+                f"{name:>16} {'reduced' if name in reduced else '       '}: "
+                f"full join {full:8.1f} ms, semi-join {semi:8.1f} ms "
+                f"({full / semi:.2f}x){'' if identical else ', RESULTS DIFFER'}"
+            )
+    runtime.close()
@@ -0,0 +1,113 @@
+"""DuckDB snapshot files, so readers keep serving while the pipeline loads.
+
+DuckDB lets only one process write a database file, and not while others
+have it open. In snapshot mode every pipeline run therefore loads into a new
+database file. Once the load succeeded, the snapshot is published by
+atomically replacing a small pointer file; readers open the published file
+read-only and switch to the next one through the hot reload in
+`semantics.reload`.
+
+The Parquet lake backend (see `semantics.lake`) publishes its exports the
+same way, as snapshot directories below `LAKE_DIR`.
+
+Superseded snapshots are kept for `SNAPSHOT_RETENTION` seconds after they
+were replaced so that queries still running on them can finish, and are then
+removed by `prune_snapshots`.
+"""
+
+from constants import (
+    DUCKDB_SNAPSHOTS,
+    LAKE_DIR,
+    POSTGRES_URL,
+    SNAPSHOT_DIR,
+    SNAPSHOT_RETENTION,
+    STORAGE_BACKEND,
+)
+from typing import List, Optional
+import glob
+import os
+import shutil
+import time
+import uuid
+
+
+def snapshot_dir(pipeline_name: str, base_dir: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(base_dir, pipeline_name)
+
+
+def _pointer_path(pipeline_name: str, base_dir: str) -> str:
+    return os.path.join(snapshot_dir(pipeline_name, base_dir), "CURRENT")
+
+
+def new_snapshot_path(
+    pipeline_name: str, base_dir: str = SNAPSHOT_DIR, suffix: str = ".duckdb"
+) -> str:
+    """Path of a fresh, not yet published snapshot for the next pipeline run."""
+    directory = snapshot_dir(pipeline_name, base_dir)
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    return os.path.join(directory, f"{pipeline_name}-{stamp}-{uuid.uuid4().hex[:8]}{suffix}")
+
+
+def current_snapshot(pipeline_name: str, base_dir: str = SNAPSHOT_DIR) -> Optional[str]:
+    """The most recently published snapshot below `base_dir`, if any."""
+    try:
+        with open(_pointer_path(pipeline_name, base_dir), "r", encoding="utf-8") as f:
+            path = f.read().strip()
+    except OSError:
+        return None
+    return path if path and os.path.exists(path) else None
+
+
+def published_database(pipeline_name: str) -> Optional[str]:
+    """Storage readers should query: the lake in Parquet mode, else the DuckDB snapshot.
+
+    Returns None when the configured backend has no published snapshot, i.e.
+    readers use the file the pipeline loads into. The PostgreSQL warehouse
+    swaps its schema on every load, so readers always use its URL.
+    """
+    if STORAGE_BACKEND == "postgres":
+        return POSTGRES_URL
+    if STORAGE_BACKEND == "parquet":
+        return current_snapshot(pipeline_name, LAKE_DIR)
+    if DUCKDB_SNAPSHOTS:
+        return current_snapshot(pipeline_name)
+    return None
+
+
+def publish_snapshot(pipeline_name: str, path: str, base_dir: str = SNAPSHOT_DIR) -> None:
+    """Point readers at `path`; the previous snapshot starts its retention period."""
+    previous = current_snapshot(pipeline_name, base_dir)
+
+    # Imported here, as semantics.model_cache imports this module
+    from semantics.model_cache import write_atomic
+
+    write_atomic(_pointer_path(pipeline_name, base_dir), os.path.abspath(path))
+
+    if previous and previous != os.path.abspath(path):
+        # The modification time marks when the snapshot was superseded
+        os.utime(previous)
+
+
+def prune_snapshots(
+    pipeline_name: str,
+    retention: float = SNAPSHOT_RETENTION,
+    base_dir: str = SNAPSHOT_DIR,
+) -> List[str]:
+    """Delete snapshots superseded more than `retention` seconds ago."""
+    current = current_snapshot(pipeline_name, base_dir)
+    cutoff = time.time() - retention
+    removed = []
+    pattern = os.path.join(snapshot_dir(pipeline_name, base_dir), f"{pipeline_name}-*")
+    for path in glob.glob(pattern):
+        if path == current or path.endswith(".wal") or os.path.getmtime(path) >= cutoff:
+            continue
+        if os.path.isdir(path):
+            # Lake snapshots are directories of Parquet files
+            shutil.rmtree(path)
+        else:
+            for leftover in (path, f"{path}.wal"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        removed.append(path)
+    return removed
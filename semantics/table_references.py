@@ -3,12 +3,21 @@
 Column names use dlt's snake_case normalization:
   CustomerKey → customer_key, StoreKey → store_key, etc.
 
-Schema:
+Schema (fact tables with their conformed dimension tables):
     fact_sales (central fact table)
     ├── dim_customer (via customer_key)
     ├── dim_store (via store_key)
     ├── dim_product (via product_key)
     └── dim_date (via order_date → date)
+
+    orders (one row per order)
+    ├── dim_customer (via customer_key)
+    ├── dim_store (via store_key)
+    └── dim_date (via order_date → date)
+
+    orderrows (one row per order line)
+    ├── orders (via order_key; dimensions only, see semantics.drill_across)
+    └── dim_product (via product_key)
 """
 
 
@@ -36,6 +45,35 @@ def get_semantic_table_references():
                 "referenced_columns": ["date"],
             },
         ],
+        "orders": [
+            {
+                "referenced_table": "dim_customer",
+                "columns": ["customer_key"],
+                "referenced_columns": ["customer_key"],
+            },
+            {
+                "referenced_table": "dim_store",
+                "columns": ["store_key"],
+                "referenced_columns": ["store_key"],
+            },
+            {
+                "referenced_table": "dim_date",
+                "columns": ["order_date"],
+                "referenced_columns": ["date"],
+            },
+        ],
+        "orderrows": [
+            {
+                "referenced_table": "orders",
+                "columns": ["order_key"],
+                "referenced_columns": ["order_key"],
+            },
+            {
+                "referenced_table": "dim_product",
+                "columns": ["product_key"],
+                "referenced_columns": ["product_key"],
+            },
+        ],
         "dim_customer": [],
         "dim_store": [],
         "dim_product": [],
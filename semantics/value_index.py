@@ -0,0 +1,204 @@
+"""Index of the distinct values of every dimension, for filter pickers and agents.
+
+The index holds the distinct values of each dimension in `SEMANTIC_DEFINITIONS`
+with their row counts in the dimension's own table, most frequent first. It is
+built after each pipeline load (or once per model generation by the first
+process that needs it) and stored next to the model metadata cache, so
+searching it never touches the database.
+
+Usage:
+    python -m semantics.value_index               # (re)build the index
+"""
+
+from __future__ import annotations
+
+from constants import CACHE_DIR, PIPELINE_NAME, VALUE_INDEX_MAX_VALUES
+from semantics.model_cache import ModelMetadata, _cache_lock, write_atomic
+from pydantic import BaseModel, PrivateAttr
+from typing import TYPE_CHECKING, Dict, List, Optional
+import argparse
+import difflib
+import os
+
+if TYPE_CHECKING:
+    from semantics.execution import QueryExecutor
+
+# Similarity ratio (0-1) a value needs to count as a fuzzy match
+FUZZY_CUTOFF = 0.6
+
+
+class DimensionValues(BaseModel):
+    values: List[str]
+    counts: List[int]
+    distinct: int
+
+    _lowered: List[str] = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context) -> None:
+        self._lowered = [value.lower() for value in self.values]
+
+    @property
+    def truncated(self) -> bool:
+        return self.distinct > len(self.values)
+
+
+class ValueIndex(BaseModel):
+    generation: str
+    dimensions: Dict[str, DimensionValues]
+
+    def search(
+        self, query: str = "", dimension: Optional[str] = None, limit: int = 20
+    ) -> List[dict]:
+        """Values of one or all dimensions matching `query`, best matches first.
+
+        Case-insensitive prefix matches come first, then substring matches,
+        then fuzzy matches for misspellings. Prefix and substring matches are
+        ordered by frequency, fuzzy matches by their similarity to `query`
+        with frequency breaking ties. An empty query returns the most
+        frequent values.
+        """
+        if dimension is not None and dimension not in self.dimensions:
+            raise KeyError(dimension)
+        names = [dimension] if dimension is not None else list(self.dimensions)
+        needle = query.strip().lower()
+
+        prefix, substring, fuzzy = [], [], []
+        for name in names:
+            entry = self.dimensions[name]
+            for value, lowered, count in zip(entry.values, entry._lowered, entry.counts):
+                match = {"dimension": name, "value": value, "count": count}
+                if lowered.startswith(needle):
+                    prefix.append(match)
+                elif needle in lowered:
+                    substring.append(match)
+
+        by_count = lambda match: -match["count"]  # noqa: E731
+        matches = sorted(prefix, key=by_count) + sorted(substring, key=by_count)
+
+        if needle and len(matches) < limit:
+            for name in names:
+                entry = self.dimensions[name]
+                close = difflib.get_close_matches(
+                    needle, entry._lowered, n=limit, cutoff=FUZZY_CUTOFF
+                )
+                positions = {lowered: i for i, lowered in enumerate(entry._lowered)}
+                for lowered in close:
+                    i = positions[lowered]
+                    match = {"dimension": name, "value": entry.values[i], "count": entry.counts[i]}
+                    # The score get_close_matches ranked the value by
+                    ratio = difflib.SequenceMatcher(None, needle, lowered).ratio()
+                    fuzzy.append((ratio, match))
+            seen = {(m["dimension"], m["value"]) for m in matches}
+            fuzzy.sort(key=lambda scored: (-scored[0], -scored[1]["count"]))
+            matches += [
+                m for _, m in fuzzy if (m["dimension"], m["value"]) not in seen
+            ]
+
+        return matches[:limit]
+
+
+def value_index_path(pipeline_name: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{pipeline_name}.values.json")
+
+
+def build_value_index(
+    metadata: ModelMetadata,
+    executor: QueryExecutor,
+    max_values: int = VALUE_INDEX_MAX_VALUES,
+) -> ValueIndex:
+    """Query the distinct values and counts of every dimension from its own table."""
+    import ibis
+    from semantics.model import SEMANTIC_DEFINITIONS, _prepare_table, metadata_tables
+
+    tables = metadata_tables(metadata)
+    dimensions = {}
+    for table_name, definition in SEMANTIC_DEFINITIONS.items():
+        if table_name not in tables:
+            continue
+        table = _prepare_table(tables[table_name], table_name)
+        for name, expr in definition["dimensions"].items():
+            column = expr(table)
+            present = table.filter(column.notnull())
+            counts = (
+                present.group_by(value=column.cast("string"))
+                .aggregate(count=ibis._.count())
+                .order_by([ibis.desc("count"), "value"])
+                .limit(max_values)
+            )
+            df = executor.start().execute(ibis.to_sql(counts, dialect=executor.dialect))
+            distinct = executor.start().execute(
+                ibis.to_sql(
+                    present.aggregate(distinct=column.nunique()), dialect=executor.dialect
+                )
+            )["distinct"].iloc[0]
+            dimensions[name] = DimensionValues(
+                values=df["value"].tolist(),
+                counts=[int(count) for count in df["count"]],
+                distinct=int(distinct),
+            )
+
+    return ValueIndex(generation=metadata.generation, dimensions=dimensions)
+
+
+def load_value_index(
+    metadata: ModelMetadata, cache_dir: str = CACHE_DIR
+) -> Optional[ValueIndex]:
+    """Return the stored index, or None if it is missing or from another generation."""
+    try:
+        with open(value_index_path(metadata.pipeline_name, cache_dir), "r", encoding="utf-8") as f:
+            index = ValueIndex.model_validate_json(f.read())
+    except (OSError, ValueError):
+        return None
+    return index if index.generation == metadata.generation else None
+
+
+def write_value_index(
+    index: ValueIndex, pipeline_name: str, cache_dir: str = CACHE_DIR
+) -> str:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = value_index_path(pipeline_name, cache_dir)
+    write_atomic(path, index.model_dump_json())
+    return path
+
+
+def get_value_index(
+    metadata: ModelMetadata, executor: QueryExecutor, cache_dir: str = CACHE_DIR
+) -> ValueIndex:
+    """Return the stored index, building it once per generation if needed."""
+    index = load_value_index(metadata, cache_dir)
+    if index is not None:
+        return index
+
+    with _cache_lock(metadata.pipeline_name, cache_dir):
+        index = load_value_index(metadata, cache_dir)
+        if index is None:
+            index = build_value_index(metadata, executor)
+            write_value_index(index, metadata.pipeline_name, cache_dir)
+        return index
+
+
+def refresh_value_index(metadata: ModelMetadata, cache_dir: str = CACHE_DIR) -> ValueIndex:
+    """Rebuild and store the index, e.g. right after a pipeline run."""
+    from semantics.execution import QueryExecutor
+
+    executor = QueryExecutor.from_metadata(metadata)
+    try:
+        index = build_value_index(metadata, executor)
+    finally:
+        executor.close()
+    write_value_index(index, metadata.pipeline_name, cache_dir)
+    return index
+
+
+if __name__ == "__main__":
+    from semantics.model_cache import get_model_metadata
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    args = parser.parse_args()
+
+    metadata = get_model_metadata(args.pipeline if args.pipeline else PIPELINE_NAME)
+    index = refresh_value_index(metadata)
+    print(f"Indexed {sum(len(d.values) for d in index.dimensions.values())} values of "
+          f"{len(index.dimensions)} dimensions in "
+          f"{value_index_path(metadata.pipeline_name)}")
@@ -0,0 +1,143 @@
+"""Window and time-intelligence measures computed over aggregated results.
+
+A window measure derives from a regular measure of the model, e.g. the
+year-over-year change or a 3-month moving average of `netRevenue`. Queries
+asking for one are first aggregated at the requested grain; the window
+functions then run in DuckDB over the aggregated rows, so only the final rows
+leave the database.
+
+The time axis of a query is its finest dimension in `TIME_AXES`, ordered by
+that dimension's sortable key (added to the aggregate and dropped again). The
+other dimensions, except coarser time axes, partition the windows: with
+`year` and `month` the year-over-year change compares each month with the
+same month a year earlier. Offsets use RANGE frames on the key, so a period
+missing from the result yields NULL instead of the wrong neighbour.
+
+Filters apply before aggregation, so the first periods of a filtered range
+have no previous period to compare with.
+"""
+
+from __future__ import annotations
+
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Dict, List, Literal, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import ibis.expr.types as ir
+
+# Time dimensions a window can run along: (sortable key dimension, months per period)
+TIME_AXES: Dict[str, Tuple[str, int]] = {
+    "year": ("year", 12),
+    "yearquarter": ("yearquarternumber", 3),
+    "yearmonth": ("yearmonthnumber", 1),
+}
+
+_UNIT_MONTHS = {"year": 12, "quarter": 3, "month": 1}
+
+# Functions whose frame spans a number of units of time
+_SPANNING_FUNCTIONS = ("previous", "change", "growth", "moving_average")
+
+
+class WindowMeasure(BaseModel):
+    """A measure computed with a window function over the aggregated rows.
+
+    `previous`, `change` and `growth` compare with the value `periods` units
+    earlier; `moving_average` averages over the last `periods` units;
+    `running_total` accumulates along the time axis; `percent_of_total` is the
+    share in the total of the time period, or of the whole result if the query
+    has no other dimensions.
+    """
+
+    measure: str
+    function: Literal[
+        "previous", "change", "growth", "running_total", "moving_average", "percent_of_total"
+    ]
+    unit: Literal["year", "quarter", "month"] = "month"
+    periods: int = 1
+
+    @property
+    def needs_time_axis(self) -> bool:
+        return self.function != "percent_of_total"
+
+
+def time_axis(dimensions: Sequence[str]) -> Optional[str]:
+    """Finest dimension of the query that windows can run along."""
+    axes = [d for d in dimensions if d in TIME_AXES]
+    return min(axes, key=lambda d: TIME_AXES[d][1]) if axes else None
+
+
+def _axis_periods(name: str, window: WindowMeasure, axis: str) -> int:
+    """Number of periods of the time axis the window's unit spans."""
+    months = _UNIT_MONTHS[window.unit] * window.periods
+    axis_months = TIME_AXES[axis][1]
+    if months % axis_months:
+        finer = [d for d, (_, m) in TIME_AXES.items() if months % m == 0]
+        raise ValueError(
+            f"Measure {name} needs a time dimension of {window.unit} grain or "
+            f"finer: {', '.join(finer)}"
+        )
+    return months // axis_months
+
+
+def window_columns(
+    windows: Dict[str, WindowMeasure], dimensions: Sequence[str]
+) -> Tuple[List[str], List[str]]:
+    """Extra (dimensions, measures) the aggregate needs to compute the windows."""
+    axis = time_axis(dimensions)
+    for name, window in windows.items():
+        if window.needs_time_axis and axis is None:
+            raise ValueError(
+                f"Measure {name} needs one of the time dimensions: {', '.join(TIME_AXES)}"
+            )
+        if window.function in _SPANNING_FUNCTIONS:
+            _axis_periods(name, window, axis)
+
+    extra_dimensions = []
+    if axis is not None and TIME_AXES[axis][0] not in dimensions:
+        extra_dimensions.append(TIME_AXES[axis][0])
+    measures = list(dict.fromkeys(window.measure for window in windows.values()))
+    return extra_dimensions, measures
+
+
+def apply_window_measures(
+    table: ir.Table, windows: Dict[str, WindowMeasure], dimensions: Sequence[str]
+) -> ir.Table:
+    """Add the window measures to an aggregated table with `dimensions` as its grain."""
+    import ibis
+
+    axis = time_axis(dimensions)
+    key = TIME_AXES[axis][0] if axis else None
+    # Coarser time axes are implied by the finest one, e.g. year by yearmonth
+    partition = [d for d in dimensions if d not in TIME_AXES and d != key]
+
+    columns = {}
+    for name, window in windows.items():
+        value = table[window.measure]
+        if window.function == "percent_of_total":
+            # Shares within each period, unless the period is the only grouping
+            group_by = [axis] if axis and partition else []
+            columns[name] = value / value.sum().over(ibis.window(group_by=group_by))
+            continue
+
+        if window.function == "running_total":
+            columns[name] = value.sum().over(
+                ibis.cumulative_window(group_by=partition, order_by=key)
+            )
+            continue
+
+        periods = _axis_periods(name, window, axis)
+        if window.function == "moving_average":
+            columns[name] = value.mean().over(
+                ibis.window(group_by=partition, order_by=key, range=(-(periods - 1), 0))
+            )
+        else:
+            previous = value.max().over(
+                ibis.window(group_by=partition, order_by=key, range=(-periods, -periods))
+            )
+            if window.function == "previous":
+                columns[name] = previous
+            elif window.function == "change":
+                columns[name] = value - previous
+            else:
+                columns[name] = (value - previous) / previous.nullif(0)
+    return table.mutate(**columns)
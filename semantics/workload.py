@@ -0,0 +1,285 @@
+"""Workload log of frequent query requests, replayed to warm up new runtimes.
+
+After a pipeline run every server switches to a new runtime (see
+`semantics.reload`) whose plan cache is empty and whose DuckDB buffers hold
+none of the new data, so the first dashboards of the day would see the worst
+latencies. The servers therefore count the query requests they ran
+successfully, normalized with `semantics.result_cache.request_key` so that filter order
+does not matter, and merge the counts into a small JSON log shared by all
+processes every `FLUSH_INTERVAL` seconds. The log keeps the
+`WORKLOAD_LOG_SIZE` most frequent requests seen within `WORKLOAD_RETENTION`.
+
+`replay_workload` runs the most frequent requests on a new runtime in the
+background, before it takes traffic. It stops after `WARMUP_QUERIES`
+requests, when the wall-clock budget is used up (interrupting the running
+query) or when the process used up the CPU budget; rejected and failing
+requests are skipped.
+
+Usage:
+    python -m semantics.workload              # show the logged workload
+    python -m semantics.workload --replay     # replay it and report the timings
+"""
+
+from __future__ import annotations
+
+from constants import (
+    CACHE_DIR,
+    PIPELINE_NAME,
+    WARMUP_CPU_SECONDS,
+    WARMUP_QUERIES,
+    WARMUP_SECONDS,
+    WORKLOAD_LOG_SIZE,
+)
+from semantics.model_cache import write_atomic
+from semantics.query_builder import QueryRequest
+from semantics.result_cache import request_key
+from contextlib import contextmanager
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Dict, List, Literal, Tuple
+import argparse
+import fcntl
+import logging
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+    from semantics.runtime import SemanticRuntime
+
+logger = logging.getLogger(__name__)
+
+# Seconds between merges of a process's counts into the shared log
+FLUSH_INTERVAL = 60
+# Seconds a request stays in the log after it was last seen
+WORKLOAD_RETENTION = 7 * 24 * 3600
+
+
+class WorkloadEntry(BaseModel):
+    request: QueryRequest
+    count: int
+    last_seen: float
+
+
+class WorkloadFile(BaseModel):
+    entries: List[WorkloadEntry] = []
+
+
+class WarmupReport(BaseModel):
+    generation: str
+    queries: int
+    skipped: int
+    seconds: float
+    cpu_seconds: float
+    stopped: Literal["done", "time", "cpu"]
+
+    def format(self) -> str:
+        return (
+            f"Replayed {self.queries} logged queries ({self.skipped} skipped) on "
+            f"{self.generation} in {self.seconds:.2f}s, {self.cpu_seconds:.2f}s CPU"
+            + ("" if self.stopped == "done" else f"; stopped at the {self.stopped} budget")
+        )
+
+
+def workload_path(pipeline_name: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{pipeline_name}.workload.json")
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Inter-process lock so concurrent flushes never lose each other's counts."""
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read(path: str) -> Dict[str, WorkloadEntry]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            workload = WorkloadFile.model_validate_json(f.read())
+    except (OSError, ValueError):
+        return {}
+    return {request_key(entry.request): entry for entry in workload.entries}
+
+
+def _merge(entries: Dict[str, WorkloadEntry], other: Dict[str, WorkloadEntry]) -> None:
+    for key, entry in other.items():
+        existing = entries.get(key)
+        if existing is None:
+            entries[key] = entry.model_copy()
+        else:
+            existing.count += entry.count
+            existing.last_seen = max(existing.last_seen, entry.last_seen)
+
+
+def _most_frequent(entries: Dict[str, WorkloadEntry], limit: int) -> List[WorkloadEntry]:
+    return sorted(entries.values(), key=lambda e: (-e.count, -e.last_seen))[:limit]
+
+
+class WorkloadLog:
+    """Counts of the query requests of this process, merged into the shared log.
+
+    Args:
+        pipeline_name: Pipeline whose log is written.
+        cache_dir: Directory of the log file.
+        max_entries: Requests kept in the log; 0 records nothing.
+        flush_interval: Seconds between merges into the log file.
+    """
+
+    def __init__(
+        self,
+        pipeline_name: str = PIPELINE_NAME,
+        cache_dir: str = CACHE_DIR,
+        max_entries: int = WORKLOAD_LOG_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.path = workload_path(pipeline_name, cache_dir)
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, WorkloadEntry] = {}
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, query_request: QueryRequest) -> None:
+        if self.max_entries <= 0:
+            return
+        key = request_key(query_request)
+        now = time.time()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = WorkloadEntry(
+                    request=query_request.model_copy(deep=True), count=1, last_seen=now
+                )
+            else:
+                entry.count += 1
+                entry.last_seen = now
+            due = time.monotonic() - self._flushed >= self.flush_interval
+            if due:
+                self._flushed = time.monotonic()
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Merge the counts recorded since the last flush into the log file."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed = time.monotonic()
+        if not pending:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with _file_lock(self.path):
+                entries = _read(self.path)
+                _merge(entries, pending)
+                cutoff = time.time() - WORKLOAD_RETENTION
+                kept = _most_frequent(
+                    {k: e for k, e in entries.items() if e.last_seen >= cutoff},
+                    self.max_entries,
+                )
+                write_atomic(self.path, WorkloadFile(entries=kept).model_dump_json())
+        except OSError:
+            # The log is an optimization; queries never fail because of it
+            logger.warning("Writing the workload log %s failed", self.path, exc_info=True)
+
+    def top(self, limit: int) -> List[WorkloadEntry]:
+        """The most frequent requests of the log and of this process."""
+        entries = _read(self.path)
+        with self._lock:
+            _merge(entries, self._pending)
+        return _most_frequent(entries, limit)
+
+
+_logs: Dict[Tuple[str, str], WorkloadLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_workload_log(
+    pipeline_name: str = PIPELINE_NAME, cache_dir: str = CACHE_DIR
+) -> WorkloadLog:
+    """The process-wide log of a pipeline, shared by the runtimes of every generation."""
+    with _logs_lock:
+        log = _logs.get((pipeline_name, cache_dir))
+        if log is None:
+            log = _logs[(pipeline_name, cache_dir)] = WorkloadLog(pipeline_name, cache_dir)
+        return log
+
+
+def replay_workload(
+    runtime: SemanticRuntime,
+    max_queries: int = WARMUP_QUERIES,
+    seconds: float = WARMUP_SECONDS,
+    cpu_seconds: float = WARMUP_CPU_SECONDS,
+) -> WarmupReport:
+    """Run the most frequent logged requests on `runtime` within the budgets.
+
+    Plans are compiled into the runtime's plan cache, and the data the
+    requests read is pulled into DuckDB's buffers. The requests are not
+    recorded again. CPU time is measured for the whole process, so traffic
+    served meanwhile counts against the budget.
+    """
+    from semantics.execution import QueryInterruptedError
+
+    start, cpu_start = time.perf_counter(), time.process_time()
+    queries = skipped = 0
+    stopped = "done"
+    entries = runtime.workload.top(max_queries) if max_queries > 0 else []
+    for entry in entries:
+        if time.process_time() - cpu_start >= cpu_seconds:
+            stopped = "cpu"
+            break
+        try:
+            admission = runtime.admit(entry.request)
+            sql, parameters = runtime.plans.compile(admission.query)
+        except ValueError:
+            # Rejected, or no longer valid for the new model
+            skipped += 1
+            continue
+        remaining = seconds - (time.perf_counter() - start)
+        if remaining <= 0:
+            stopped = "time"
+            break
+        running = runtime.executor.start()
+        timer = threading.Timer(remaining, running.interrupt)
+        timer.start()
+        try:
+            running.execute(sql, parameters)
+            queries += 1
+        except QueryInterruptedError:
+            stopped = "time"
+            break
+        except Exception:
+            logger.warning("Replaying a logged query failed", exc_info=True)
+            skipped += 1
+        finally:
+            timer.cancel()
+
+    return WarmupReport(
+        generation=runtime.generation,
+        queries=queries,
+        skipped=skipped,
+        seconds=time.perf_counter() - start,
+        cpu_seconds=time.process_time() - cpu_start,
+        stopped=stopped,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-n", "--queries", default=WARMUP_QUERIES, type=int)
+    parser.add_argument("--replay", action="store_true")
+    args = parser.parse_args()
+
+    pipeline_name = args.pipeline if args.pipeline else PIPELINE_NAME
+    if args.replay:
+        from semantics.runtime import SemanticRuntime
+
+        runtime = SemanticRuntime(pipeline_name)
+        print(replay_workload(runtime, args.queries).format())
+        runtime.close()
+    else:
+        for entry in get_workload_log(pipeline_name).top(args.queries):
+            print(f"{entry.count:>8}  {request_key(entry.request)}")
@@ -0,0 +1,127 @@
+"""A small Contoso-shaped DuckDB database and the semantic model built on it.
+
+Two years of dates, 24 customers in four countries, 12 products of three
+brands, 4 stores and 150 orders with one to three lines each, so every
+dimension has several values and the stars of all three fact tables join.
+"""
+
+import pytest
+
+FIXTURE_SQL = """
+CREATE TABLE dim_date AS
+SELECT
+    d::DATE AS date,
+    year(d) AS year,
+    'Q' || quarter(d) AS quarter,
+    'Q' || quarter(d) || '-' || year(d) AS year_quarter,
+    year(d) * 4 + quarter(d) AS year_quarter_number,
+    strftime(d, '%B %Y') AS year_month,
+    year(d) * 12 + month(d) AS year_month_number,
+    strftime(d, '%B') AS month,
+    strftime(d, '%A') AS dayof_week,
+    (isodow(d) < 6)::INTEGER AS working_day
+FROM range(DATE '2019-01-01', DATE '2021-01-01', INTERVAL 1 DAY) t(d);
+
+CREATE TABLE dim_customer AS
+SELECT
+    i AS customer_key,
+    'Surname' || (i % 7) AS surname,
+    CASE WHEN i % 2 = 0 THEN 'female' ELSE 'male' END AS gender,
+    CASE WHEN i % 4 = 3 THEN 'North America' ELSE 'Europe' END AS continent,
+    ['Germany', 'France', 'Italy', 'Canada'][i % 4 + 1] AS country_full,
+    'City' || (i % 5) AS city,
+    'State' || (i % 3) AS state,
+    'Company' || (i % 2) AS company,
+    'Vehicle' || (i % 3) AS vehicle,
+    20 + i AS age,
+    DATE '1980-01-01' + i::INTEGER AS birthday,
+    'Occupation' || (i % 4) AS occupation
+FROM range(1, 25) t(i);
+
+CREATE TABLE dim_product AS
+SELECT
+    i AS product_key,
+    'Product' || i AS product_name,
+    'Manufacturer' || (i % 3) AS manufacturer,
+    ['Contoso', 'Fabrikam', 'Litware'][i % 3 + 1] AS brand,
+    ['Black', 'White'][i % 2 + 1] AS color,
+    1.5 * i AS weight,
+    5.0 + i AS cost,
+    12.0 + 2 * i AS price,
+    ['Audio', 'Computers', 'Cameras', 'Phones'][i % 4 + 1] AS category_name,
+    'Subcategory' || (i % 6) AS sub_category_name
+FROM range(1, 13) t(i);
+
+CREATE TABLE dim_store AS
+SELECT
+    i AS store_key,
+    i * 10 AS store_code,
+    ['DE', 'FR', 'IT', 'CA'][i] AS country_code,
+    ['Germany', 'France', 'Italy', 'Canada'][i] AS country_name,
+    'StoreState' || i AS state,
+    DATE '2010-01-01' + i::INTEGER AS open_date,
+    NULL::DATE AS close_date,
+    1000.0 + 100 * i AS square_meters,
+    NULL::VARCHAR AS status
+FROM range(1, 5) t(i);
+
+CREATE TABLE orders AS
+SELECT
+    i AS order_key,
+    (i * 7) % 24 + 1 AS customer_key,
+    i % 4 + 1 AS store_key,
+    DATE '2019-01-01' + ((i * 5) % 730)::INTEGER AS order_date,
+    DATE '2019-01-01' + ((i * 5) % 730 + i % 4)::INTEGER AS delivery_date
+FROM range(1, 151) t(i);
+
+CREATE TABLE fact_sales AS
+SELECT
+    o.order_key,
+    l AS line_number,
+    o.order_date,
+    o.delivery_date,
+    o.customer_key,
+    o.store_key,
+    (o.order_key * 5 + l) % 12 + 1 AS product_key,
+    (o.order_key + l) % 4 + 1 AS quantity,
+    10.0 + (o.order_key * 3 + l) % 50 AS unit_price,
+    9.0 + (o.order_key * 3 + l) % 50 AS net_price,
+    4.0 + (o.order_key + l) % 20 AS unit_cost,
+    'EUR' AS currency_code,
+    1.0 AS exchange_rate
+FROM orders o, range(0, 3) t(l)
+WHERE l <= o.order_key % 3;
+
+CREATE TABLE orderrows AS
+SELECT order_key, line_number, product_key, quantity, unit_price, net_price
+FROM fact_sales;
+"""
+
+
+@pytest.fixture(scope="session")
+def con():
+    """Ibis connection to the fixture database."""
+    import ibis
+
+    connection = ibis.duckdb.connect()
+    connection.con.execute(FIXTURE_SQL)
+    yield connection
+    connection.disconnect()
+
+
+@pytest.fixture(scope="session")
+def model(con):
+    from semantics.model import build_semantic_model
+
+    return build_semantic_model({name: con.table(name) for name in con.list_tables()})
+
+
+@pytest.fixture
+def run(con):
+    """Run SQL on the fixture database, returning a DataFrame sorted by all columns."""
+
+    def _run(sql, parameters=None):
+        df = con.con.execute(sql, parameters).df()
+        return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+    return _run
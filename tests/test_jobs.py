@@ -0,0 +1,77 @@
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from semantics.execution import QueryExecutor
+from semantics.jobs import read_result_range
+
+ROWS = 25
+ROW_GROUP_ROWS = 10
+
+
+@pytest.fixture
+def result_path(tmp_path):
+    """A result of 25 rows in row groups of 10, 10 and 5 rows."""
+    path = str(tmp_path / "result.parquet")
+    pq.write_table(pa.table({"row": range(ROWS)}), path, row_group_size=ROW_GROUP_ROWS)
+    assert pq.ParquetFile(path).metadata.num_row_groups == 3
+    return path
+
+
+@pytest.mark.parametrize(
+    "offset, limit",
+    [
+        (0, 10),  # exactly the first row group
+        (0, ROWS),
+        (5, 10),  # across the first row group edge
+        (9, 2),
+        (10, 10),  # exactly the second row group
+        (19, 3),
+        (8, 15),  # three row groups
+        (20, 10),  # past the end
+        (24, 1),
+        (25, 5),
+        (40, 5),
+        (3, 0),
+    ],
+)
+def test_read_result_range(result_path, offset, limit):
+    rows = read_result_range(result_path, offset, limit).column("row").to_pylist()
+    assert rows == list(range(ROWS))[offset : offset + limit]
+
+
+def test_read_result_range_keeps_the_schema_of_empty_ranges(result_path):
+    table = read_result_range(result_path, ROWS, 10)
+    assert table.num_rows == 0
+    assert table.schema == pq.read_schema(result_path)
+
+
+@pytest.fixture(scope="module")
+def executor(tmp_path_factory):
+    database = str(tmp_path_factory.mktemp("jobs") / "empty.duckdb")
+    duckdb.connect(database).close()
+    executor = QueryExecutor(database)
+    yield executor
+    executor.close()
+
+
+@pytest.mark.parametrize("offset", [0, 3, 10, 15, 24, 25, 40])
+def test_write_parquet_skips_offset_rows(executor, tmp_path, offset):
+    path = str(tmp_path / "job.parquet")
+    rows = executor.start().write_parquet(
+        f"SELECT range AS row FROM range({ROWS}) ORDER BY row",
+        path,
+        batch_rows=ROW_GROUP_ROWS,
+        offset=offset,
+    )
+    expected = list(range(ROWS))[offset:]
+    assert rows == len(expected)
+    assert read_result_range(path, 0, ROWS).column("row").to_pylist() == expected
+    # Ranges of the written result cross the row groups of the streamed batches
+    assert read_result_range(path, 4, 8).column("row").to_pylist() == expected[4:12]
+    metadata = pq.ParquetFile(path).metadata
+    assert all(
+        metadata.row_group(i).num_rows <= ROW_GROUP_ROWS
+        for i in range(metadata.num_row_groups)
+    )
@@ -0,0 +1,220 @@
+import pandas as pd
+import pytest
+
+from semantics.execution import compile_query
+from semantics.plan_cache import PlanCache, compile_plan, query_shape
+from semantics.query_builder import (
+    FilterCondition,
+    QueryRequest,
+    TimeDimension,
+    TopNPer,
+    build_semantic_query,
+)
+
+
+def _by_country(country: str, **kwargs) -> QueryRequest:
+    return QueryRequest(
+        measures=["netRevenue"],
+        dimensions=["year"],
+        filters=[FilterCondition(field="country", value=country)],
+        **kwargs,
+    )
+
+
+REQUESTS = [
+    _by_country("Germany"),
+    _by_country("Nowhere"),
+    QueryRequest(
+        measures=["netRevenue", "totalUnitsSold"],
+        dimensions=["categoryname"],
+        filters=[
+            FilterCondition(field="price", operator=">", value="20"),
+            FilterCondition(field="brand", operator="contains", value="Con"),
+            FilterCondition(field="gender", operator="!=", value="male"),
+        ],
+    ),
+    QueryRequest(
+        measures=["netRevenue"],
+        dimensions=["yearmonth"],
+        timeDimensions=[
+            TimeDimension(
+                dimension="orderdate",
+                granularity="day",
+                dateRange=["2019-03-01", "2019-06-30"],
+            )
+        ],
+    ),
+    # Drill-across: the filter applies to the stars of both fact tables
+    QueryRequest(
+        measures=["netRevenue", "ordersPlaced"],
+        dimensions=["year"],
+        filters=[FilterCondition(field="continent", value="Europe")],
+    ),
+    QueryRequest(
+        measures=["netRevenue"],
+        dimensions=["continent", "brand"],
+        filters=[FilterCondition(field="year", value="2020")],
+        top_n_per=TopNPer(n=1, dimensions=["continent"], measure="netRevenue"),
+    ),
+]
+
+
+@pytest.mark.parametrize("query_request", REQUESTS)
+def test_bound_plan_matches_literal_query(model, run, query_request):
+    plan = compile_plan(model, query_request)
+    assert "__vero_param_" not in plan.sql
+
+    expected = run(compile_query(build_semantic_query(model, query_request)))
+    assert not expected.empty or query_request.filters[0].value == "Nowhere"
+    pd.testing.assert_frame_equal(run(plan.sql, plan.bind(query_request)), expected)
+
+
+def test_plan_is_reused_for_other_values(model, run):
+    cache = PlanCache(model)
+    for country in ["Germany", "France", "Italy"]:
+        query_request = _by_country(country)
+        sql, parameters = cache.compile(query_request)
+        assert parameters == [country]
+        expected = run(compile_query(build_semantic_query(model, query_request)))
+        pd.testing.assert_frame_equal(run(sql, parameters), expected)
+    assert (cache.hits, cache.misses, len(cache)) == (2, 1, 1)
+
+
+def test_query_shape_ignores_values_only():
+    shape = query_shape(_by_country("Germany"))
+    assert shape == query_shape(_by_country("France"))
+    assert shape != query_shape(
+        QueryRequest(
+            measures=["netRevenue"],
+            dimensions=["year"],
+            filters=[FilterCondition(field="country", operator="!=", value="Germany")],
+        )
+    )
+    assert shape != query_shape(_by_country("Germany", limit=10))
+    assert shape != query_shape(_by_country("Germany", currency="EUR"))
+
+    def _since(value: str) -> QueryRequest:
+        return QueryRequest(
+            measures=["netRevenue"],
+            filters=[FilterCondition(field="orderdate", operator=">=", value=value)],
+        )
+
+    # Date values may prune partitions, so they get a plan of their own
+    assert query_shape(_since("2019-01-01")) == query_shape(_since("2020-06-30"))
+    assert query_shape(_since("2019-01-01")) != query_shape(_since("x"))
+
+
+def test_semi_join_repeats_the_filter_parameter(model, run):
+    plan = compile_plan(model, _by_country("Germany"), reduced_dimensions={"country"})
+    # The dimension filter and the key subquery bind the same value
+    assert plan.parameters == [0]
+    assert plan.sql.count("$1") >= 2
+    assert "$2" not in plan.sql
+
+    for country in ["Germany", "Canada", "Nowhere"]:
+        query_request = _by_country(country)
+        expected = run(compile_query(build_semantic_query(model, query_request)))
+        pd.testing.assert_frame_equal(run(plan.sql, plan.bind(query_request)), expected)
+
+
+def test_drill_across_semi_join_binds_every_star(model, run):
+    query_request = QueryRequest(
+        measures=["netRevenue", "ordersPlaced"],
+        dimensions=["year"],
+        filters=[
+            FilterCondition(field="country", value="France"),
+            FilterCondition(field="gender", operator="!=", value="male"),
+        ],
+    )
+    plan = compile_plan(model, query_request, reduced_dimensions={"country"})
+    assert sorted(plan.parameters) == [0, 1]
+    assert plan.bind(query_request) == [
+        query_request.filters[i].value for i in plan.parameters
+    ]
+    expected = run(compile_query(build_semantic_query(model, query_request)))
+    pd.testing.assert_frame_equal(run(plan.sql, plan.bind(query_request)), expected)
+
+
+def test_ignored_date_range_binds_no_parameter(model):
+    query_request = _by_country(
+        "Germany",
+        timeDimensions=[
+            TimeDimension(
+                dimension="shipdate",
+                granularity="day",
+                dateRange=["2019-01-01", "2019-12-31"],
+            )
+        ],
+    )
+    plan = compile_plan(model, query_request)
+    assert plan.parameters == [0]
+    assert plan.bind(query_request) == ["Germany"]
+
+
+def test_drill_across_merges_fact_tables(model, run):
+    query_request = QueryRequest(
+        measures=["netRevenue", "ordersPlaced", "orderLines"],
+        dimensions=["year"],
+        filters=[FilterCondition(field="country", value="Germany")],
+    )
+    sql, parameters = PlanCache(model).compile(query_request)
+    result = run(sql, parameters)
+
+    # Each fact table aggregated on its own, so none is fanned out by another
+    expected = run(
+        """
+        WITH german_orders AS (
+            SELECT o.order_key, d.year
+            FROM orders o
+            JOIN dim_customer c USING (customer_key)
+            JOIN dim_date d ON o.order_date = d.date
+            WHERE c.country_full = 'Germany'
+        )
+        SELECT
+            year,
+            (SELECT sum(f.net_price) FROM fact_sales f
+             JOIN german_orders g USING (order_key) WHERE g.year = y.year) AS netRevenue,
+            (SELECT count(*) FROM german_orders g WHERE g.year = y.year) AS ordersPlaced,
+            (SELECT count(*) FROM orderrows r
+             JOIN german_orders g USING (order_key) WHERE g.year = y.year) AS orderLines
+        FROM (SELECT DISTINCT year FROM german_orders) y
+        """
+    )
+    assert list(result.columns) == ["year", "netRevenue", "ordersPlaced", "orderLines"]
+    assert result["year"].tolist() == expected["year"].tolist()
+    for measure in ["netRevenue", "ordersPlaced", "orderLines"]:
+        assert result[measure].astype(float).tolist() == pytest.approx(
+            expected[measure].astype(float).tolist()
+        )
+
+
+@pytest.mark.parametrize("n, direction", [(1, "desc"), (2, "desc"), (1, "asc")])
+def test_top_n_per_keeps_the_best_rows_of_each_group(model, run, n, direction):
+    base = QueryRequest(
+        measures=["netRevenue"],
+        dimensions=["continent", "brand"],
+        filters=[FilterCondition(field="gender", value="female")],
+        limit=None,
+    )
+    query_request = base.model_copy(
+        update={
+            "top_n_per": TopNPer(
+                n=n, dimensions=["continent"], measure="netRevenue", direction=direction
+            )
+        }
+    )
+    sql, parameters = PlanCache(model).compile(query_request)
+    result = run(sql, parameters)
+
+    full = run(*PlanCache(model).compile(base))
+    expected = (
+        full.sort_values(
+            ["continent", "netRevenue", "brand"],
+            ascending=[True, direction == "asc", True],
+        )
+        .groupby("continent")
+        .head(n)
+    )
+    expected = expected.sort_values(list(expected.columns)).reset_index(drop=True)
+    assert len(result) == full["continent"].nunique() * n
+    pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,394 @@
+"""Bulk load of the PostgreSQL warehouse from the loaded DuckDB database.
+
+dlt loads the CSV sources into DuckDB, where the data-quality checks run and
+the exchange rates are materialized. With `STORAGE_BACKEND = "postgres"` this
+stage then copies every loaded table into the warehouse the servers query:
+  - DuckDB's postgres extension attaches the warehouse and writes each table
+    with a binary `COPY ... FROM STDIN`, streaming the rows without any CSV
+    or Python round trip;
+  - `WAREHOUSE_LOAD_WORKERS` tables are copied in parallel, each on its own
+    connection, into a staging schema `<dataset>__load`; the fact tables are
+    written in the order of `LAYOUT_SORT_KEYS`;
+  - primary keys, indexes on the foreign key columns of
+    `semantics.table_references` and on the first sort key are only created
+    once the data is in, with one sorted build per index instead of index
+    maintenance on every copied row, followed by ANALYZE;
+  - the staging schema replaces the dataset's schema in one transaction, so
+    readers switch from the previous load to the new one atomically.
+
+The benchmark copies the same tables into a fresh DuckDB file and the
+warehouse, then runs the same semantic queries on both executors.
+
+Usage:
+    python warehouse.py                       # load the pipeline's database
+    python warehouse.py -d path/to/db.duckdb
+    python warehouse.py --benchmark           # compare load and query latency with DuckDB
+"""
+
+from constants import (
+    DATASET_NAME,
+    LAYOUT_SORT_KEYS,
+    PIPELINE_NAME,
+    POSTGRES_URL,
+    WAREHOUSE_LOAD_WORKERS,
+)
+from semantics.table_references import get_semantic_table_references
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import duckdb
+
+# Catalog names of the loaded DuckDB database and the warehouse in DuckDB
+SOURCE = "source"
+WAREHOUSE = "warehouse"
+
+
+class TableLoad(BaseModel):
+    table: str
+    rows: int
+    seconds: float
+
+
+class WarehouseReport(BaseModel):
+    schema_name: str
+    loads: List[TableLoad]
+    indexes: List[str]
+    warnings: List[str] = []
+    copy_seconds: float
+    index_seconds: float
+    seconds: float
+
+    @property
+    def rows(self) -> int:
+        return sum(load.rows for load in self.loads)
+
+    def format(self) -> str:
+        lines = [
+            f"Warehouse load: {len(self.loads)} tables, {self.rows:,} rows into "
+            f"{self.schema_name} in {self.seconds:.2f}s (copy {self.copy_seconds:.2f}s, "
+            f"indexes {self.index_seconds:.2f}s)"
+        ]
+        for load in sorted(self.loads, key=lambda load: -load.seconds):
+            lines.append(f"  - {load.table}: {load.rows:,} rows in {load.seconds:.2f}s")
+        lines.append(f"  - {len(self.indexes)} indexes: {', '.join(self.indexes)}")
+        lines += [f"  - WARNING {warning}" for warning in self.warnings]
+        return "\n".join(lines)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def attach_warehouse(connection: duckdb.DuckDBPyConnection, url: str = POSTGRES_URL) -> None:
+    connection.execute("INSTALL postgres")
+    connection.execute("LOAD postgres")
+    connection.execute(f"ATTACH {_literal(url)} AS {WAREHOUSE} (TYPE postgres)")
+
+
+def _postgres_execute(connection: duckdb.DuckDBPyConnection, sql: str) -> None:
+    """Run SQL in Postgres itself, e.g. DDL that DuckDB cannot express."""
+    connection.execute(f"CALL postgres_execute('{WAREHOUSE}', {_literal(sql)})")
+    # DuckDB caches the warehouse catalog; DDL run behind its back invalidates it
+    connection.execute("CALL pg_clear_cache()")
+
+
+def _source_tables(
+    connection: duckdb.DuckDBPyConnection, dataset_name: str
+) -> Dict[str, Dict[str, str]]:
+    """Column types of the loaded tables, largest table first."""
+    rows = connection.execute(
+        """
+        SELECT c.table_name, c.column_name, c.data_type
+        FROM duckdb_columns() AS c
+        JOIN duckdb_tables() AS t USING (database_name, schema_name, table_name)
+        WHERE c.database_name = ? AND c.schema_name = ?
+            AND NOT starts_with(c.table_name, '_dlt')
+        ORDER BY t.estimated_size DESC, c.table_name, c.column_index
+        """,
+        [SOURCE, dataset_name],
+    ).fetchall()
+    tables: Dict[str, Dict[str, str]] = {}
+    for table_name, column_name, data_type in rows:
+        tables.setdefault(table_name, {})[column_name] = data_type
+    return tables
+
+
+def _connect_source(database: str) -> duckdb.DuckDBPyConnection:
+    """In-memory DuckDB with the loaded database attached read-only as `SOURCE`."""
+    connection = duckdb.connect()
+    connection.execute(f"ATTACH {_literal(database)} AS {SOURCE} (READ_ONLY)")
+    return connection
+
+
+def _copy_table(
+    connection: duckdb.DuckDBPyConnection,
+    source: str,
+    target: str,
+    table_name: str,
+    columns: Dict[str, str],
+) -> TableLoad:
+    """Copy one table on its own cursor, i.e. its own connection to the target."""
+    start = time.perf_counter()
+    # ENUM columns of an optimized layout are plain text in the target
+    select = ", ".join(
+        f"CAST({_quote(c)} AS VARCHAR) AS {_quote(c)}" if t.startswith("ENUM") else _quote(c)
+        for c, t in columns.items()
+    )
+    sort_keys = [c for c in LAYOUT_SORT_KEYS.get(table_name, []) if c in columns]
+    order = f" ORDER BY {', '.join(map(_quote, sort_keys))}" if sort_keys else ""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            f"CREATE TABLE {target}.{_quote(table_name)} AS "
+            f"SELECT {select} FROM {source}.{_quote(table_name)}{order}"
+        )
+        rows = cursor.execute(
+            f"SELECT COUNT(*) FROM {source}.{_quote(table_name)}"
+        ).fetchone()[0]
+    finally:
+        cursor.close()
+    return TableLoad(table=table_name, rows=rows, seconds=time.perf_counter() - start)
+
+
+def _index_columns(
+    table_name: str, columns: Dict[str, str], references: Dict[str, List[Dict]]
+) -> List[List[str]]:
+    """Columns of the secondary indexes of a table: foreign keys and first sort key."""
+    indexes = [reference["columns"] for reference in references.get(table_name, [])]
+    sort_keys = LAYOUT_SORT_KEYS.get(table_name)
+    if sort_keys:
+        indexes.append(sort_keys[:1])
+    unique = []
+    for index in indexes:
+        if index not in unique and all(c in columns for c in index):
+            unique.append(index)
+    return unique
+
+
+def _create_indexes(
+    connection: duckdb.DuckDBPyConnection,
+    schema_name: str,
+    table_name: str,
+    columns: Dict[str, str],
+    primary_key: List[str],
+    references: Dict[str, List[Dict]],
+) -> Tuple[List[str], List[str]]:
+    """Primary key and secondary indexes of one loaded table, then ANALYZE."""
+    cursor = connection.cursor()
+    table = f"{_quote(schema_name)}.{_quote(table_name)}"
+    created, warnings = [], []
+    try:
+        key = [c for c in primary_key if c in columns]
+        if key:
+            try:
+                _postgres_execute(
+                    cursor, f"ALTER TABLE {table} ADD PRIMARY KEY ({', '.join(map(_quote, key))})"
+                )
+                created.append(f"{table_name}({', '.join(key)}) PRIMARY KEY")
+            except duckdb.Error as e:
+                # Duplicate or NULL keys, which the data-quality report lists
+                warnings.append(f"no primary key on {table_name}({', '.join(key)}): {e}")
+        for index in _index_columns(table_name, columns, references):
+            if index == key[: len(index)]:
+                # Covered by the primary key index
+                continue
+            name = _quote(f"{table_name}_{'_'.join(index)}_idx")
+            _postgres_execute(
+                cursor, f"CREATE INDEX {name} ON {table} ({', '.join(map(_quote, index))})"
+            )
+            created.append(f"{table_name}({', '.join(index)})")
+        _postgres_execute(cursor, f"ANALYZE {table}")
+    finally:
+        cursor.close()
+    return created, warnings
+
+
+def load_warehouse(
+    database: str,
+    primary_keys: Dict[str, List[str]],
+    dataset_name: str = DATASET_NAME,
+    url: str = POSTGRES_URL,
+    workers: int = WAREHOUSE_LOAD_WORKERS,
+) -> WarehouseReport:
+    """Copy the loaded tables of a DuckDB database into the PostgreSQL warehouse."""
+    start = time.perf_counter()
+    staging = f"{dataset_name}__load"
+    references = get_semantic_table_references()
+
+    with _connect_source(database) as connection:
+        attach_warehouse(connection, url)
+        tables = _source_tables(connection, dataset_name)
+        source = f"{SOURCE}.{_quote(dataset_name)}"
+        target = f"{WAREHOUSE}.{_quote(staging)}"
+        _postgres_execute(
+            connection,
+            f"DROP SCHEMA IF EXISTS {_quote(staging)} CASCADE; CREATE SCHEMA {_quote(staging)}",
+        )
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            loads = list(
+                pool.map(
+                    lambda t: _copy_table(connection, source, target, t, tables[t]), tables
+                )
+            )
+            copied = time.perf_counter()
+            results = list(
+                pool.map(
+                    lambda t: _create_indexes(
+                        connection, staging, t, tables[t], primary_keys.get(t, []), references
+                    ),
+                    tables,
+                )
+            )
+        indexed = time.perf_counter()
+
+        # Both statements run in one implicit transaction; queries still
+        # running on the previous load finish before the swap
+        _postgres_execute(
+            connection,
+            f"DROP SCHEMA IF EXISTS {_quote(dataset_name)} CASCADE; "
+            f"ALTER SCHEMA {_quote(staging)} RENAME TO {_quote(dataset_name)}",
+        )
+
+    return WarehouseReport(
+        schema_name=dataset_name,
+        loads=loads,
+        indexes=[index for created, _ in results for index in created],
+        warnings=[warning for _, warnings in results for warning in warnings],
+        copy_seconds=copied - start,
+        index_seconds=indexed - copied,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def _duckdb_load(database: str, dataset_name: str, workers: int) -> float:
+    """Seconds to copy the loaded tables into a fresh DuckDB file, for comparison."""
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        with _connect_source(database) as connection:
+            connection.execute(
+                f"ATTACH {_literal(os.path.join(directory, 'copy.duckdb'))} AS target"
+            )
+            connection.execute(f"CREATE SCHEMA target.{_quote(dataset_name)}")
+            tables = _source_tables(connection, dataset_name)
+            source = f"{SOURCE}.{_quote(dataset_name)}"
+            target = f"target.{_quote(dataset_name)}"
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(
+                    pool.map(
+                        lambda t: _copy_table(connection, source, target, t, tables[t]),
+                        tables,
+                    )
+                )
+            connection.execute("DETACH target")
+        return time.perf_counter() - start
+
+
+def benchmark(
+    database: str,
+    primary_keys: Dict[str, List[str]],
+    pipeline_name: str = PIPELINE_NAME,
+    dataset_name: str = DATASET_NAME,
+    url: str = POSTGRES_URL,
+    repeat: int = 5,
+) -> str:
+    """Load and median query latency of the same data on DuckDB and PostgreSQL."""
+    from semantics.execution import PostgresQueryExecutor, QueryExecutor
+    from semantics.model import create_semantic_model_from_metadata
+    from semantics.model_cache import get_model_metadata
+    from semantics.plan_cache import compile_plan
+    from semantics.query_builder import FilterCondition, QueryRequest, TopNPer
+
+    duckdb_seconds = _duckdb_load(database, dataset_name, WAREHOUSE_LOAD_WORKERS)
+    report = load_warehouse(database, primary_keys, dataset_name, url)
+    lines = [
+        report.format(),
+        f"load: DuckDB {duckdb_seconds:.2f}s, PostgreSQL {report.seconds:.2f}s "
+        f"for {report.rows:,} rows",
+    ]
+
+    requests = {
+        "revenue by year": QueryRequest(
+            measures=["netRevenue", "totalUnitsSold"], dimensions=["year"], limit=None
+        ),
+        "revenue by continent and category": QueryRequest(
+            measures=["netRevenue", "profit"],
+            dimensions=["continent", "categoryname"],
+            limit=None,
+        ),
+        "one country, one year": QueryRequest(
+            measures=["netRevenue", "orderCount"],
+            dimensions=["yearmonth"],
+            filters=[
+                FilterCondition(field="country", value="Germany"),
+                FilterCondition(field="year", value="2018"),
+            ],
+            limit=None,
+        ),
+        "top 3 brands per continent": QueryRequest(
+            measures=["netRevenue"],
+            dimensions=["continent", "brand"],
+            top_n_per=TopNPer(n=3, dimensions=["continent"], measure="netRevenue"),
+            limit=None,
+        ),
+    }
+
+    model = create_semantic_model_from_metadata(get_model_metadata(pipeline_name))
+    executors = [QueryExecutor(database), PostgresQueryExecutor(url)]
+    lines.append(f"{'query':>36}  {'DuckDB':>10}  {'PostgreSQL':>10}")
+    for label, request in requests.items():
+        timings = []
+        for executor in executors:
+            plan = compile_plan(model, request, executor.dialect)
+            parameters = plan.bind(request)
+            executor.start().execute(plan.sql, parameters)
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                executor.start().execute(plan.sql, parameters)
+                samples.append(time.perf_counter() - start)
+            timings.append(statistics.median(samples) * 1000)
+        lines.append(f"{label:>36}  {timings[0]:8.1f}ms  {timings[1]:8.1f}ms")
+    for executor in executors:
+        executor.close()
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import dlt
+    from quality import schema_primary_keys
+    from semantics.execution import staging_database
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pipeline", required=False, type=str)
+    parser.add_argument("-d", "--database", required=False, type=str)
+    parser.add_argument("--url", default=POSTGRES_URL, type=str)
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("-n", "--repeat", default=5, type=int)
+    args = parser.parse_args()
+
+    pipeline = dlt.attach(pipeline_name=args.pipeline if args.pipeline else PIPELINE_NAME)
+    database: Optional[str] = args.database or staging_database(pipeline)
+    primary_keys = schema_primary_keys(pipeline.default_schema)
+    if args.benchmark:
+        print(
+            benchmark(
+                database,
+                primary_keys,
+                pipeline.pipeline_name,
+                pipeline.dataset_name,
+                args.url,
+                args.repeat,
+            )
+        )
+    else:
+        print(load_warehouse(database, primary_keys, pipeline.dataset_name, args.url).format())